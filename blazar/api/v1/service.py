@@ -14,15 +14,27 @@
 # limitations under the License.
 
 from oslo_log import log as logging
+from oslo_utils import strutils
 
 from blazar import context
+from blazar import exceptions
 from blazar.manager import rpcapi as manager_rpcapi
 from blazar import policy
+from blazar.utils import leases as leases_utils
 from blazar.utils import trusts
 
 LOG = logging.getLogger(__name__)
 
 
+def _lease_fields(query):
+    """Pop the fields of the leases to return from the query parameters.
+
+    Return None to get the leases with their reservations and events.
+    """
+    return leases_utils.lease_fields(query.pop('fields', None),
+                                     query.pop('detail', None))
+
+
 class API(object):
 
     def __init__(self):
@@ -31,14 +43,34 @@ class API(object):
     # Leases operations
 
     @policy.authorize('leases', 'get')
-    def get_leases(self):
-        """List all existing leases."""
+    def get_leases(self, query=None):
+        """List existing leases.
+
+        :param query: Pagination parameters (limit, marker, sort_key and
+                      sort_dir), fields to return (fields or detail) and
+                      filters of the leases.
+        :type query: dict
+        """
+        query = dict(query or {})
+        fields = _lease_fields(query)
+        limit = query.pop('limit', None)
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise exceptions.InvalidInput(cls='integer', value=limit)
+
         ctx = context.current()
         if policy.enforce(ctx, 'admin', {}, do_raise=False):
             project_id = None
         else:
             project_id = ctx.project_id
-        return self.manager_rpcapi.list_leases(project_id=project_id)
+        return self.manager_rpcapi.list_leases(
+            project_id=project_id, limit=limit,
+            marker=query.pop('marker', None),
+            sort_key=query.pop('sort_key', None),
+            sort_dir=query.pop('sort_dir', None),
+            filters=query, fields=fields)
 
     @policy.authorize('leases', 'create')
     @trusts.use_trust_auth()
@@ -55,14 +87,44 @@ class API(object):
         data['user_id'] = ctx.user_id
         return self.manager_rpcapi.create_lease(data)
 
+    @policy.authorize('leases', 'create')
+    @trusts.use_trust_auth()
+    def create_leases(self, data):
+        """Create several leases sharing a single trust.
+
+        :param data: New leases characteristics, under the 'leases' key, and
+                     whether they are created all or nothing.
+        :type data: dict
+        """
+        ctx = context.current()
+        leases = data.get('leases')
+        if (not isinstance(leases, list) or not leases or
+                not all(isinstance(lease, dict) for lease in leases)):
+            raise exceptions.InvalidInput(cls='non-empty list of leases',
+                                          value=leases)
+        all_or_nothing = data.get('all_or_nothing', False)
+        try:
+            all_or_nothing = strutils.bool_from_string(all_or_nothing,
+                                                       strict=True)
+        except ValueError:
+            raise exceptions.InvalidInput(cls='boolean', value=all_or_nothing)
+        for lease in leases:
+            lease['trust_id'] = data['trust_id']
+            lease['user_id'] = ctx.user_id
+        return self.manager_rpcapi.create_leases(
+            leases, all_or_nothing=all_or_nothing)
+
     @policy.authorize('leases', 'get')
-    def get_lease(self, lease_id):
+    def get_lease(self, lease_id, query=None):
         """Get lease by its ID.
 
         :param lease_id: ID of the lease in Blazar DB.
         :type lease_id: str
+        :param query: Fields of the lease to return (fields or detail).
+        :type query: dict
         """
-        return self.manager_rpcapi.get_lease(lease_id)
+        fields = _lease_fields(dict(query or {}))
+        return self.manager_rpcapi.get_lease(lease_id, fields=fields)
 
     @policy.authorize('leases', 'update')
     def update_lease(self, lease_id, data):
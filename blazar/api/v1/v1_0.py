@@ -30,8 +30,9 @@ _api = utils.LazyProxy(service.API)
 
 @rest.get('/leases')
 def leases_list():
-    """List all existing leases."""
-    return api_utils.render(leases=_api.get_leases())
+    """List existing leases, filtered, sorted and paginated."""
+    query = api_utils.get_request_args().to_dict()
+    return api_utils.render(leases=_api.get_leases(query))
 
 
 @rest.post('/leases')
@@ -40,11 +41,18 @@ def leases_create(data):
     return api_utils.render(lease=_api.create_lease(data))
 
 
+@rest.post('/leases/bulk')
+def leases_create_bulk(data):
+    """Create several leases at once."""
+    return api_utils.render(leases=_api.create_leases(data))
+
+
 @rest.get('/leases/<lease_id>')
 @validation.check_exists(_api.get_lease, lease_id='lease_id')
 def leases_get(lease_id):
     """Get lease by its ID."""
-    return api_utils.render(lease=_api.get_lease(lease_id))
+    query = api_utils.get_request_args().to_dict()
+    return api_utils.render(lease=_api.get_lease(lease_id, query))
 
 
 @rest.put('/leases/<lease_id>')
@@ -24,6 +24,7 @@ from blazar import exceptions
 from blazar.i18n import _
 from blazar.manager import service
 from blazar import policy
+from blazar.utils import leases as leases_utils
 from blazar.utils import trusts
 
 
@@ -87,29 +88,100 @@ class Lease(base._Base):
                    )
 
 
+class LeaseBulk(base._Base):
+
+    leases = [Lease]
+    "The leases to create"
+
+    all_or_nothing = wtypes.wsattr(bool, default=False)
+    "Whether no lease is created if any of them fails"
+
+    trust_id = types.UuidType(without_dashes=True)
+    "The ID of the trust shared by all the leases"
+
+    @classmethod
+    def sample(cls):
+        return cls(leases=[Lease.sample()], all_or_nothing=False)
+
+
+class LeaseBulkError(wtypes.Base):
+
+    code = int
+    "The HTTP status code of the failure"
+
+    message = wtypes.text
+    "The reason of the failure"
+
+
+class LeaseBulkResult(wtypes.Base):
+
+    lease = Lease
+    "The created lease, if any, only with its ID if the error is later"
+
+    error = LeaseBulkError
+    "The failure of the lease creation or of its scheduling, if any"
+
+    @classmethod
+    def convert(cls, rpc_obj):
+        result = cls()
+        if rpc_obj.get('lease') is not None:
+            result.lease = Lease.convert(rpc_obj['lease'])
+        if rpc_obj.get('error') is not None:
+            result.error = LeaseBulkError(**rpc_obj['error'])
+        return result
+
+
 class LeasesController(extensions.BaseController):
     """Manages operations on leases."""
 
     name = 'leases'
 
+    _custom_actions = {'bulk': ['POST']}
+
     @policy.authorize('leases', 'get')
-    @wsme_pecan.wsexpose(Lease, types.UuidType())
-    def get_one(self, id):
+    @wsme_pecan.wsexpose(Lease, types.UuidType(), wtypes.text, wtypes.text)
+    def get_one(self, id, fields=None, detail=None):
         """Returns the lease having this specific uuid
 
         :param id: ID of lease
+        :param fields: comma separated fields of the lease to return.
+        :param detail: whether to return the reservations and events.
         """
-        lease = pecan.request.rpcapi.get_lease(id)
+        lease = pecan.request.rpcapi.get_lease(
+            id, fields=leases_utils.lease_fields(fields, detail))
         if lease is None:
             raise exceptions.NotFound(object={'lease_id': id})
         return Lease.convert(lease)
 
     @policy.authorize('leases', 'get')
-    @wsme_pecan.wsexpose([Lease], q=[])
-    def get_all(self):
-        """Returns all leases."""
-        return [Lease.convert(lease)
-                for lease in pecan.request.rpcapi.list_leases()]
+    @wsme_pecan.wsexpose([Lease], int, types.UuidType(), wtypes.text,
+                         wtypes.text, wtypes.text, wtypes.text, wtypes.text,
+                         wtypes.text, wtypes.text, wtypes.text, wtypes.text)
+    def get_all(self, limit=None, marker=None, sort_key=None, sort_dir=None,
+                status=None, project_id=None, resource_type=None,
+                start_before=None, end_after=None, fields=None, detail=None):
+        """Returns leases, filtered, sorted and paginated.
+
+        :param limit: maximum number of leases to return.
+        :param marker: ID of the last lease of the previous page.
+        :param sort_key: lease attribute to sort by.
+        :param sort_dir: 'asc' or 'desc'.
+        :param status: status of the leases.
+        :param project_id: project of the leases.
+        :param resource_type: resource type reserved by the leases.
+        :param start_before: the leases starting before this date...
+        :param end_after: ...and ending after this one.
+        :param fields: comma separated fields of the leases to return.
+        :param detail: whether to return the reservations and events.
+        """
+        filters = dict((key, value) for key, value in (
+            ('status', status), ('project_id', project_id),
+            ('resource_type', resource_type), ('start_before', start_before),
+            ('end_after', end_after)) if value is not None)
+        leases = pecan.request.rpcapi.list_leases(
+            limit=limit, marker=marker, sort_key=sort_key, sort_dir=sort_dir,
+            filters=filters, fields=leases_utils.lease_fields(fields, detail))
+        return [Lease.convert(lease) for lease in leases]
 
     @policy.authorize('leases', 'create')
     @wsme_pecan.wsexpose(Lease, body=Lease, status_code=202)
@@ -128,6 +200,26 @@ class LeasesController(extensions.BaseController):
         else:
             raise exceptions.BlazarException(_("Lease can't be created"))
 
+    @policy.authorize('leases', 'create')
+    @wsme_pecan.wsexpose([LeaseBulkResult], body=LeaseBulk, status_code=202)
+    @trusts.use_trust_auth()
+    def bulk(self, body):
+        """Creates several leases sharing a single trust.
+
+        :param body: the leases within the request body.
+        """
+        if not body.leases:
+            raise exceptions.InvalidInput(cls='non-empty list of leases',
+                                          value=body.leases)
+        leases = []
+        for lease in body.leases:
+            lease_dct = lease.as_dict()
+            lease_dct['trust_id'] = body.trust_id
+            leases.append(lease_dct)
+        results = pecan.request.rpcapi.create_leases(
+            leases, all_or_nothing=body.all_or_nothing)
+        return [LeaseBulkResult.convert(result) for result in results]
+
     @policy.authorize('leases', 'update')
     @wsme_pecan.wsexpose(Lease, types.UuidType(), body=Lease, status_code=202)
     def put(self, id, sublease):
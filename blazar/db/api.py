@@ -94,13 +94,55 @@ def not_equal(*values):
     return IMPL.not_equal(*values)
 
 
+def transaction():
+    """Return a context manager running the DB calls in one transaction.
+
+    The DB calls made in the block by the current thread are committed at the
+    end of the block, or rolled back if it raises.
+    """
+    return IMPL.transaction()
+
+
+def read_primary():
+    """Return a context manager running the read-only DB calls on the primary.
+
+    When [database]/slave_connection is set, read-only DB calls are run on
+    that replica, except within a transaction or once a unit of work wrote.
+    In the block, the current thread reads from the primary in any case, to
+    read back what it wrote.
+    """
+    return IMPL.read_primary()
+
+
+def unit_of_work(transactional=False):
+    """Return a context manager running the DB calls in one session.
+
+    The DB calls made in the block by the current thread share a session and
+    its connection. With transactional, they also share a transaction.
+    """
+    return IMPL.unit_of_work(transactional=transactional)
+
+
+def after_rollback(callback):
+    """Call callback if the current transaction is rolled back.
+
+    Outside of a transaction, the DB calls are committed as they return and
+    callback is never called.
+    """
+    IMPL.after_rollback(callback)
+
+
 def to_dict(func):
     def decorator(*args, **kwargs):
         res = func(*args, **kwargs)
 
+        # NOTE: partial rows are already returned as dicts
         if isinstance(res, list):
-            return [item.to_dict() for item in res]
+            return [item if isinstance(item, dict) else item.to_dict()
+                    for item in res]
 
+        if isinstance(res, dict):
+            return res
         if res:
             return res.to_dict()
         else:
@@ -117,21 +159,21 @@ def reservation_create(reservation_values):
 
 
 @to_dict
-def reservation_get_all_by_lease_id(lease_id):
+def reservation_get_all_by_lease_id(lease_id, load=None):
     """Return all reservations belongs to specific lease."""
-    return IMPL.reservation_get_all_by_lease_id(lease_id)
+    return IMPL.reservation_get_all_by_lease_id(lease_id, load=load)
 
 
 @to_dict
-def reservation_get_all_by_values(**kwargs):
+def reservation_get_all_by_values(load=None, **kwargs):
     """Returns all entries filtered by col=value."""
-    return IMPL.reservation_get_all_by_values(**kwargs)
+    return IMPL.reservation_get_all_by_values(load=load, **kwargs)
 
 
 @to_dict
-def reservation_get(reservation_id):
+def reservation_get(reservation_id, load=None):
     """Return specific reservation."""
-    return IMPL.reservation_get(reservation_id)
+    return IMPL.reservation_get(reservation_id, load=load)
 
 
 def reservation_destroy(reservation_id):
@@ -152,9 +194,9 @@ def lease_create(lease_values):
 
 
 @to_dict
-def lease_get_all():
+def lease_get_all(load=None):
     """Return all leases."""
-    return IMPL.lease_get_all()
+    return IMPL.lease_get_all(load=load)
 
 
 @to_dict
@@ -170,15 +212,35 @@ def lease_get_all_by_user(user_id):
 
 
 @to_dict
-def lease_get(lease_id):
-    """Return lease."""
-    return IMPL.lease_get(lease_id)
+def lease_get(lease_id, fields=None, load=None):
+    """Return lease, or only the given fields of the lease.
+
+    The relationships of the lease are loaded with the given strategy, one
+    of 'selectin', 'joined', 'noload' and 'raise', or a dict of them by
+    relationship, e.g. {'events': 'noload'}. Without fields nor load, the
+    lease is read straight into a dict, without building model objects.
+    """
+    if fields is None and load is None:
+        return IMPL.lease_get_as_dict(lease_id)
+    return IMPL.lease_get(lease_id, fields=fields, load=load)
 
 
 @to_dict
-def lease_list(project_id=None):
-    """Return a list of all existing leases."""
-    return IMPL.lease_list(project_id)
+def lease_list(project_id=None, limit=None, marker=None, sort_key=None,
+               sort_dir=None, filters=None, fields=None, load=None):
+    """Return a list of leases, filtered, sorted and paginated.
+
+    Only the given fields of the leases are returned if fields is set. The
+    relationships of the leases are loaded as in lease_get(), by default
+    straight into dicts.
+    """
+    if fields is None and load is None:
+        return IMPL.lease_list_as_dicts(project_id, limit=limit,
+                                        marker=marker, sort_key=sort_key,
+                                        sort_dir=sort_dir, filters=filters)
+    return IMPL.lease_list(project_id, limit=limit, marker=marker,
+                           sort_key=sort_key, sort_dir=sort_dir,
+                           filters=filters, fields=fields, load=load)
 
 
 def lease_destroy(lease_id):
@@ -191,6 +253,22 @@ def lease_update(lease_id, lease_values):
     IMPL.lease_update(lease_id, lease_values)
 
 
+def archive_leases(before, batch_size):
+    """Move a batch of leases finished before a date to the shadow tables.
+
+    Return the number of leases archived.
+    """
+    return IMPL.archive_leases(before, batch_size)
+
+
+def purge_archived_leases(before, batch_size):
+    """Delete a batch of archived leases finished before a date.
+
+    Return the number of leases purged.
+    """
+    return IMPL.purge_archived_leases(before, batch_size)
+
+
 # Events
 
 @to_dict
@@ -219,10 +297,32 @@ def event_get_first_sorted_by_filters(sort_key, sort_dir, filters):
 
 
 @to_dict
-def event_get_all_sorted_by_filters(sort_key, sort_dir, filters):
-    """Return instances sorted by param."""
+def event_get_all_sorted_by_filters(sort_key, sort_dir, filters,
+                                    limit=None):
+    """Return instances sorted by param, at most limit if given."""
     return IMPL.event_get_all_sorted_by_filters(sort_key, sort_dir,
-                                                filters)
+                                                filters, limit=limit)
+
+
+def event_count_by_filters(filters):
+    """Return the number of events matching the filters."""
+    return IMPL.event_count_by_filters(filters)
+
+
+@to_dict
+def event_update_all_by_lease_id(lease_id, values_by_type):
+    """Update the events of a lease, by event type, in one transaction."""
+    return IMPL.event_update_all_by_lease_id(lease_id, values_by_type)
+
+
+def event_claim(event_id, worker):
+    """Set an UNDONE event IN_PROGRESS, return False if not UNDONE anymore."""
+    return IMPL.event_claim(event_id, worker)
+
+
+def event_requeue_stale_claims(claimed_before):
+    """Set back UNDONE the events claimed before a date, return their count."""
+    return IMPL.event_requeue_stale_claims(claimed_before)
 
 
 def event_destroy(event_id):
@@ -298,9 +398,18 @@ def instance_reservation_destroy(instance_reservation_id):
 
 # Allocation
 
-def host_allocation_create(allocation_values):
-    """Create an allocation from the values."""
-    return IMPL.host_allocation_create(allocation_values)
+def host_allocation_create(allocation_values, returning=True):
+    """Create an allocation from the values.
+
+    Return the allocation, or None if returning is False.
+    """
+    return IMPL.host_allocation_create(allocation_values,
+                                       returning=returning)
+
+
+def host_allocation_create_bulk(allocations_values):
+    """Create several allocations at once, return their IDs."""
+    return IMPL.host_allocation_create_bulk(allocations_values)
 
 
 @to_dict
@@ -309,6 +418,27 @@ def host_allocation_get_all_by_values(**kwargs):
     return IMPL.host_allocation_get_all_by_values(**kwargs)
 
 
+def host_allocation_get_all_with_dates(host_ids=None, start_date=None,
+                                       end_date=None):
+    """Returns the allocations of hosts with the dates of their leases.
+
+    Only the allocations of host_ids overlapping the period from start_date
+    to end_date are returned if given.
+    """
+    return IMPL.host_allocation_get_all_with_dates(
+        host_ids=host_ids, start_date=start_date, end_date=end_date)
+
+
+def host_allocation_partition(host_ids, start_date, end_date):
+    """Partitions hosts into never allocated and allocated hosts.
+
+    Returns the IDs of the hosts without any allocation, and the allocations
+    of the other hosts overlapping the period from start_date to end_date by
+    host.
+    """
+    return IMPL.host_allocation_partition(host_ids, start_date, end_date)
+
+
 # TODO(frossigneux) get methods
 
 
@@ -330,21 +460,21 @@ def host_create(values):
 
 
 @to_dict
-def host_get(host_id):
+def host_get(host_id, load=None):
     """Return a specific Compute host."""
-    return IMPL.host_get(host_id)
+    return IMPL.host_get(host_id, load=load)
 
 
 @to_dict
-def host_list():
+def host_list(load=None):
     """Return a list of events."""
-    return IMPL.host_list()
+    return IMPL.host_list(load=load)
 
 
 @to_dict
-def host_get_all_by_filters(filters):
+def host_get_all_by_filters(filters, load=None):
     """Returns Compute hosts filtered by name of the field."""
-    return IMPL.host_get_all_by_filters(filters)
+    return IMPL.host_get_all_by_filters(filters, load=load)
 
 
 @to_dict
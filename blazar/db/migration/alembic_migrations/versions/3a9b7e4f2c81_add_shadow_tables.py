@@ -0,0 +1,128 @@
+# Copyright 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Add shadow tables of leases and their dependent tables
+
+Revision ID: 3a9b7e4f2c81
+Revises: e66f199a5414
+Create Date: 2018-01-23 15:42:08.913462
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3a9b7e4f2c81'
+down_revision = 'e66f199a5414'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.mysql import MEDIUMTEXT
+
+
+def MediumText():
+    return sa.Text().with_variant(MEDIUMTEXT(), 'mysql')
+
+
+def _base_columns():
+    return [sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.Column('id', sa.String(length=36), primary_key=True)]
+
+
+# Columns the archived rows are looked up by when they are purged
+INDEXES = (
+    ('ix_shadow_leases_end_date', 'shadow_leases', ['end_date']),
+    ('ix_shadow_reservations_lease_id', 'shadow_reservations', ['lease_id']),
+    ('ix_shadow_events_lease_id', 'shadow_events', ['lease_id']),
+    ('ix_shadow_computehost_reservations_reservation_id',
+     'shadow_computehost_reservations', ['reservation_id']),
+    ('ix_shadow_instance_reservations_reservation_id',
+     'shadow_instance_reservations', ['reservation_id']),
+    ('ix_shadow_computehost_allocations_reservation_id',
+     'shadow_computehost_allocations', ['reservation_id']),
+)
+
+
+def upgrade():
+    # NOTE: the shadow tables have the columns of the tables they shadow at
+    # this revision, without their foreign keys. They are declared rather
+    # than reflected so that the migration also runs offline.
+    op.create_table(
+        'shadow_leases', *(_base_columns() + [
+            sa.Column('name', sa.String(length=80), nullable=False),
+            sa.Column('user_id', sa.String(length=255), nullable=True),
+            sa.Column('project_id', sa.String(length=255), nullable=True),
+            sa.Column('start_date', sa.DateTime(), nullable=False),
+            sa.Column('end_date', sa.DateTime(), nullable=False),
+            sa.Column('trust_id', sa.String(length=36)),
+            sa.Column('action', sa.String(length=255), nullable=True),
+            sa.Column('status', sa.String(length=255), nullable=True),
+            sa.Column('status_reason', sa.String(length=255),
+                      nullable=True)]))
+
+    op.create_table(
+        'shadow_reservations', *(_base_columns() + [
+            sa.Column('lease_id', sa.String(length=36), nullable=False),
+            sa.Column('resource_id', sa.String(length=36)),
+            sa.Column('resource_type', sa.String(length=66)),
+            sa.Column('status', sa.String(length=13))]))
+
+    op.create_table(
+        'shadow_events', *(_base_columns() + [
+            sa.Column('lease_id', sa.String(length=36), nullable=True),
+            sa.Column('event_type', sa.String(length=66)),
+            sa.Column('time', sa.DateTime()),
+            sa.Column('status', sa.String(length=13)),
+            sa.Column('claimed_by', sa.String(length=255), nullable=True),
+            sa.Column('claimed_at', sa.DateTime(), nullable=True)]))
+
+    op.create_table(
+        'shadow_computehost_reservations', *(_base_columns() + [
+            sa.Column('reservation_id', sa.String(length=36), nullable=True),
+            sa.Column('resource_properties', MediumText()),
+            sa.Column('count_range', sa.String(length=36)),
+            sa.Column('hypervisor_properties', MediumText()),
+            sa.Column('status', sa.String(length=13)),
+            sa.Column('aggregate_id', sa.Integer(), nullable=True),
+            sa.Column('before_end', sa.String(length=36), nullable=True)]))
+
+    op.create_table(
+        'shadow_instance_reservations', *(_base_columns() + [
+            sa.Column('reservation_id', sa.String(length=36), nullable=True),
+            sa.Column('vcpus', sa.Integer(), nullable=False),
+            sa.Column('memory_mb', sa.Integer(), nullable=False),
+            sa.Column('disk_gb', sa.Integer(), nullable=False),
+            sa.Column('amount', sa.Integer(), nullable=False),
+            sa.Column('affinity', sa.Boolean(), nullable=False),
+            sa.Column('flavor_id', sa.String(length=36), nullable=True),
+            sa.Column('aggregate_id', sa.Integer(), nullable=True),
+            sa.Column('server_group_id', sa.String(length=36),
+                      nullable=True)]))
+
+    op.create_table(
+        'shadow_computehost_allocations', *(_base_columns() + [
+            sa.Column('compute_host_id', sa.String(length=36), nullable=True),
+            sa.Column('reservation_id', sa.String(length=36),
+                      nullable=True)]))
+
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for table in ('shadow_computehost_allocations',
+                  'shadow_instance_reservations',
+                  'shadow_computehost_reservations', 'shadow_events',
+                  'shadow_reservations', 'shadow_leases'):
+        op.drop_table(table)
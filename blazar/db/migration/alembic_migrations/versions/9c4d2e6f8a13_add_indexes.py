@@ -0,0 +1,84 @@
+# Copyright 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add indexes for the lookups of leases, reservations and events
+
+Revision ID: 9c4d2e6f8a13
+Revises: 3a9b7e4f2c81
+Create Date: 2018-01-30 11:05:24.172839
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9c4d2e6f8a13'
+down_revision = '3a9b7e4f2c81'
+
+from alembic import op
+from sqlalchemy.engine import reflection
+
+INDEXES = (
+    ('ix_leases_project_id', 'leases', ['project_id']),
+    ('ix_leases_start_date_end_date', 'leases', ['start_date', 'end_date']),
+    ('ix_reservations_lease_id', 'reservations', ['lease_id']),
+    ('ix_events_status_time', 'events', ['status', 'time']),
+    ('ix_events_lease_id_event_type', 'events', ['lease_id', 'event_type']),
+    ('ix_computehost_reservations_reservation_id',
+     'computehost_reservations', ['reservation_id']),
+    ('ix_instance_reservations_reservation_id', 'instance_reservations',
+     ['reservation_id']),
+    ('ix_computehost_allocations_compute_host_id', 'computehost_allocations',
+     ['compute_host_id']),
+    ('ix_computehost_allocations_reservation_id', 'computehost_allocations',
+     ['reservation_id']),
+    ('ix_computehost_extra_capabilities_host_name',
+     'computehost_extra_capabilities', ['computehost_id', 'capability_name']),
+)
+
+FOREIGN_KEY_COLUMNS = ('lease_id', 'reservation_id', 'compute_host_id',
+                       'computehost_id')
+
+
+def _is_mysql():
+    return op.get_context().dialect.name == 'mysql'
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        if _is_mysql():
+            # NOTE: build the indexes in place without locking the tables, or
+            # fail rather than block the reads and writes of the tables.
+            op.execute('ALTER TABLE %s ADD INDEX %s (%s), ALGORITHM=INPLACE, '
+                       'LOCK=NONE' % (table, name, ', '.join(columns)))
+        else:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    inspector = reflection.Inspector.from_engine(op.get_bind())
+    for name, table, columns in reversed(INDEXES):
+        foreign_keys = []
+        if _is_mysql() and columns[0] in FOREIGN_KEY_COLUMNS:
+            # NOTE: MySQL drops the index it created for a foreign key when
+            # another index starting with the foreign key column is added, and
+            # refuses to drop the latter. The foreign key is dropped with the
+            # index and created again, which brings back its own index.
+            foreign_keys = [fk for fk in inspector.get_foreign_keys(table)
+                            if fk['constrained_columns'] == columns[:1]]
+            for fk in foreign_keys:
+                op.drop_constraint(fk['name'], table, type_='foreignkey')
+        op.drop_index(name, table_name=table)
+        for fk in foreign_keys:
+            op.create_foreign_key(fk['name'], table, fk['referred_table'],
+                                  fk['constrained_columns'],
+                                  fk['referred_columns'])
@@ -0,0 +1,96 @@
+# Copyright 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Add numeric_value to computehost_extra_capabilities
+
+Revision ID: c4e1a8f2b7d5
+Revises: 9c4d2e6f8a13
+Create Date: 2018-02-06 15:42:10.527316
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c4e1a8f2b7d5'
+down_revision = '9c4d2e6f8a13'
+
+import decimal
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+INDEX = 'ix_computehost_extra_capabilities_name_numeric_value'
+
+# Decimal numbers which a DECIMAL(65, 30) column holds, as matched by the
+# extra capability filters
+NUMBER_REGEXP = r'^[-+]?([0-9]{1,35}(\.[0-9]*)?|\.[0-9]+)$'
+
+BATCH_SIZE = 1000
+
+
+def _numeric_value(value):
+    if value is None or not re.match(NUMBER_REGEXP, value):
+        return None
+    return decimal.Decimal(value)
+
+
+def upgrade():
+    op.add_column('computehost_extra_capabilities',
+                  sa.Column('numeric_value', sa.Numeric(65, 30),
+                            nullable=True))
+
+    extra_capabilities = sa.table(
+        'computehost_extra_capabilities',
+        sa.column('id', sa.String(36)),
+        sa.column('capability_value', sa.Text()),
+        sa.column('numeric_value', sa.Numeric(65, 30)))
+    connection = op.get_bind()
+    update = extra_capabilities.update().where(
+        extra_capabilities.c.id == sa.bindparam('_id')).values(
+        numeric_value=sa.bindparam('_numeric_value'))
+    # NOTE: page through the table by id, so that only BATCH_SIZE values
+    # are held in memory at once.
+    last_id = None
+    while True:
+        query = sa.select([extra_capabilities.c.id,
+                           extra_capabilities.c.capability_value]).order_by(
+            extra_capabilities.c.id).limit(BATCH_SIZE)
+        if last_id is not None:
+            query = query.where(extra_capabilities.c.id > last_id)
+        rows = connection.execute(query).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        updates = []
+        for row in rows:
+            numeric_value = _numeric_value(row.capability_value)
+            if numeric_value is not None:
+                updates.append({'_id': row.id,
+                                '_numeric_value': numeric_value})
+        if updates:
+            connection.execute(update, updates)
+
+    if op.get_context().dialect.name == 'mysql':
+        # NOTE: build the index in place without locking the table.
+        op.execute('ALTER TABLE computehost_extra_capabilities ADD INDEX %s '
+                   '(capability_name, numeric_value), ALGORITHM=INPLACE, '
+                   'LOCK=NONE' % INDEX)
+    else:
+        op.create_index(INDEX, 'computehost_extra_capabilities',
+                        ['capability_name', 'numeric_value'])
+
+
+def downgrade():
+    op.drop_index(INDEX, table_name='computehost_extra_capabilities')
+    op.drop_column('computehost_extra_capabilities', 'numeric_value')
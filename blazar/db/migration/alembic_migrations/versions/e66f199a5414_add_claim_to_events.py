@@ -0,0 +1,42 @@
+# Copyright 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Add claimed_by and claimed_at to events
+
+Revision ID: e66f199a5414
+Revises: 6bfd1c23aa18
+Create Date: 2018-01-16 10:21:37.526318
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e66f199a5414'
+down_revision = '6bfd1c23aa18'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('events',
+                  sa.Column('claimed_by', sa.String(length=255),
+                            nullable=True))
+    op.add_column('events',
+                  sa.Column('claimed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('events', 'claimed_at')
+    op.drop_column('events', 'claimed_by')
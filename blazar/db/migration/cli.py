@@ -16,6 +16,7 @@
 
 """CLI tool to manage the Blazar DB. Inspired by Neutron's same tool."""
 
+import argparse
 import gettext
 import os
 
@@ -24,8 +25,10 @@ from alembic import config as alembic_config
 from alembic import util as alembic_util
 from oslo_config import cfg
 from oslo_db import options as db_options
+from oslo_utils import timeutils
 
 gettext.install('blazar')
+from blazar.db import api as db_api
 from blazar.i18n import _
 
 
@@ -71,6 +74,45 @@ def do_revision(config, cmd):
                        sql=CONF.command.sql)
 
 
+def do_archive_purge(config, cmd):
+    """Archives or purges finished leases, one batch at a time.
+
+    Every batch runs in its own short transaction so that the lease tables
+    are never locked for long.
+    """
+    if cmd == 'archive':
+        move = db_api.archive_leases
+        message = _('%d leases archived')
+    else:
+        move = db_api.purge_archived_leases
+        message = _('%d leases purged')
+    total = 0
+    while True:
+        count = move(CONF.command.before, CONF.command.batch_size)
+        total += count
+        if count < CONF.command.batch_size:
+            break
+    alembic_util.msg(message % total)
+
+
+def _parse_date(value):
+    try:
+        return timeutils.normalize_time(timeutils.parse_isotime(value))
+    except ValueError:
+        raise argparse.ArgumentTypeError(_('Invalid date %s') % value)
+
+
+def _batch_size(value):
+    try:
+        value = int(value)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(
+            _('The batch size must be a positive integer'))
+    return value
+
+
 def add_command_parsers(subparsers):
     for name in ['current', 'history', 'branches']:
         parser = subparsers.add_parser(name)
@@ -97,6 +139,14 @@ def add_command_parsers(subparsers):
     parser.add_argument('--sql', action='store_true')
     parser.set_defaults(func=do_revision)
 
+    for name in ['archive', 'purge']:
+        parser = subparsers.add_parser(name)
+        parser.add_argument('--before', type=_parse_date, required=True,
+                            help=_('Date before which leases ended'))
+        parser.add_argument('--batch-size', type=_batch_size, default=1000,
+                            help=_('Number of leases per transaction'))
+        parser.set_defaults(func=do_archive_purge)
+
 
 command_opts = [
     cfg.SubCommandOpt('command',
@@ -15,18 +15,28 @@
 
 """Implementation of SQLAlchemy backend."""
 
+import datetime
+import decimal
+import operator
+import re
 import sys
 
 from oslo_config import cfg
 from oslo_db import exception as common_db_exc
 from oslo_db.sqlalchemy import session as db_session
+from oslo_db.sqlalchemy import utils as db_utils
 from oslo_log import log as logging
+from oslo_utils import uuidutils
+import six
 import sqlalchemy as sa
+from sqlalchemy import orm
+from sqlalchemy.orm import attributes
 from sqlalchemy.sql.expression import asc
 from sqlalchemy.sql.expression import desc
 
 from blazar.db import exceptions as db_exc
 from blazar.db.sqlalchemy import facade_wrapper
+from blazar.db.sqlalchemy import model_base
 from blazar.db.sqlalchemy import models
 from blazar.i18n import _
 
@@ -35,6 +45,10 @@ LOG = logging.getLogger(__name__)
 
 get_engine = facade_wrapper.get_engine
 get_session = facade_wrapper.get_session
+transaction = facade_wrapper.transaction
+read_primary = facade_wrapper.read_primary
+unit_of_work = facade_wrapper.unit_of_work
+after_rollback = facade_wrapper.after_rollback
 
 
 def get_backend():
@@ -54,6 +68,66 @@ def model_query(model, session=None):
     return session.query(model)
 
 
+# Loader options of the strategies the relationships can be loaded with
+LOADING_STRATEGIES = {
+    'selectin': 'selectinload',
+    'joined': 'joinedload',
+    'noload': 'noload',
+    'raise': 'raiseload',
+}
+
+# Relationships of the models which are loaded with them, by path
+RELATIONSHIPS = {
+    models.Lease: ('reservations',
+                   'reservations.instance_reservations',
+                   'reservations.computehost_reservations',
+                   'reservations.computehost_allocations',
+                   'events'),
+    models.Reservation: ('instance_reservations',
+                         'computehost_reservations',
+                         'computehost_allocations'),
+    models.ComputeHost: ('computehost_extra_capabilities',),
+}
+
+# Strategy list queries load the relationships with by default. The rows of
+# each relationship are loaded by a single query, instead of multiplying the
+# rows of the list by the rows of its relationships.
+LIST_LOADING = 'selectin'
+
+
+def _load_options(model, load):
+    """Returns the query options loading the relationships of a model.
+
+    :param load: strategy among LOADING_STRATEGIES to load all the
+        relationships with, or dict of the strategies by relationship path,
+        e.g. {'events': 'noload'}. Relationships not given are loaded as set
+        in the models.
+    """
+    if load is None:
+        return []
+    paths = RELATIONSHIPS.get(model, ())
+    if isinstance(load, six.string_types):
+        load = dict((path, load) for path in paths)
+
+    options = []
+    for path, strategy in sorted(load.items()):
+        if path not in paths:
+            raise db_exc.BlazarDBInvalidFilter(query_filter=path)
+        if strategy not in LOADING_STRATEGIES:
+            raise db_exc.BlazarDBInvalidFilter(query_filter=strategy)
+        names = path.split('.')
+        option = orm
+        current = model
+        for name in names[:-1]:
+            attr = getattr(current, name)
+            option = option.defaultload(attr)
+            current = attr.property.mapper.class_
+        option = getattr(option, LOADING_STRATEGIES[strategy])(
+            getattr(current, names[-1]))
+        options.append(option)
+    return options
+
+
 def setup_db():
     try:
         engine = db_session.EngineFacade(cfg.CONF.database.connection,
@@ -76,6 +150,34 @@ def drop_db():
     return True
 
 
+def _bulk_insert(session, model, values_list):
+    """Inserts rows with a single multi-row statement.
+
+    IDs are generated here as the ORM does not batch inserts of rows whose
+    primary key is generated at flush time.
+    """
+    if not values_list:
+        return []
+    values_list = [dict(values) for values in values_list]
+    for values in values_list:
+        values.setdefault('id', uuidutils.generate_uuid())
+    session.bulk_insert_mappings(model, values_list)
+    facade_wrapper.expire_shared_session(session)
+    return [values['id'] for values in values_list]
+
+
+def _inserted(instance):
+    """Mark the columns left unset by the insert of a row as loaded.
+
+    No column has a server default, so the columns which were not set are
+    NULL and the row does not need to be read back.
+    """
+    unloaded = attributes.instance_state(instance).unloaded
+    for column in instance.__table__.columns:
+        if column.key in unloaded:
+            attributes.set_committed_value(instance, column.key, None)
+
+
 # Helpers for building constraints / equality checks
 
 
@@ -119,30 +221,34 @@ class InequalityCondition(object):
 
 
 # Reservation
-def _reservation_get(session, reservation_id):
-    query = model_query(models.Reservation, session)
+def _reservation_get(session, reservation_id, load=None):
+    query = model_query(models.Reservation, session).options(
+        *_load_options(models.Reservation, load))
     return query.filter_by(id=reservation_id).first()
 
 
-def reservation_get(reservation_id):
-    return _reservation_get(get_session(), reservation_id)
+def reservation_get(reservation_id, load=None):
+    return _reservation_get(get_session(), reservation_id, load=load)
 
 
-def reservation_get_all():
-    query = model_query(models.Reservation, get_session())
+def reservation_get_all(load=None):
+    query = model_query(models.Reservation, get_session()).options(
+        *_load_options(models.Reservation, load or LIST_LOADING))
     return query.all()
 
 
-def reservation_get_all_by_lease_id(lease_id):
+def reservation_get_all_by_lease_id(lease_id, load=None):
     reservations = (model_query(models.Reservation,
                     get_session()).filter_by(lease_id=lease_id))
-    return reservations.all()
+    return reservations.options(
+        *_load_options(models.Reservation, load or LIST_LOADING)).all()
 
 
-def reservation_get_all_by_values(**kwargs):
+def reservation_get_all_by_values(load=None, **kwargs):
     """Returns all entries filtered by col=value."""
 
-    reservation_query = model_query(models.Reservation, get_session())
+    reservation_query = model_query(models.Reservation, get_session()).options(
+        *_load_options(models.Reservation, load or LIST_LOADING))
     for name, value in kwargs.items():
         column = getattr(models.Reservation, name, None)
         if column:
@@ -150,37 +256,50 @@ def reservation_get_all_by_values(**kwargs):
     return reservation_query.all()
 
 
+def _reservation_created(reservation):
+    """Mark the columns and dependent rows of a new reservation as loaded.
+
+    A new reservation has no host reservation, instance reservation nor
+    allocation yet, which spares querying them when it is returned.
+    """
+    _inserted(reservation)
+    for name in ('computehost_reservations', 'instance_reservations',
+                 'computehost_allocations'):
+        attributes.set_committed_value(reservation, name, None)
+
+
 def reservation_create(values):
     values = values.copy()
     reservation = models.Reservation()
     reservation.update(values)
 
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         try:
             reservation.save(session=session)
         except common_db_exc.DBDuplicateEntry as e:
             # raise exception about duplicated columns (e.columns)
             raise db_exc.BlazarDBDuplicateEntry(
                 model=reservation.__class__.__name__, columns=e.columns)
+        _reservation_created(reservation)
 
-    return reservation_get(reservation.id)
+    return reservation
 
 
 def reservation_update(reservation_id, values):
     session = get_session()
 
-    with session.begin():
+    with session.begin(subtransactions=True):
         reservation = _reservation_get(session, reservation_id)
         reservation.update(values)
         reservation.save(session=session)
 
-    return reservation_get(reservation_id)
+    return reservation
 
 
 def reservation_destroy(reservation_id):
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         reservation = _reservation_get(session, reservation_id)
 
         if not reservation:
@@ -192,17 +311,50 @@ def reservation_destroy(reservation_id):
 
 
 # Lease
-def _lease_get(session, lease_id):
-    query = model_query(models.Lease, session)
+def _lease_get(session, lease_id, load=None):
+    query = model_query(models.Lease, session).options(
+        *_load_options(models.Lease, load))
     return query.filter_by(id=lease_id).first()
 
 
-def lease_get(lease_id):
-    return _lease_get(get_session(), lease_id)
+def _lease_fields_query(query, fields):
+    """Restrict a query on leases to some of their columns.
+
+    The reservations and events of the leases are not loaded.
+    """
+    columns = []
+    for field in fields:
+        if field not in models.Lease.__table__.columns:
+            raise db_exc.BlazarDBInvalidFilter(query_filter=field)
+        columns.append(getattr(models.Lease, field))
+    return query.with_entities(*columns)
+
+
+def _lease_row_to_dict(row):
+    lease = row._asdict()
+    model_base.datetime_to_str(lease, 'created_at')
+    model_base.datetime_to_str(lease, 'updated_at')
+    return lease
+
 
+def lease_get(lease_id, fields=None, load=None):
+    """Return a lease, or a dict of the given fields of the lease.
 
-def lease_get_all():
-    query = model_query(models.Lease, get_session())
+    :param load: strategy to load the relationships of the lease with, see
+        _load_options().
+    """
+    session = get_session(use_slave=True)
+    if fields is None:
+        return _lease_get(session, lease_id, load=load)
+    query = model_query(models.Lease, session).filter(
+        models.Lease.id == lease_id)
+    row = _lease_fields_query(query, fields).first()
+    return _lease_row_to_dict(row) if row else None
+
+
+def lease_get_all(load=None):
+    query = model_query(models.Lease, get_session(use_slave=True))
+    query = query.options(*_load_options(models.Lease, load or LIST_LOADING))
     return query.all()
 
 
@@ -214,11 +366,178 @@ def lease_get_all_by_user(user_id):
     raise NotImplementedError
 
 
-def lease_list(project_id=None):
-    query = model_query(models.Lease, get_session())
+LEASE_FILTERS = {
+    'status': lambda value: models.Lease.status == value,
+    'project_id': lambda value: models.Lease.project_id == value,
+    'resource_type': lambda value: models.Lease.reservations.any(
+        models.Reservation.resource_type == value),
+    'start_before': lambda value: models.Lease.start_date < value,
+    'end_after': lambda value: models.Lease.end_date > value,
+}
+
+
+def lease_list(project_id=None, limit=None, marker=None, sort_key=None,
+               sort_dir=None, filters=None, fields=None, load=None):
+    """Return leases, filtered, sorted and paginated.
+
+    :param filters: dict of filters among LEASE_FILTERS. start_before and
+        end_after together select the leases overlapping a time window.
+    :param marker: ID of the last lease of the previous page.
+    :param fields: if given, only these columns are loaded and a dict of
+        them is returned for each lease.
+    :param load: strategy to load the relationships of the leases with, see
+        _load_options(). Defaults to LIST_LOADING.
+    """
+    query = _lease_list_query(get_session(use_slave=True), project_id, limit,
+                              marker, sort_key, sort_dir, filters, fields,
+                              load)
+    if fields is not None:
+        return [_lease_row_to_dict(row) for row in query]
+    return query.all()
+
+
+def _lease_list_query(session, project_id, limit, marker, sort_key, sort_dir,
+                      filters, fields, load):
+    query = model_query(models.Lease, session)
     if project_id is not None:
         query = query.filter_by(project_id=project_id)
-    return query.all()
+    for key, value in (filters or {}).items():
+        if key not in LEASE_FILTERS:
+            raise db_exc.BlazarDBInvalidFilter(query_filter=key)
+        query = query.filter(LEASE_FILTERS[key](value))
+
+    marker_lease = None
+    if marker is not None:
+        marker_lease = _lease_get(session, marker, load='noload')
+        if marker_lease is None:
+            raise db_exc.BlazarDBNotFound(id=marker, model='Lease')
+
+    if fields is not None:
+        query = _lease_fields_query(query, fields)
+    else:
+        query = query.options(
+            *_load_options(models.Lease, load or LIST_LOADING))
+
+    # NOTE: the ID makes the sort order total, which the markers rely on.
+    sort_keys = [sort_key or 'created_at']
+    if 'id' not in sort_keys:
+        sort_keys.append('id')
+    try:
+        query = db_utils.paginate_query(query, models.Lease, limit,
+                                        sort_keys, marker=marker_lease,
+                                        sort_dir=sort_dir or 'asc')
+    except common_db_exc.InvalidSortKey:
+        raise db_exc.BlazarDBInvalidFilter(query_filter=sort_key)
+    return query
+
+
+# Read path of leases as dicts
+#
+# Leases are read with their reservations and events by Core queries, whose
+# rows are turned into the dicts the models would be serialized to, without
+# building the model objects.
+
+# Columns of the host and instance reservations read with the reservations
+_HOST_RESERVATION_COLUMNS = ('id', 'hypervisor_properties',
+                             'resource_properties', 'before_end',
+                             'count_range')
+_INSTANCE_RESERVATION_COLUMNS = ['id'] + models.INSTANCE_RESERVATION_KEYS
+
+# Number of leases whose reservations and events are read by a query
+_IN_BATCH_SIZE = 500
+
+
+def _row_dicts(result):
+    """Returns the rows of a result as dicts.
+
+    Timestamps are formatted as by the models.
+    """
+    keys = result.keys()
+    timestamps = [key for key in keys if key in ('created_at', 'updated_at')]
+    dicts = []
+    for row in result:
+        d = dict(zip(keys, row))
+        for key in timestamps:
+            if d[key] is not None:
+                d[key] = d[key].isoformat(' ')
+        dicts.append(d)
+    return dicts
+
+
+def _prefixed(prefix, d):
+    """Pops the values of a dict whose keys start with prefix."""
+    values = dict((key[len(prefix):], d.pop(key))
+                  for key in [key for key in d if key.startswith(prefix)])
+    return values if values['id'] is not None else None
+
+
+def _add_lease_children(session, leases):
+    """Reads the reservations and events of leases into their dicts."""
+    leases_by_id = {}
+    for lease in leases:
+        lease['reservations'] = []
+        lease['events'] = []
+        leases_by_id[lease['id']] = lease
+
+    reservations = models.Reservation.__table__
+    host_reservations = models.ComputeHostReservation.__table__
+    instance_reservations = models.InstanceReservations.__table__
+    events = models.Event.__table__
+    columns = (list(reservations.c) +
+               [host_reservations.c[name].label('host_reservation_' + name)
+                for name in _HOST_RESERVATION_COLUMNS] +
+               [instance_reservations.c[name].label(
+                   'instance_reservation_' + name)
+                for name in _INSTANCE_RESERVATION_COLUMNS])
+    joins = reservations.outerjoin(
+        host_reservations,
+        host_reservations.c.reservation_id == reservations.c.id).outerjoin(
+        instance_reservations,
+        instance_reservations.c.reservation_id == reservations.c.id)
+
+    lease_ids = list(leases_by_id)
+    for i in range(0, len(lease_ids), _IN_BATCH_SIZE):
+        batch = lease_ids[i:i + _IN_BATCH_SIZE]
+        result = session.execute(
+            sa.select(columns).select_from(joins).where(
+                reservations.c.lease_id.in_(batch)))
+        for reservation in _row_dicts(result):
+            host_reservation = _prefixed('host_reservation_', reservation)
+            instance_reservation = _prefixed('instance_reservation_',
+                                             reservation)
+            leases_by_id[reservation['lease_id']]['reservations'].append(
+                models.add_reservation_details(reservation, host_reservation,
+                                               instance_reservation))
+
+        result = session.execute(
+            sa.select([events]).where(events.c.lease_id.in_(batch)))
+        for event in _row_dicts(result):
+            leases_by_id[event['lease_id']]['events'].append(event)
+    return leases
+
+
+def lease_get_as_dict(lease_id):
+    """Returns the dict of a lease, with its reservations and events."""
+    session = get_session(use_slave=True)
+    leases = models.Lease.__table__
+    leases = _row_dicts(session.execute(
+        sa.select([leases]).where(leases.c.id == lease_id)))
+    return _add_lease_children(session, leases)[0] if leases else None
+
+
+def lease_list_as_dicts(project_id=None, limit=None, marker=None,
+                        sort_key=None, sort_dir=None, filters=None):
+    """Returns the dicts of leases, with their reservations and events.
+
+    The leases are filtered, sorted and paginated as by lease_list().
+    """
+    session = get_session(use_slave=True)
+    query = _lease_list_query(session, project_id, limit, marker, sort_key,
+                              sort_dir, filters,
+                              [column.name for column in
+                               models.Lease.__table__.columns], None)
+    leases = _row_dicts(session.execute(query.statement))
+    return _add_lease_children(session, leases)
 
 
 def lease_create(values):
@@ -229,7 +548,7 @@ def lease_create(values):
     lease.update(values)
 
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         try:
             lease.save(session=session)
         except common_db_exc.DBDuplicateEntry as e:
@@ -237,45 +556,59 @@ def lease_create(values):
             raise db_exc.BlazarDBDuplicateEntry(
                 model=lease.__class__.__name__, columns=e.columns)
 
+        # NOTE: the reservations and events of the lease are added to its
+        # collections, so that the lease is returned without querying them.
+        _inserted(lease)
+        attributes.set_committed_value(lease, 'reservations', [])
+        attributes.set_committed_value(lease, 'events', [])
+
         try:
             for r in reservations:
                 reservation = models.Reservation()
                 reservation.update({"lease_id": lease.id})
                 reservation.update(r)
+                lease.reservations.append(reservation)
                 reservation.save(session=session)
+                _reservation_created(reservation)
         except common_db_exc.DBDuplicateEntry as e:
             # raise exception about duplicated columns (e.columns)
             raise db_exc.BlazarDBDuplicateEntry(
                 model=reservation.__class__.__name__, columns=e.columns)
 
         try:
-            for e in events:
+            for event_values in events:
                 event = models.Event()
-                event.update({"lease_id": lease.id})
-                event.update(e)
-                event.save(session=session)
+                # NOTE: events with an ID are inserted by a single statement.
+                event.update(dict(event_values,
+                                  id=event_values.get(
+                                      'id', uuidutils.generate_uuid()),
+                                  lease_id=lease.id))
+                lease.events.append(event)
+            session.flush()
+            for event in lease.events:
+                _inserted(event)
         except common_db_exc.DBDuplicateEntry as e:
             # raise exception about duplicated columns (e.columns)
             raise db_exc.BlazarDBDuplicateEntry(
-                model=event.__class__.__name__, columns=e.columns)
+                model=models.Event.__name__, columns=e.columns)
 
-    return lease_get(lease.id)
+    return lease
 
 
 def lease_update(lease_id, values):
     session = get_session()
 
-    with session.begin():
+    with session.begin(subtransactions=True):
         lease = _lease_get(session, lease_id)
         lease.update(values)
         lease.save(session=session)
 
-    return lease_get(lease_id)
+    return lease
 
 
 def lease_destroy(lease_id):
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         lease = _lease_get(session, lease_id)
 
         if not lease:
@@ -304,13 +637,12 @@ def event_get_all():
     return _event_get_all(get_session()).all()
 
 
-def _event_get_sorted_by_filters(sort_key, sort_dir, filters):
-    """Return an event query filtered and sorted by name of the field."""
-
-    sort_fn = {'desc': desc, 'asc': asc}
-
-    events_query = _event_get_all(get_session())
+def _event_filter(events_query, filters):
+    """Return an event query filtered by the fields given in filters.
 
+    Filtering on time is done with a dict like {'op': 'lt', 'border': date},
+    where op is one of 'lt', 'le', 'gt', 'ge' and 'eq'.
+    """
     if 'status' in filters:
         events_query = (
             events_query.filter(models.Event.status == filters['status']))
@@ -320,7 +652,31 @@ def _event_get_sorted_by_filters(sort_key, sort_dir, filters):
     if 'event_type' in filters:
         events_query = events_query.filter(models.Event.event_type ==
                                            filters['event_type'])
+    if 'time' in filters:
+        border = filters['time']['border']
+        if filters['time']['op'] == 'lt':
+            events_query = events_query.filter(models.Event.time < border)
+        elif filters['time']['op'] == 'le':
+            events_query = events_query.filter(models.Event.time <= border)
+        elif filters['time']['op'] == 'gt':
+            events_query = events_query.filter(models.Event.time > border)
+        elif filters['time']['op'] == 'ge':
+            events_query = events_query.filter(models.Event.time >= border)
+        elif filters['time']['op'] == 'eq':
+            events_query = events_query.filter(models.Event.time == border)
+        else:
+            raise db_exc.BlazarDBInvalidFilterOperator(
+                filter_operator=filters['time']['op'])
+
+    return events_query
+
+
+def _event_get_sorted_by_filters(sort_key, sort_dir, filters):
+    """Return an event query filtered and sorted by name of the field."""
+
+    sort_fn = {'desc': desc, 'asc': asc}
 
+    events_query = _event_filter(_event_get_all(get_session()), filters)
     events_query = events_query.order_by(
         sort_fn[sort_dir](getattr(models.Event, sort_key))
     )
@@ -338,10 +694,23 @@ def event_get_first_sorted_by_filters(sort_key, sort_dir, filters):
     return _event_get_sorted_by_filters(sort_key, sort_dir, filters).first()
 
 
-def event_get_all_sorted_by_filters(sort_key, sort_dir, filters):
-    """Return events filtered and sorted by name of the field."""
+def event_get_all_sorted_by_filters(sort_key, sort_dir, filters,
+                                    limit=None):
+    """Return events filtered and sorted by name of the field.
+
+    :param limit: maximum number of events to return, all by default.
+    """
+    events_query = _event_get_sorted_by_filters(sort_key, sort_dir, filters)
+    if limit is not None:
+        events_query = events_query.limit(limit)
+    return events_query.all()
+
 
-    return _event_get_sorted_by_filters(sort_key, sort_dir, filters).all()
+def event_count_by_filters(filters):
+    """Return the number of events matching the filters."""
+    session = get_session()
+    return _event_filter(session.query(sa.func.count(models.Event.id)),
+                         filters).scalar()
 
 
 def event_create(values):
@@ -350,31 +719,88 @@ def event_create(values):
     event.update(values)
 
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         try:
             event.save(session=session)
         except common_db_exc.DBDuplicateEntry as e:
             # raise exception about duplicated columns (e.columns)
             raise db_exc.BlazarDBDuplicateEntry(
                 model=event.__class__.__name__, columns=e.columns)
+        _inserted(event)
 
-    return event_get(event.id)
+    return event
 
 
 def event_update(event_id, values):
     session = get_session()
 
-    with session.begin():
+    with session.begin(subtransactions=True):
         event = _event_get(session, event_id)
         event.update(values)
         event.save(session=session)
 
-    return event_get(event_id)
+    return event
+
+
+def event_update_all_by_lease_id(lease_id, values_by_type):
+    """Update the events of a lease in a single transaction.
+
+    The events are loaded by one query and updated with the values given for
+    their event type; events of other types are left untouched. Return all
+    the events of the lease.
+    """
+    session = get_session()
+
+    with session.begin(subtransactions=True):
+        events = model_query(models.Event, session).filter_by(
+            lease_id=lease_id).all()
+        for event in events:
+            if event.event_type in values_by_type:
+                event.update(values_by_type[event.event_type])
+                event.save(session=session)
+
+    return events
+
+
+def event_claim(event_id, worker):
+    """Atomically set an UNDONE event IN_PROGRESS on behalf of worker.
+
+    Return True if the event was claimed, False if it was not UNDONE anymore,
+    e.g. because another worker claimed it first.
+    """
+    session = get_session()
+    with session.begin(subtransactions=True):
+        claimed = model_query(models.Event, session).filter_by(
+            id=event_id, status='UNDONE').update(
+            {'status': 'IN_PROGRESS',
+             'claimed_by': worker,
+             'claimed_at': datetime.datetime.utcnow()},
+            synchronize_session=False)
+        facade_wrapper.expire_shared_session(session)
+    return claimed == 1
+
+
+def event_requeue_stale_claims(claimed_before):
+    """Set back UNDONE the IN_PROGRESS events claimed before a date.
+
+    Return the number of requeued events.
+    """
+    session = get_session()
+    with session.begin(subtransactions=True):
+        requeued = model_query(models.Event, session).filter(
+            models.Event.status == 'IN_PROGRESS',
+            models.Event.claimed_at < claimed_before).update(
+            {'status': 'UNDONE',
+             'claimed_by': None,
+             'claimed_at': None},
+            synchronize_session=False)
+        facade_wrapper.expire_shared_session(session)
+    return requeued
 
 
 def event_destroy(event_id):
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         event = _event_get(session, event_id)
 
         if not event:
@@ -416,32 +842,33 @@ def host_reservation_create(values):
     host_reservation.update(values)
 
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         try:
             host_reservation.save(session=session)
         except common_db_exc.DBDuplicateEntry as e:
             # raise exception about duplicated columns (e.columns)
             raise db_exc.BlazarDBDuplicateEntry(
                 model=host_reservation.__class__.__name__, columns=e.columns)
+        _inserted(host_reservation)
 
-    return host_reservation_get(host_reservation.id)
+    return host_reservation
 
 
 def host_reservation_update(host_reservation_id, values):
     session = get_session()
 
-    with session.begin():
+    with session.begin(subtransactions=True):
         host_reservation = _host_reservation_get(session,
                                                  host_reservation_id)
         host_reservation.update(values)
         host_reservation.save(session=session)
 
-    return host_reservation_get(host_reservation_id)
+    return host_reservation
 
 
 def host_reservation_destroy(host_reservation_id):
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         host_reservation = _host_reservation_get(session,
                                                  host_reservation_id)
 
@@ -460,7 +887,7 @@ def instance_reservation_create(values):
     instance_reservation.update(value)
 
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         try:
             instance_reservation.save(session=session)
         except common_db_exc.DBDuplicateEntry as e:
@@ -468,8 +895,9 @@ def instance_reservation_create(values):
             raise db_exc.BlazarDBDuplicateEntry(
                 model=instance_reservation.__class__.__name__,
                 columns=e.columns)
+        _inserted(instance_reservation)
 
-    return instance_reservation_get(instance_reservation.id)
+    return instance_reservation
 
 
 def instance_reservation_get(instance_reservation_id, session=None):
@@ -482,7 +910,7 @@ def instance_reservation_get(instance_reservation_id, session=None):
 def instance_reservation_update(instance_reservation_id, values):
     session = get_session()
 
-    with session.begin():
+    with session.begin(subtransactions=True):
         instance_reservation = instance_reservation_get(
             instance_reservation_id, session)
 
@@ -493,12 +921,12 @@ def instance_reservation_update(instance_reservation_id, values):
         instance_reservation.update(values)
         instance_reservation.save(session=session)
 
-    return instance_reservation_get(instance_reservation_id)
+    return instance_reservation
 
 
 def instance_reservation_destroy(instance_reservation_id):
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         instance = instance_reservation_get(instance_reservation_id)
 
         if not instance:
@@ -533,38 +961,125 @@ def host_allocation_get_all_by_values(**kwargs):
     return allocation_query.all()
 
 
-def host_allocation_create(values):
+def host_allocation_get_all_with_dates(host_ids=None, start_date=None,
+                                       end_date=None):
+    """Returns the allocations with the dates of their leases, as dicts.
+
+    Each dict holds the compute_host_id, reservation_id, start_date and
+    end_date of an allocation. If given, only the allocations of host_ids
+    overlapping the period from start_date to end_date are returned.
+    """
+    allocations = models.ComputeHostAllocation.__table__
+    reservations = models.Reservation.__table__
+    leases = models.Lease.__table__
+    query = sa.select([allocations.c.compute_host_id,
+                       allocations.c.reservation_id,
+                       leases.c.start_date, leases.c.end_date]).select_from(
+        allocations.join(
+            reservations,
+            reservations.c.id == allocations.c.reservation_id).join(
+            leases, leases.c.id == reservations.c.lease_id))
+    if start_date is not None:
+        query = query.where(leases.c.end_date > start_date)
+    if end_date is not None:
+        query = query.where(leases.c.start_date < end_date)
+
+    session = get_session()
+    if host_ids is None:
+        return [dict(row) for row in session.execute(query)]
+    host_ids = list(host_ids)
+    result = []
+    for i in range(0, len(host_ids), _IN_BATCH_SIZE):
+        result.extend(dict(row) for row in session.execute(query.where(
+            allocations.c.compute_host_id.in_(
+                host_ids[i:i + _IN_BATCH_SIZE]))))
+    return result
+
+
+def host_allocation_partition(host_ids, start_date, end_date):
+    """Partitions hosts into never allocated and allocated hosts.
+
+    The hosts without any allocation are found with an anti-join of the
+    hosts and the allocations, and the allocations of the other hosts
+    overlapping the period from start_date to end_date with a second query.
+
+    :returns: a tuple of the IDs of the hosts never allocated, in the order
+              of host_ids, and of a dict giving for every allocated host the
+              list of its allocations overlapping the period, as dicts
+              holding their reservation_id, start_date and end_date
+    """
+    hosts = models.ComputeHost.__table__
+    allocations = models.ComputeHostAllocation.__table__
+    not_allocated_query = sa.select([hosts.c.id]).select_from(
+        hosts.outerjoin(
+            allocations, allocations.c.compute_host_id == hosts.c.id)).where(
+        allocations.c.id.is_(None))
+
+    host_ids = list(host_ids)
+    not_allocated = set()
+    session = get_session()
+    for i in range(0, len(host_ids), _IN_BATCH_SIZE):
+        not_allocated.update(
+            row[0] for row in session.execute(not_allocated_query.where(
+                hosts.c.id.in_(host_ids[i:i + _IN_BATCH_SIZE]))))
+
+    allocated = dict((host_id, []) for host_id in host_ids
+                     if host_id not in not_allocated)
+    for allocation in host_allocation_get_all_with_dates(
+            list(allocated), start_date, end_date):
+        allocated[allocation.pop('compute_host_id')].append(allocation)
+    return ([host_id for host_id in host_ids if host_id in not_allocated],
+            allocated)
+
+
+def host_allocation_create(values, returning=True):
+    """Creates an allocation, returns it unless returning is False."""
     values = values.copy()
     host_allocation = models.ComputeHostAllocation()
     host_allocation.update(values)
 
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         try:
             host_allocation.save(session=session)
         except common_db_exc.DBDuplicateEntry as e:
             # raise exception about duplicated columns (e.columns)
             raise db_exc.BlazarDBDuplicateEntry(
                 model=host_allocation.__class__.__name__, columns=e.columns)
+        _inserted(host_allocation)
+
+    return host_allocation if returning else None
 
-    return host_allocation_get(host_allocation.id)
+
+def host_allocation_create_bulk(values_list):
+    """Creates several allocations at once, returns their IDs."""
+    session = get_session()
+    with session.begin(subtransactions=True):
+        try:
+            return _bulk_insert(session, models.ComputeHostAllocation,
+                                values_list)
+        except common_db_exc.DBDuplicateEntry as e:
+            # raise exception about duplicated columns (e.columns)
+            raise db_exc.BlazarDBDuplicateEntry(
+                model=models.ComputeHostAllocation.__name__,
+                columns=e.columns)
 
 
 def host_allocation_update(host_allocation_id, values):
     session = get_session()
 
-    with session.begin():
+    with session.begin(subtransactions=True):
         host_allocation = _host_allocation_get(session,
                                                host_allocation_id)
         host_allocation.update(values)
         host_allocation.save(session=session)
 
-    return host_allocation_get(host_allocation_id)
+    return host_allocation
 
 
 def host_allocation_destroy(host_allocation_id):
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         host_allocation = _host_allocation_get(session,
                                                host_allocation_id)
 
@@ -587,18 +1102,23 @@ def _host_get_all(session):
     return query
 
 
-def host_get(host_id):
-    return _host_get(get_session(), host_id)
+def host_get(host_id, load=None):
+    query = model_query(models.ComputeHost, get_session(use_slave=True))
+    query = query.options(*_load_options(models.ComputeHost, load))
+    return query.filter_by(id=host_id).first()
 
 
-def host_list():
-    return model_query(models.ComputeHost, get_session()).all()
+def host_list(load=None):
+    query = model_query(models.ComputeHost, get_session(use_slave=True))
+    return query.options(
+        *_load_options(models.ComputeHost, load or LIST_LOADING)).all()
 
 
-def host_get_all_by_filters(filters):
+def host_get_all_by_filters(filters, load=None):
     """Returns hosts filtered by name of the field."""
 
-    hosts_query = _host_get_all(get_session())
+    hosts_query = _host_get_all(get_session(use_slave=True)).options(
+        *_load_options(models.ComputeHost, load or LIST_LOADING))
 
     if 'status' in filters:
         hosts_query = hosts_query.filter(
@@ -607,6 +1127,84 @@ def host_get_all_by_filters(filters):
     return hosts_query.all()
 
 
+# Comparison operators of the extra capability queries
+EXTRA_CAPABILITY_OPERATORS = {
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+
+# Decimal numbers which the numeric_value column of the extra capabilities
+# holds, i.e. whose absolute value is below 10 ** 35
+NUMBER_REGEXP = r'^[-+]?([0-9]{1,35}(\.[0-9]*)?|\.[0-9]+)$'
+
+
+def _numeric_value(value):
+    """Returns value as a Decimal, None if it is not a number.
+
+    Only the values matching NUMBER_REGEXP are numbers, as for the filters
+    of the values whose numeric_value is not set.
+    """
+    if value is None:
+        return None
+    value = six.text_type(value)
+    if not re.match(NUMBER_REGEXP, value):
+        return None
+    return decimal.Decimal(value)
+
+
+def _is_number(column, dialect_name):
+    """Returns the filter of the values of column which are numbers."""
+    if dialect_name == 'mysql':
+        return column.op('REGEXP')(NUMBER_REGEXP)
+    if dialect_name == 'postgresql':
+        return column.op('~')(NUMBER_REGEXP)
+    if dialect_name == 'sqlite':
+        # NOTE: SQLite has no regular expressions by default. The value has
+        # at least a digit, only digits, signs and dots, no sign but the
+        # first character and at most one dot.
+        return sa.and_(column.op('GLOB')('*[0-9]*'),
+                       column.op('NOT GLOB')('*[^-+.0-9]*'),
+                       sa.func.substr(column, 2).op('NOT GLOB')('*[-+]*'),
+                       column.op('NOT GLOB')('*.*.*'))
+    return sa.false()
+
+
+def _extra_capability_value_filter(op, value, dialect_name):
+    """Returns the filter comparing the extra capability values to value.
+
+    Values are compared as numbers, with the indexed numeric_value column,
+    if value matches NUMBER_REGEXP, as strings otherwise, with the collation
+    of the column. Values which are not numbers differ from any number.
+
+    The values of the rows whose numeric_value is not set, e.g. written by
+    a manager not setting it yet, are cast to numbers if they are numbers.
+    """
+    numeric_value = _numeric_value(value)
+    if numeric_value is None:
+        return EXTRA_CAPABILITY_OPERATORS[op](
+            models.ComputeHostExtraCapability.capability_value, value)
+    column = models.ComputeHostExtraCapability.numeric_value
+    capability_value = models.ComputeHostExtraCapability.capability_value
+    # NOTE: the CASE expression makes sure that only the values which are
+    # numbers are cast, since PostgreSQL fails to cast the others.
+    cast_value = sa.case([(_is_number(capability_value, dialect_name),
+                           sa.cast(capability_value, sa.Numeric(65, 30)))])
+    if op == '!=':
+        return sa.or_(column != numeric_value,
+                      sa.and_(column.is_(None),
+                              sa.or_(cast_value.is_(None),
+                                     cast_value != numeric_value)))
+    return sa.or_(EXTRA_CAPABILITY_OPERATORS[op](column, numeric_value),
+                  sa.and_(column.is_(None),
+                          EXTRA_CAPABILITY_OPERATORS[op](cast_value,
+                                                         numeric_value)))
+
+
 def host_get_all_by_queries(queries):
     """Returns hosts filtered by an array of queries.
 
@@ -615,18 +1213,18 @@ def host_get_all_by_queries(queries):
             #sqlalchemy.sql.operators.ColumnOperators
 
     """
-    hosts_query = model_query(models.ComputeHost, get_session())
+    session = get_session(use_slave=True)
+    hosts_query = model_query(models.ComputeHost, session)
 
     oper = {
-        '<': ['lt', lambda a, b: a >= b],
-        '>': ['gt', lambda a, b: a <= b],
-        '<=': ['le', lambda a, b: a > b],
-        '>=': ['ge', lambda a, b: a < b],
-        '==': ['eq', lambda a, b: a != b],
-        '!=': ['ne', lambda a, b: a == b],
+        '<': 'lt',
+        '>': 'gt',
+        '<=': 'le',
+        '>=': 'ge',
+        '==': 'eq',
+        '!=': 'ne',
     }
 
-    hosts = []
     for query in queries:
         try:
             key, op, value = query.split(' ', 3)
@@ -639,7 +1237,7 @@ def host_get_all_by_queries(queries):
                 filt = column.in_(value.split(','))
             else:
                 if op in oper:
-                    op = oper[op][0]
+                    op = oper[op]
                 try:
                     attr = filter(lambda e: hasattr(column, e % op),
                                   ['%s', '%s_', '__%s__'])[0] % op
@@ -654,29 +1252,25 @@ def host_get_all_by_queries(queries):
 
             hosts_query = hosts_query.filter(filt)
         else:
-            # looking for extra capabilities matches
-            extra_filter = model_query(
-                models.ComputeHostExtraCapability, get_session()
-            ).filter(models.ComputeHostExtraCapability.capability_name == key
-                     ).all()
-            if not extra_filter:
+            # looking for extra capabilities matches, with a subquery
+            # correlated to the hosts query
+            extra_capabilities = model_query(
+                models.ComputeHostExtraCapability, session).filter(
+                models.ComputeHostExtraCapability.capability_name == key)
+            if not session.query(extra_capabilities.exists()).scalar():
                 raise db_exc.BlazarDBNotFound(
                     id=key, model='ComputeHostExtraCapability')
+            if op not in EXTRA_CAPABILITY_OPERATORS:
+                msg = 'Operator %s for extra capabilities not implemented'
+                raise NotImplementedError(msg % op)
 
-            for host in extra_filter:
-                if op in oper and oper[op][1](host.capability_value, value):
-                    hosts.append(host.computehost_id)
-                elif op not in oper:
-                    msg = 'Operator %s for extra capabilities not implemented'
-                    raise NotImplementedError(msg % op)
+            hosts_query = hosts_query.filter(extra_capabilities.filter(
+                models.ComputeHostExtraCapability.computehost_id ==
+                models.ComputeHost.id,
+                _extra_capability_value_filter(
+                    op, value, session.bind.dialect.name)).exists())
 
-            # We must also avoid selecting any host which doesn't have the
-            # extra capability present.
-            all_hosts = [h.id for h in hosts_query.all()]
-            extra_filter_hosts = [h.computehost_id for h in extra_filter]
-            hosts += [h for h in all_hosts if h not in extra_filter_hosts]
-
-    return hosts_query.filter(~models.ComputeHost.id.in_(hosts)).all()
+    return hosts_query.all()
 
 
 def host_create(values):
@@ -685,31 +1279,32 @@ def host_create(values):
     host.update(values)
 
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         try:
             host.save(session=session)
         except common_db_exc.DBDuplicateEntry as e:
             # raise exception about duplicated columns (e.columns)
             raise db_exc.BlazarDBDuplicateEntry(
                 model=host.__class__.__name__, columns=e.columns)
+        _inserted(host)
 
-    return host_get(host.id)
+    return host
 
 
 def host_update(host_id, values):
     session = get_session()
 
-    with session.begin():
+    with session.begin(subtransactions=True):
         host = _host_get(session, host_id)
         host.update(values)
         host.save(session=session)
 
-    return host_get(host_id)
+    return host
 
 
 def host_destroy(host_id):
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         host = _host_get(session, host_id)
 
         if not host:
@@ -742,11 +1337,12 @@ def host_extra_capability_get_all_per_host(host_id):
 
 def host_extra_capability_create(values):
     values = values.copy()
+    values['numeric_value'] = _numeric_value(values.get('capability_value'))
     host_extra_capability = models.ComputeHostExtraCapability()
     host_extra_capability.update(values)
 
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         try:
             host_extra_capability.save(session=session)
         except common_db_exc.DBDuplicateEntry as e:
@@ -754,26 +1350,31 @@ def host_extra_capability_create(values):
             raise db_exc.BlazarDBDuplicateEntry(
                 model=host_extra_capability.__class__.__name__,
                 columns=e.columns)
+        _inserted(host_extra_capability)
 
-    return host_extra_capability_get(host_extra_capability.id)
+    return host_extra_capability
 
 
 def host_extra_capability_update(host_extra_capability_id, values):
     session = get_session()
 
-    with session.begin():
+    with session.begin(subtransactions=True):
         host_extra_capability = (
             _host_extra_capability_get(session,
                                        host_extra_capability_id))
+        values = values.copy()
+        if 'capability_value' in values:
+            values['numeric_value'] = _numeric_value(
+                values['capability_value'])
         host_extra_capability.update(values)
         host_extra_capability.save(session=session)
 
-    return host_extra_capability_get(host_extra_capability_id)
+    return host_extra_capability
 
 
 def host_extra_capability_destroy(host_extra_capability_id):
     session = get_session()
-    with session.begin():
+    with session.begin(subtransactions=True):
         host_extra_capability = (
             _host_extra_capability_get(session,
                                        host_extra_capability_id))
@@ -790,6 +1391,91 @@ def host_extra_capability_destroy(host_extra_capability_id):
 def host_extra_capability_get_all_per_name(host_id, capability_name):
     session = get_session()
 
-    with session.begin():
+    with session.begin(subtransactions=True):
         query = _host_extra_capability_get_all_per_host(session, host_id)
         return query.filter_by(capability_name=capability_name).all()
+
+
+# Archive of the finished leases
+
+# Tables archived with the leases, along with the column referring to the
+# lease or reservation of their rows. Dependent rows come first so that they
+# are moved before the rows they refer to.
+ARCHIVED_TABLES = (('computehost_allocations', 'reservation_id'),
+                   ('computehost_reservations', 'reservation_id'),
+                   ('instance_reservations', 'reservation_id'),
+                   ('events', 'lease_id'),
+                   ('reservations', 'lease_id'),
+                   ('leases', 'id'))
+
+
+def _move_lease_rows(session, tables, lease_ids, shadow=None):
+    """Deletes the rows of the leases, copying them to the shadow tables.
+
+    :param tables: Tables to delete the rows from, by name.
+    :param shadow: Tables to copy the rows to by name, if any.
+    """
+    reservations = tables['reservations']
+    reservation_ids = [
+        row.id for row in session.execute(
+            sa.select([reservations.c.id]).where(
+                reservations.c.lease_id.in_(lease_ids)))]
+    ids = {'lease_id': lease_ids, 'id': lease_ids,
+           'reservation_id': reservation_ids}
+    for name, column in ARCHIVED_TABLES:
+        if not ids[column]:
+            continue
+        table = tables[name]
+        where = table.c[column].in_(ids[column])
+        if shadow is not None:
+            session.execute(shadow[name].insert().from_select(
+                [c.name for c in table.columns],
+                sa.select([table]).where(where)))
+        session.execute(table.delete().where(where))
+    facade_wrapper.expire_shared_session(session)
+
+
+def archive_leases(before, batch_size):
+    """Moves a batch of finished leases to the shadow tables.
+
+    A lease is finished when it ended before the given date and none of its
+    events are still to run. Its reservations, events and allocations are
+    moved along with it.
+
+    :returns: The number of leases archived.
+    """
+    session = get_session()
+    with session.begin(subtransactions=True):
+        lease_ids = [
+            row.id for row in
+            session.query(models.Lease.id)
+            .filter(models.Lease.end_date < before)
+            .filter(~models.Lease.events.any(
+                models.Event.status.in_(['UNDONE', 'IN_PROGRESS'])))
+            .order_by(models.Lease.end_date)
+            .limit(batch_size)]
+        if lease_ids:
+            tables = dict((name, model_base.BlazarBase.metadata.tables[name])
+                          for name, _column in ARCHIVED_TABLES)
+            _move_lease_rows(session, tables, lease_ids,
+                             shadow=models.SHADOW_TABLES)
+    return len(lease_ids)
+
+
+def purge_archived_leases(before, batch_size):
+    """Deletes a batch of archived leases which ended before the given date.
+
+    :returns: The number of leases purged.
+    """
+    shadow_leases = models.SHADOW_TABLES['leases']
+    session = get_session()
+    with session.begin(subtransactions=True):
+        lease_ids = [
+            row.id for row in session.execute(
+                sa.select([shadow_leases.c.id])
+                .where(shadow_leases.c.end_date < before)
+                .order_by(shadow_leases.c.end_date)
+                .limit(batch_size))]
+        if lease_ids:
+            _move_lease_rows(session, models.SHADOW_TABLES, lease_ids)
+    return len(lease_ids)
@@ -13,17 +13,199 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import sys
+import threading
+
 from oslo_config import cfg
 from oslo_db.sqlalchemy import session as db_session
+from oslo_log import log as logging
+import six
+import sqlalchemy as sa
 
 
 CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
 
 _engine_facade = None
+_transaction = threading.local()
+
+
+def get_session(use_slave=False):
+    """Returns the session to run a DB API call in.
+
+    With use_slave, the call only reads from the DB and its session is bound
+    to the replica set by [database]/slave_connection, if any. The primary is
+    read instead within a transaction, once a unit of work wrote to the DB
+    and within read_primary(), so that what was written is read back.
+    """
+    session = getattr(_transaction, 'session', None)
+    if use_slave and _read_replica(session):
+        if session is None:
+            return _get_facade().get_session(use_slave=True)
+        reader = getattr(_transaction, 'reader', None)
+        if reader is None:
+            reader = _bound_session(use_slave=True)
+            _transaction.reader = reader
+        return reader
+    if session is None:
+        session = _get_facade().get_session()
+    return session
+
+
+def _read_replica(session):
+    if getattr(_transaction, 'primary', False):
+        return False
+    if session is not None and (session.transaction is not None or
+                                getattr(_transaction, 'written', False)):
+        return False
+    facade = _get_facade()
+    return facade.get_engine(use_slave=True) is not facade.get_engine()
+
+
+def _bound_session(use_slave=False):
+    """Returns a session bound to a connection of its own."""
+    connection = _get_facade().get_engine(use_slave=use_slave).connect()
+    return _get_facade().get_session(use_slave=use_slave, bind=connection)
+
+
+def _close_bound_session(session):
+    session.close()
+    session.bind.close()
+
+
+def _written(session, transaction, connection):
+    _transaction.written = True
+
+
+@contextlib.contextmanager
+def unit_of_work(transactional=False):
+    """Runs the DB API calls of the current thread in a single session.
+
+    Sessions returned by get_session() in the block are the same session,
+    bound to a single connection checked out of the pool for the whole block.
+    Read-only calls made before the block first writes to the DB share a
+    session bound to the replica instead, if any. With transactional, the
+    block also runs in a single transaction, as with transaction(). Nested
+    blocks join the outermost unit of work.
+    """
+    if getattr(_transaction, 'session', None) is not None:
+        if transactional:
+            with transaction():
+                yield
+        else:
+            yield
+        return
+
+    session = _bound_session()
+    sa.event.listen(session, 'after_begin', _written)
+    _transaction.session = session
+    try:
+        if transactional:
+            with _begin(session):
+                yield
+        else:
+            yield
+    finally:
+        reader = getattr(_transaction, 'reader', None)
+        _transaction.session = None
+        _transaction.reader = None
+        _transaction.written = False
+        _close_bound_session(session)
+        if reader is not None:
+            _close_bound_session(reader)
+
+
+def expire_shared_session(session):
+    """Expires the objects of session if it is shared by several calls.
+
+    To be called after a write bypassing the identity map of the session,
+    e.g. a bulk insert or a Core update, so that the objects loaded before
+    it by the calls of a unit of work or transaction are read again rather
+    than returned stale. Pending changes are flushed first.
+    """
+    if session is getattr(_transaction, 'session', None):
+        session.flush()
+        session.expire_all()
+
+
+@contextlib.contextmanager
+def transaction():
+    """Runs the DB API calls of the current thread in a single transaction.
+
+    Sessions returned by get_session() in the block share the transaction,
+    which is committed at the end of the block or rolled back if it raises.
+    Nested blocks are part of the outermost transaction. Within a unit of
+    work, the transaction is run by the session of the unit of work.
+    """
+    session = getattr(_transaction, 'session', None)
+    if session is not None:
+        if session.transaction is not None:
+            yield
+        else:
+            with _begin(session):
+                yield
+        return
+
+    session = _get_facade().get_session()
+    _transaction.session = session
+    try:
+        with _begin(session):
+            yield
+    finally:
+        _transaction.session = None
+
+
+@contextlib.contextmanager
+def _begin(session):
+    """Runs the block in a transaction of session.
+
+    The callbacks registered with after_rollback() in the block are called if
+    the transaction is rolled back.
+    """
+    _transaction.rollback_callbacks = []
+    try:
+        with session.begin():
+            yield
+    except Exception:
+        exc_info = sys.exc_info()
+        for callback in reversed(_transaction.rollback_callbacks):
+            try:
+                callback()
+            except Exception:
+                LOG.exception('Error occurred while rolling back %s.',
+                              callback)
+        six.reraise(*exc_info)
+    finally:
+        _transaction.rollback_callbacks = None
+
+
+def after_rollback(callback):
+    """Calls callback if the current transaction is rolled back.
+
+    To undo the changes of in-memory state matching what the transaction
+    wrote. Callbacks are called in the reverse order of their registration.
+    Outside of transaction() or of a transactional unit of work, the DB
+    calls are committed as they return and callback is never called.
+    """
+    callbacks = getattr(_transaction, 'rollback_callbacks', None)
+    if callbacks is not None:
+        callbacks.append(callback)
+
 
+@contextlib.contextmanager
+def read_primary():
+    """Runs the read-only DB API calls of the current thread on the primary.
 
-def get_session():
-    return _get_facade().get_session()
+    To be used where the thread reads back what it wrote outside of a
+    transaction or unit of work.
+    """
+    primary = getattr(_transaction, 'primary', False)
+    _transaction.primary = True
+    try:
+        yield
+    finally:
+        _transaction.primary = primary
 
 
 def get_engine():
@@ -43,6 +43,15 @@ class _BlazarBase(models.ModelBase, models.TimestampMixin):
 
         return d
 
+    def is_loaded(self, attr_name):
+        """Returns whether an attribute is loaded.
+
+        Relationships which are not loaded are left out of the dicts of the
+        models, as they would be queried or, loaded with the 'raise'
+        strategy, raise.
+        """
+        return attr_name not in attributes.instance_state(self).unloaded
+
 
 def datetime_to_str(dct, attr_name):
     if dct.get(attr_name) is not None:
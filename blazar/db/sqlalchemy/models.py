@@ -48,6 +48,10 @@ class Lease(mb.BlazarBase):
     """Contains all info about lease."""
 
     __tablename__ = 'leases'
+    __table_args__ = (
+        sa.Index('ix_leases_project_id', 'project_id'),
+        sa.Index('ix_leases_start_date_end_date', 'start_date', 'end_date'),
+    )
 
     id = _id_column()
     name = sa.Column(sa.String(80), nullable=False)
@@ -66,8 +70,10 @@ class Lease(mb.BlazarBase):
 
     def to_dict(self):
         d = super(Lease, self).to_dict()
-        d['reservations'] = [r.to_dict() for r in self.reservations]
-        d['events'] = [e.to_dict() for e in self.events]
+        if self.is_loaded('reservations'):
+            d['reservations'] = [r.to_dict() for r in self.reservations]
+        if self.is_loaded('events'):
+            d['events'] = [e.to_dict() for e in self.events]
         return d
 
 
@@ -75,6 +81,9 @@ class Reservation(mb.BlazarBase):
     """Specifies group of nodes within a cluster."""
 
     __tablename__ = 'reservations'
+    __table_args__ = (
+        sa.Index('ix_reservations_lease_id', 'lease_id'),
+    )
 
     id = _id_column()
     lease_id = sa.Column(sa.String(36),
@@ -102,42 +111,67 @@ class Reservation(mb.BlazarBase):
     def to_dict(self):
         d = super(Reservation, self).to_dict()
 
-        if self.computehost_reservations:
-
-            res = self.computehost_reservations.to_dict()
-            d['hypervisor_properties'] = res['hypervisor_properties']
-            d['resource_properties'] = res['resource_properties']
-            d['before_end'] = res['before_end']
-
-            if res['count_range']:
-                try:
-                    minMax = res['count_range'].split('-', 1)
-                    (d['min'], d['max']) = map(int, minMax)
-                except ValueError:
-                    # FIXME: https://bugs.launchpad.net/climate/+bug/1300132
-                    # LOG.error(
-                    # "Invalid Range: {0}".format(res['count_range']))
-                    e = "Invalid count range: {0}".format(res['count_range'])
-                    raise RuntimeError(e)
-
-        if self.instance_reservations:
-            ir_keys = ['vcpus', 'memory_mb', 'disk_gb', 'amount', 'affinity',
-                       'flavor_id', 'aggregate_id', 'server_group_id']
-            d.update(self.instance_reservations.to_dict(include=ir_keys))
-
-        return d
+        host_reservation = instance_reservation = None
+        if (self.is_loaded('computehost_reservations') and
+                self.computehost_reservations):
+            host_reservation = self.computehost_reservations.to_dict()
+        if (self.is_loaded('instance_reservations') and
+                self.instance_reservations):
+            instance_reservation = self.instance_reservations.to_dict(
+                include=INSTANCE_RESERVATION_KEYS)
+        return add_reservation_details(d, host_reservation,
+                                       instance_reservation)
+
+
+# Keys of an instance reservation added to the dict of its reservation
+INSTANCE_RESERVATION_KEYS = ['vcpus', 'memory_mb', 'disk_gb', 'amount',
+                             'affinity', 'flavor_id', 'aggregate_id',
+                             'server_group_id']
+
+
+def add_reservation_details(d, host_reservation=None,
+                            instance_reservation=None):
+    """Adds the details of a host or instance reservation to its dict."""
+    if host_reservation:
+        res = host_reservation
+        d['hypervisor_properties'] = res['hypervisor_properties']
+        d['resource_properties'] = res['resource_properties']
+        d['before_end'] = res['before_end']
+
+        if res['count_range']:
+            try:
+                minMax = res['count_range'].split('-', 1)
+                (d['min'], d['max']) = map(int, minMax)
+            except ValueError:
+                # FIXME: https://bugs.launchpad.net/climate/+bug/1300132
+                # LOG.error(
+                # "Invalid Range: {0}".format(res['count_range']))
+                e = "Invalid count range: {0}".format(res['count_range'])
+                raise RuntimeError(e)
+
+    if instance_reservation:
+        d.update((key, instance_reservation[key])
+                 for key in INSTANCE_RESERVATION_KEYS)
+
+    return d
 
 
 class Event(mb.BlazarBase):
     """An events occurring with the lease."""
 
     __tablename__ = 'events'
+    __table_args__ = (
+        sa.Index('ix_events_status_time', 'status', 'time'),
+        sa.Index('ix_events_lease_id_event_type', 'lease_id', 'event_type'),
+    )
 
     id = _id_column()
     lease_id = sa.Column(sa.String(36), sa.ForeignKey('leases.id'))
     event_type = sa.Column(sa.String(66))
     time = sa.Column(sa.DateTime)
     status = sa.Column(sa.String(13))
+    claimed_by = sa.Column(sa.String(255))
+    claimed_at = sa.Column(sa.DateTime)
 
     def to_dict(self):
         return super(Event, self).to_dict()
@@ -151,6 +185,10 @@ class ComputeHostReservation(mb.BlazarBase):
     """
 
     __tablename__ = 'computehost_reservations'
+    __table_args__ = (
+        sa.Index('ix_computehost_reservations_reservation_id',
+                 'reservation_id'),
+    )
 
     id = _id_column()
     reservation_id = sa.Column(sa.String(36), sa.ForeignKey('reservations.id'))
@@ -169,6 +207,10 @@ class InstanceReservations(mb.BlazarBase):
     """The definition of a flavor of the reservation."""
 
     __tablename__ = 'instance_reservations'
+    __table_args__ = (
+        sa.Index('ix_instance_reservations_reservation_id',
+                 'reservation_id'),
+    )
 
     id = _id_column()
     reservation_id = sa.Column(sa.String(36), sa.ForeignKey('reservations.id'))
@@ -186,6 +228,12 @@ class ComputeHostAllocation(mb.BlazarBase):
     """Mapping between ComputeHost, ComputeHostReservation and Reservation."""
 
     __tablename__ = 'computehost_allocations'
+    __table_args__ = (
+        sa.Index('ix_computehost_allocations_compute_host_id',
+                 'compute_host_id'),
+        sa.Index('ix_computehost_allocations_reservation_id',
+                 'reservation_id'),
+    )
 
     id = _id_column()
     compute_host_id = sa.Column(sa.String(36),
@@ -234,11 +282,54 @@ class ComputeHostExtraCapability(mb.BlazarBase):
     """
 
     __tablename__ = 'computehost_extra_capabilities'
+    __table_args__ = (
+        sa.Index('ix_computehost_extra_capabilities_host_name',
+                 'computehost_id', 'capability_name'),
+        sa.Index('ix_computehost_extra_capabilities_name_numeric_value',
+                 'capability_name', 'numeric_value'),
+    )
 
     id = _id_column()
     computehost_id = sa.Column(sa.String(36), sa.ForeignKey('computehosts.id'))
     capability_name = sa.Column(sa.String(64), nullable=False)
     capability_value = sa.Column(MediumText(), nullable=False)
+    # capability_value as a number, NULL if it is not one
+    numeric_value = sa.Column(sa.Numeric(65, 30, asdecimal=False),
+                              nullable=True)
 
     def to_dict(self):
         return super(ComputeHostExtraCapability, self).to_dict()
+
+
+# Shadow tables, to which finished leases and their dependent rows are
+# archived. They have the columns of the tables they shadow, without their
+# foreign keys.
+
+SHADOW_TABLE_PREFIX = 'shadow_'
+
+ARCHIVED_MODELS = (Lease, Reservation, Event, ComputeHostReservation,
+                   InstanceReservations, ComputeHostAllocation)
+
+# Column of each shadow table the archived rows are looked up by when they
+# are purged
+SHADOW_INDEXED_COLUMNS = {'leases': 'end_date',
+                          'reservations': 'lease_id',
+                          'events': 'lease_id',
+                          'computehost_reservations': 'reservation_id',
+                          'instance_reservations': 'reservation_id',
+                          'computehost_allocations': 'reservation_id'}
+
+
+def _shadow_table(table):
+    name = SHADOW_TABLE_PREFIX + table.name
+    indexed_column = SHADOW_INDEXED_COLUMNS[table.name]
+    columns = [sa.Column(column.name, column.type,
+                         primary_key=column.primary_key,
+                         nullable=column.nullable)
+               for column in table.columns]
+    return sa.Table(name, mb.BlazarBase.metadata, *columns + [
+        sa.Index('ix_%s_%s' % (name, indexed_column), indexed_column)])
+
+
+SHADOW_TABLES = dict((model.__tablename__, _shadow_table(model.__table__))
+                     for model in ARCHIVED_MODELS)
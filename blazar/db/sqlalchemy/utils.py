@@ -31,7 +31,7 @@ def get_backend():
 
 
 def _get_leases_from_resource_id(resource_id, start_date, end_date):
-    session = get_session()
+    session = get_session(use_slave=True)
     border0 = sa.and_(models.Lease.start_date < start_date,
                       models.Lease.end_date < start_date)
     border1 = sa.and_(models.Lease.start_date > end_date,
@@ -44,7 +44,7 @@ def _get_leases_from_resource_id(resource_id, start_date, end_date):
 
 
 def _get_leases_from_host_id(host_id, start_date, end_date):
-    session = get_session()
+    session = get_session(use_slave=True)
     border0 = sa.and_(models.Lease.start_date < start_date,
                       models.Lease.end_date < start_date)
     border1 = sa.and_(models.Lease.start_date > end_date,
@@ -58,7 +58,7 @@ def _get_leases_from_host_id(host_id, start_date, end_date):
 
 
 def get_reservations_by_host_id(host_id, start_date, end_date):
-    session = get_session()
+    session = get_session(use_slave=True)
     border0 = sa.and_(models.Lease.start_date < start_date,
                       models.Lease.end_date < start_date)
     border1 = sa.and_(models.Lease.start_date > end_date,
@@ -104,11 +104,11 @@ def _get_events(host_id, start_date, end_date):
             max_date = end_date
         else:
             max_date = lease.end_date
-        if min_date in events.keys():
+        if min_date in events:
             events[min_date]['quantity'] += 1
         else:
             events[min_date] = {'quantity': 1}
-        if max_date in events.keys():
+        if max_date in events:
             events[max_date]['quantity'] -= 1
         else:
             events[max_date] = {'quantity': -1}
@@ -181,6 +181,74 @@ def get_reserved_periods(host_id, start_date, end_date, duration):
     return _merge_periods(reserved_periods, start_date, end_date, duration)
 
 
+# Maximum number of host IDs in the IN clause of a query
+_IN_BATCH_SIZE = 500
+
+
+def get_hosts_availability(host_ids, start_date, end_date,
+                           reserved_periods=False, inclusive=False):
+    """Returns the availability of hosts during a period.
+
+    The periods of the leases allocating the hosts during the period are
+    read by a single query, grouped by host and period. The reserved periods
+    of every host are then found by sweeping its lease periods in start
+    order, merging the overlapping ones.
+
+    :param host_ids: the hosts to consider
+    :param start_date: start datetime of the period
+    :param end_date: end datetime of the period
+    :param reserved_periods: whether to return the reserved periods of the
+                             hosts rather than whether they are free
+    :param inclusive: whether the leases ending when the period starts, or
+                      starting when it ends, overlap it, as for
+                      get_reservations_by_host_id
+    :returns: a dict giving for every host whether it is free for the whole
+              period or, with reserved_periods, the list of its reserved
+              periods within the period, as (start, end) tuples in start
+              order
+    """
+    allocations = models.ComputeHostAllocation.__table__
+    reservations = models.Reservation.__table__
+    leases = models.Lease.__table__
+    if inclusive:
+        overlap = sa.and_(leases.c.start_date <= end_date,
+                          leases.c.end_date >= start_date)
+    else:
+        overlap = sa.and_(leases.c.start_date < end_date,
+                          leases.c.end_date > start_date)
+    query = sa.select([allocations.c.compute_host_id,
+                       leases.c.start_date, leases.c.end_date]).select_from(
+        allocations.join(
+            reservations,
+            reservations.c.id == allocations.c.reservation_id).join(
+            leases, leases.c.id == reservations.c.lease_id)).where(
+        overlap).group_by(
+        allocations.c.compute_host_id, leases.c.start_date,
+        leases.c.end_date)
+
+    periods = dict((host_id, []) for host_id in host_ids)
+    session = get_session(use_slave=True)
+    host_ids = list(periods)
+    for i in range(0, len(host_ids), _IN_BATCH_SIZE):
+        for host_id, lease_start, lease_end in session.execute(query.where(
+                allocations.c.compute_host_id.in_(
+                    host_ids[i:i + _IN_BATCH_SIZE]))):
+            periods[host_id].append((max(lease_start, start_date),
+                                     min(lease_end, end_date)))
+
+    availability = {}
+    for host_id, host_periods in periods.items():
+        merged = []
+        for start, end in sorted(host_periods):
+            if merged and start <= merged[-1][1]:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        availability[host_id] = merged if reserved_periods else not merged
+    return availability
+
+
 def reservation_ratio(host_id, start_date, end_date):
     res_time = reservation_time(host_id, start_date, end_date).seconds
     return float(res_time) / (end_date - start_date).seconds
@@ -210,7 +278,7 @@ def number_of_reservations(host_id, start_date, end_date):
 def longest_lease(host_id, start_date, end_date):
     max_duration = datetime.timedelta(0)
     longest_lease = None
-    session = get_session()
+    session = get_session(use_slave=True)
     query = (session.query(models.Lease).join(models.Reservation)
              .join(models.ComputeHostAllocation)
              .filter(models.ComputeHostAllocation.compute_host_id == host_id)
@@ -228,7 +296,7 @@ def shortest_lease(host_id, start_date, end_date):
     # TODO(frossigneux) Fix max timedelta
     min_duration = datetime.timedelta(365 * 1000)
     longest_lease = None
-    session = get_session()
+    session = get_session(use_slave=True)
     query = (session.query(models.Lease).join(models.Reservation)
              .join(models.ComputeHostAllocation)
              .filter(models.ComputeHostAllocation.compute_host_id == host_id)
@@ -118,6 +118,18 @@ def get_reserved_periods(resource_id, start_date, end_date, duration):
                                      duration)
 
 
+def get_hosts_availability(host_ids, start_date, end_date,
+                           reserved_periods=False, inclusive=False):
+    """Returns whether hosts are free during a period, by host.
+
+    With reserved_periods, the reserved periods of every host are returned
+    instead. With inclusive, the leases only touching the period overlap it.
+    """
+    return IMPL.get_hosts_availability(host_ids, start_date, end_date,
+                                       reserved_periods=reserved_periods,
+                                       inclusive=inclusive)
+
+
 def reservation_ratio(resource_id, start_date, end_date):
     return IMPL.reservation_ratio(resource_id, start_date, end_date)
 
@@ -0,0 +1,226 @@
+# Copyright (c) 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory index of the periods during which compute hosts are allocated.
+
+blazar-manager keeps one index, shared by the plugins allocating compute
+hosts, to check which hosts are free for a period without querying the DB
+for every candidate host. The index is loaded from the DB and then updated
+by the plugins as they allocate and release hosts, and these updates are
+undone if the DB transaction making them is rolled back. It may miss
+allocations made by other managers, so the hosts it picks must be checked
+against the DB, and it must be reloaded when they are not free there.
+"""
+
+import bisect
+
+from oslo_log import log as logging
+
+from blazar.db import api as db_api
+
+LOG = logging.getLogger(__name__)
+
+
+class HostPeriods(object):
+    """Allocated periods of a host, sorted by start date.
+
+    The periods of the allocations of several reservations may overlap,
+    e.g. for instance reservations sharing a host.
+    """
+
+    def __init__(self):
+        self.periods = []
+        self._starts = None
+        self._max_ends = None
+
+    def add(self, start_date, end_date, reservation_id):
+        bisect.insort(self.periods, (start_date, end_date, reservation_id))
+        self._starts = None
+
+    def remove(self, reservation_id):
+        self.periods = [period for period in self.periods
+                        if period[2] != reservation_id]
+        self._starts = None
+
+    def is_free(self, start_date, end_date, ignored_reservation=None):
+        """Returns whether no allocation overlaps the period.
+
+        Allocations ending when the period starts, or starting when it ends,
+        do not overlap it.
+        """
+        if self._starts is None:
+            # NOTE: _max_ends[i] is the latest end of the first i + 1
+            # periods, so that the periods starting before end_date overlap
+            # the period if the latest of their ends is after start_date.
+            self._starts = [period[0] for period in self.periods]
+            self._max_ends = []
+            for period in self.periods:
+                self._max_ends.append(max(period[1], self._max_ends[-1])
+                                      if self._max_ends else period[1])
+        count = bisect.bisect_left(self._starts, end_date)
+        if ignored_reservation is None:
+            return not count or self._max_ends[count - 1] <= start_date
+        return not any(period[1] > start_date
+                       for period in self.periods[:count]
+                       if period[2] != ignored_reservation)
+
+
+class HostAllocationIndex(object):
+    """Allocated periods of the compute hosts, by host."""
+
+    def __init__(self):
+        self.loaded = False
+        self._hosts = {}
+        self._reservations = {}
+
+    def load(self):
+        """Builds the index from the allocations in the DB."""
+        hosts = {}
+        reservations = {}
+        allocations = db_api.host_allocation_get_all_with_dates()
+        for allocation in allocations:
+            reservation = reservations.setdefault(
+                allocation['reservation_id'],
+                [allocation['start_date'], allocation['end_date'], set()])
+            reservation[2].add(allocation['compute_host_id'])
+            hosts.setdefault(allocation['compute_host_id'],
+                             HostPeriods()).add(allocation['start_date'],
+                                                allocation['end_date'],
+                                                allocation['reservation_id'])
+        self._hosts = hosts
+        self._reservations = reservations
+        self.loaded = True
+        # NOTE: the allocations read in a transaction may be rolled back.
+        db_api.after_rollback(self._invalidate)
+        LOG.debug('Loaded %(allocations)d allocations of %(hosts)d hosts '
+                  'into the allocation index.',
+                  {'allocations': len(allocations), 'hosts': len(hosts)})
+
+    def refresh(self, host_ids):
+        """Reloads the allocations of hosts from the DB.
+
+        To correct the index for the hosts it is found out of date for,
+        without reloading the allocations of every host.
+        """
+        host_ids = set(host_ids)
+        allocations = db_api.host_allocation_get_all_with_dates(
+            host_ids=host_ids)
+        for host_id in host_ids:
+            periods = self._hosts.get(host_id)
+            for period in list(periods.periods) if periods else []:
+                self._remove(period[2], [host_id])
+        for allocation in allocations:
+            self._add(allocation['reservation_id'],
+                      [allocation['compute_host_id']],
+                      allocation['start_date'], allocation['end_date'])
+        db_api.after_rollback(self._invalidate)
+        LOG.debug('Refreshed the allocations of %(hosts)d hosts in the '
+                  'allocation index.', {'hosts': len(host_ids)})
+
+    def add(self, reservation_id, host_ids, start_date, end_date):
+        """Adds the allocations of hosts to a reservation.
+
+        The allocations are removed if the current DB transaction is rolled
+        back.
+        """
+        added = self._add(reservation_id, host_ids, start_date, end_date)
+        if added:
+            db_api.after_rollback(
+                lambda: self._remove(reservation_id, added))
+
+    def remove(self, reservation_id, host_ids=None):
+        """Removes the allocations of a reservation, by default all of them.
+
+        The allocations are added back if the current DB transaction is
+        rolled back.
+        """
+        reservation = self._reservations.get(reservation_id)
+        if reservation is None:
+            return
+        start_date, end_date = reservation[0], reservation[1]
+        removed = self._remove(reservation_id, host_ids)
+        if removed:
+            db_api.after_rollback(
+                lambda: self._add(reservation_id, removed, start_date,
+                                  end_date))
+
+    def move(self, reservation_id, start_date, end_date):
+        """Changes the period of the allocations of a reservation."""
+        reservation = self._reservations.get(reservation_id)
+        if reservation is None or (reservation[0], reservation[1]) == (
+                start_date, end_date):
+            return
+        host_ids = set(reservation[2])
+        self.remove(reservation_id)
+        self.add(reservation_id, host_ids, start_date, end_date)
+
+    def _add(self, reservation_id, host_ids, start_date, end_date):
+        reservation = self._reservations.setdefault(
+            reservation_id, [start_date, end_date, set()])
+        added = set()
+        for host_id in host_ids:
+            if host_id in reservation[2]:
+                continue
+            reservation[2].add(host_id)
+            added.add(host_id)
+            self._hosts.setdefault(host_id, HostPeriods()).add(
+                reservation[0], reservation[1], reservation_id)
+        if not reservation[2]:
+            del self._reservations[reservation_id]
+        return added
+
+    def _remove(self, reservation_id, host_ids=None):
+        reservation = self._reservations.get(reservation_id)
+        if reservation is None:
+            return set()
+        removed = set(reservation[2] if host_ids is None
+                      else set(host_ids) & reservation[2])
+        for host_id in removed:
+            reservation[2].discard(host_id)
+            periods = self._hosts[host_id]
+            periods.remove(reservation_id)
+            if not periods.periods:
+                del self._hosts[host_id]
+        if not reservation[2]:
+            del self._reservations[reservation_id]
+        return removed
+
+    def _invalidate(self):
+        self.loaded = False
+
+    def is_allocated(self, host_id):
+        """Returns whether the host has any allocation."""
+        return host_id in self._hosts
+
+    def is_free(self, host_id, start_date, end_date,
+                ignored_reservation=None):
+        """Returns whether the host is free for the whole period.
+
+        :param ignored_reservation: ID of a reservation whose allocations
+            are not taken into account.
+        """
+        periods = self._hosts.get(host_id)
+        return periods is None or periods.is_free(start_date, end_date,
+                                                  ignored_reservation)
+
+
+_INDEX = HostAllocationIndex()
+
+
+def get_index():
+    """Returns the allocation index of the manager, loaded."""
+    if not _INDEX.loaded:
+        _INDEX.load()
+    return _INDEX
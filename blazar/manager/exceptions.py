@@ -170,3 +170,40 @@ class InvalidRange(exceptions.BlazarException):
 class CantUpdateParameter(exceptions.BlazarException):
     code = 409
     msg_fmt = _("%(param)s cannot be updated")
+
+
+class TooManyLeases(exceptions.BlazarException):
+    code = 400
+    msg_fmt = _("A bulk request can create at most %(max)s leases, "
+                "%(count)s given")
+
+
+class BulkLeaseCreationFailed(exceptions.BlazarException):
+    code = 409
+    msg_fmt = _("No lease was created because lease %(index)s failed: "
+                "%(error)s")
+
+
+class InvalidSortKey(exceptions.BlazarException):
+    code = 400
+    msg_fmt = _("Leases cannot be sorted by %(sort_key)s")
+
+
+class InvalidSortDir(exceptions.BlazarException):
+    code = 400
+    msg_fmt = _("Sort direction must be 'asc' or 'desc', not %(sort_dir)s")
+
+
+class InvalidLeaseFilter(exceptions.BlazarException):
+    code = 400
+    msg_fmt = _("Leases cannot be filtered by %(filter)s")
+
+
+class MarkerNotFound(exceptions.BlazarException):
+    code = 400
+    msg_fmt = _("Marker lease %(marker)s could not be found")
+
+
+class InvalidLeaseField(exceptions.BlazarException):
+    code = 400
+    msg_fmt = _("%(field)s is not a field of leases")
@@ -0,0 +1,133 @@
+# Copyright (c) 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Metrics of the events run by blazar-manager."""
+
+import bisect
+import collections
+
+# Upper bounds in seconds of the histogram buckets. A last bucket counts the
+# values above the last bound.
+BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+
+class Histogram(object):
+    """Distribution of durations in seconds."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """Returns the upper bound of the bucket holding the percentile.
+
+        Returns the maximum observed value if the percentile is above the
+        last bound, and None if nothing was observed.
+        """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        buckets = [[bound, count]
+                   for bound, count in zip(self.buckets, self.counts)]
+        buckets.append(['+Inf', self.counts[-1]])
+        return {'count': self.count,
+                'sum': self.sum,
+                'max': self.max,
+                'buckets': buckets}
+
+
+class EventMetrics(object):
+    """Lag, duration and outcome of events and reservation actions.
+
+    The lag of an event is the delay between its scheduled time and the
+    moment the manager claims it. Events are counted per event type, and
+    reservation actions per resource type and action, e.g.
+    'physical:host:on_start'.
+    """
+
+    def __init__(self):
+        self.lag = collections.defaultdict(Histogram)
+        self.duration = collections.defaultdict(Histogram)
+        self.outcomes = collections.defaultdict(collections.Counter)
+        self.action_duration = collections.defaultdict(Histogram)
+        self.action_outcomes = collections.defaultdict(collections.Counter)
+
+    def record_lag(self, event_type, seconds):
+        self.lag[event_type].observe(seconds)
+
+    def record_event(self, event_type, seconds, status):
+        self.duration[event_type].observe(seconds)
+        self.outcomes[event_type][status] += 1
+
+    def record_action(self, resource_type, action, seconds, success):
+        key = '%s:%s' % (resource_type, action)
+        self.action_duration[key].observe(seconds)
+        self.action_outcomes[key]['success' if success else 'failure'] += 1
+
+    def to_dict(self):
+        def histograms(values):
+            return dict((key, histogram.to_dict())
+                        for key, histogram in values.items())
+
+        def counters(values):
+            return dict((key, dict(counter))
+                        for key, counter in values.items())
+
+        return {'events': {'lag': histograms(self.lag),
+                           'duration': histograms(self.duration),
+                           'outcomes': counters(self.outcomes)},
+                'actions': {'duration': histograms(self.action_duration),
+                            'outcomes': counters(self.action_outcomes)}}
+
+    def summary(self):
+        """Returns a one line summary of the events metrics."""
+        parts = []
+        for event_type in sorted(set(self.lag) | set(self.duration)):
+            lag = self.lag[event_type]
+            duration = self.duration[event_type]
+            outcomes = ', '.join(
+                '%s %d' % item
+                for item in sorted(self.outcomes[event_type].items()))
+            parts.append('%s: %d claimed, lag p95 %s max %.1fs, %d run '
+                         '(%s), duration p95 %s max %.1fs'
+                         % (event_type, lag.count,
+                            _format_bound(lag.percentile(95)), lag.max,
+                            duration.count, outcomes or 'none',
+                            _format_bound(duration.percentile(95)),
+                            duration.max))
+        return '; '.join(parts) or 'no events'
+
+
+def _format_bound(bound):
+    if bound is None:
+        return '-'
+    return '<=%ss' % bound
@@ -26,18 +26,26 @@ class ManagerRPCAPI(service.RPCClient):
         """Initiate RPC API client with needed topic and RPC version."""
         super(ManagerRPCAPI, self).__init__(manager.get_target())
 
-    def get_lease(self, lease_id):
-        """Get detailed info about some lease."""
-        return self.call('get_lease', lease_id=lease_id)
+    def get_lease(self, lease_id, fields=None):
+        """Get detailed info about some lease, or some of its fields."""
+        return self.call('get_lease', lease_id=lease_id, fields=fields)
 
-    def list_leases(self, project_id=None):
-        """List all leases."""
-        return self.call('list_leases', project_id=project_id)
+    def list_leases(self, project_id=None, limit=None, marker=None,
+                    sort_key=None, sort_dir=None, filters=None, fields=None):
+        """List leases, filtered, sorted and paginated."""
+        return self.call('list_leases', project_id=project_id, limit=limit,
+                         marker=marker, sort_key=sort_key, sort_dir=sort_dir,
+                         filters=filters, fields=fields)
 
     def create_lease(self, lease_values):
         """Create lease with specified parameters."""
         return self.call('create_lease', lease_values=lease_values)
 
+    def create_leases(self, leases_values, all_or_nothing=False):
+        """Create several leases with specified parameters."""
+        return self.call('create_leases', leases_values=leases_values,
+                         all_or_nothing=all_or_nothing)
+
     def update_lease(self, lease_id, values):
         """Update lease with passes values dictionary."""
         return self.call('update_lease', lease_id=lease_id, values=values)
@@ -45,3 +53,7 @@ class ManagerRPCAPI(service.RPCClient):
     def delete_lease(self, lease_id):
         """Delete specified lease."""
         return self.call('delete_lease', lease_id=lease_id)
+
+    def get_event_metrics(self):
+        """Get the metrics of the events run by the manager."""
+        return self.call('get_event_metrics')
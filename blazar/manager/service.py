@@ -13,20 +13,35 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import datetime
+import functools
+import heapq
+import itertools
+import os
+import socket
+import threading
 
 import eventlet
+from eventlet import event as eventlet_event
+from eventlet import semaphore
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import timeutils
+import six
 from stevedore import enabled
 
+from blazar import context
 from blazar.db import api as db_api
 from blazar.db import exceptions as db_ex
 from blazar import exceptions as common_ex
 from blazar.i18n import _
 from blazar import manager
+from blazar.manager import allocation_index
 from blazar.manager import exceptions
+from blazar.manager import metrics
 from blazar.notification import api as notification_api
+from blazar.utils import leases as leases_utils
 from blazar.utils import service as service_utils
 from blazar.utils import trusts
 
@@ -39,7 +54,66 @@ manager_opts = [
                default=60,
                help='Minutes prior to the end of a lease in which actions '
                     'like notification and snapshot are taken. If this is '
-                    'set to 0, then these actions are not taken.')
+                    'set to 0, then these actions are not taken.'),
+    cfg.IntOpt('event_batch_size',
+               default=100,
+               min=1,
+               help='Maximum number of due events dispatched at each run of '
+                    'the event loop. Remaining due events are dispatched at '
+                    'the next runs.'),
+    cfg.IntOpt('event_resync_interval',
+               default=300,
+               min=1,
+               help='Interval in seconds between two reloads of the upcoming '
+                    'events and of the allocation index from the DB. The '
+                    'event loop sleeps until the '
+                    'next known event, so this bounds the delay of events '
+                    'written by other processes.'),
+    cfg.IntOpt('event_claim_timeout',
+               default=3600,
+               min=0,
+               help='Time in seconds after which an event claimed by a '
+                    'manager and still IN_PROGRESS is considered lost, e.g. '
+                    'because that manager died, and is set back UNDONE to be '
+                    'run again. This must be longer than the handling of any '
+                    'event. Set it to 0 to never requeue events.'),
+    cfg.IntOpt('max_concurrent_events',
+               default=64,
+               min=1,
+               help='Maximum number of events run at once by the manager. '
+                    'Extra events wait until a running event completes.'),
+    cfg.IntOpt('max_concurrent_actions',
+               default=10,
+               min=1,
+               help='Maximum number of reservations of a lease whose start, '
+                    'end or before end actions are run at once.'),
+    cfg.IntOpt('catch_up_batch_size',
+               default=50,
+               min=1,
+               help='Maximum number of leases whose overdue events are '
+                    'submitted at once to the event executor when the '
+                    'manager catches up with the events which became due '
+                    'while it was stopped.'),
+    cfg.IntOpt('event_metrics_log_interval',
+               default=600,
+               min=0,
+               help='Interval in seconds between two log lines summarizing '
+                    'the lag, duration and outcome of the events run by the '
+                    'manager. Set it to 0 to disable these log lines.'),
+    cfg.IntOpt('max_leases_per_bulk_request',
+               default=500,
+               min=1,
+               help='Maximum number of leases which can be created by a '
+                    'single bulk lease creation request.')
+]
+
+plugin_executor_opts = [
+    cfg.IntOpt('max_concurrent_events',
+               default=0,
+               min=0,
+               help='Maximum number of events run at once for leases having '
+                    'a reservation of this resource type. 0 means that only '
+                    'the [manager]/max_concurrent_events limit applies.')
 ]
 
 CONF = cfg.CONF
@@ -47,6 +121,190 @@ CONF.register_opts(manager_opts, 'manager')
 LOG = logging.getLogger(__name__)
 
 LEASE_DATE_FORMAT = "%Y-%m-%d %H:%M"
+LEASE_SORT_KEYS = ('id', 'name', 'user_id', 'project_id', 'start_date',
+                   'end_date', 'status', 'created_at', 'updated_at')
+LEASE_FILTERS = ('status', 'project_id', 'resource_type', 'start_before',
+                 'end_after')
+
+
+class EventTimeline(object):
+    """In-memory timeline of the upcoming events.
+
+    The timeline only tells the manager when to look for due events: the DB
+    stays the reference for the events themselves, so a missing or outdated
+    entry can only delay or anticipate a lookup.
+
+    Entries are kept in a heap. Moved or discarded events leave stale heap
+    entries behind, which are dropped when they reach the top of the heap.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._events = {}
+        self._counter = itertools.count()
+        self._changed = threading.Event()
+
+    def __len__(self):
+        return len(self._events)
+
+    def push(self, event_id, lease_id, time):
+        """Adds an event to the timeline or moves it to a new time."""
+        self._events[event_id] = (time, lease_id)
+        heapq.heappush(self._heap, (time, next(self._counter), event_id))
+        if self.next_deadline() == time:
+            self._changed.set()
+
+    def discard_lease(self, lease_id):
+        """Removes all the events of a lease from the timeline."""
+        for event_id, (time, event_lease_id) in list(self._events.items()):
+            if event_lease_id == lease_id:
+                del self._events[event_id]
+
+    def reset(self, events):
+        """Replaces the content of the timeline by the given events."""
+        self._events = dict((e['id'], (e['time'], e['lease_id']))
+                            for e in events)
+        self._heap = [(time, next(self._counter), event_id)
+                      for event_id, (time, lease_id)
+                      in self._events.items()]
+        heapq.heapify(self._heap)
+        self._changed.set()
+
+    def next_deadline(self):
+        """Returns the time of the next event, or None if there is none."""
+        while self._heap:
+            time, _, event_id = self._heap[0]
+            if self._events.get(event_id, (None,))[0] == time:
+                return time
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now):
+        """Removes the events due before now and returns their IDs."""
+        due = []
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline >= now:
+                return due
+            time, _, event_id = heapq.heappop(self._heap)
+            del self._events[event_id]
+            due.append(event_id)
+
+    def wait(self, timeout):
+        """Sleeps until timeout() seconds pass or the next deadline changes.
+
+        The changes are cleared before timeout() computes how long to sleep,
+        so that a change made meanwhile is seen by timeout() or wakes the
+        caller up, but is not lost.
+        """
+        self._changed.clear()
+        self._changed.wait(timeout())
+
+
+class EventExecutor(object):
+    """Runs event handlers in greenthreads with bounded concurrency.
+
+    At most size handlers run at once, and at most limits[resource_type]
+    handlers run at once for the leases having a reservation of this resource
+    type. Extra handlers wait in their greenthread until a slot is released,
+    which does not hold any connection to the DB or to other services.
+    """
+
+    def __init__(self, size, limits=None):
+        self._semaphore = semaphore.Semaphore(size)
+        self._semaphores = dict(
+            (resource_type, semaphore.Semaphore(limit))
+            for resource_type, limit in (limits or {}).items() if limit)
+        self._queued = 0
+        self._in_flight = 0
+        self._in_flight_by_type = collections.defaultdict(int)
+
+    def submit(self, fn, resource_types, *args):
+        """Runs fn(*args) once the limits of resource_types allow it."""
+        eventlet.spawn_n(self._run, fn, sorted(set(resource_types)), args)
+
+    def submit_all(self, calls):
+        """Runs fn(*args) for each (fn, resource_types, args) of calls.
+
+        Returns once all of them are done.
+        """
+        if not calls:
+            return
+        done = eventlet_event.Event()
+        pending = [len(calls)]
+
+        def run(fn, *args):
+            try:
+                fn(*args)
+            finally:
+                pending[0] -= 1
+                if not pending[0]:
+                    done.send()
+
+        for fn, resource_types, args in calls:
+            self.submit(run, resource_types, fn, *args)
+        done.wait()
+
+    def stats(self):
+        """Returns the number of queued and running handlers."""
+        return {'queued': self._queued,
+                'in_flight': self._in_flight,
+                'in_flight_by_resource_type': dict(
+                    (resource_type, count) for resource_type, count
+                    in self._in_flight_by_type.items() if count)}
+
+    def _run(self, fn, resource_types, args):
+        # NOTE: semaphores are always acquired in the same order to prevent
+        # deadlocks between leases having several resource types.
+        semaphores = [self._semaphores[resource_type]
+                      for resource_type in resource_types
+                      if resource_type in self._semaphores]
+        semaphores.append(self._semaphore)
+
+        self._queued += 1
+        for sem in semaphores:
+            sem.acquire()
+        self._queued -= 1
+        self._in_flight += 1
+        for resource_type in resource_types:
+            self._in_flight_by_type[resource_type] += 1
+
+        try:
+            fn(*args)
+        except Exception:
+            LOG.exception('Error occurred while running an event.')
+        finally:
+            self._in_flight -= 1
+            for resource_type in resource_types:
+                self._in_flight_by_type[resource_type] -= 1
+            for sem in reversed(semaphores):
+                sem.release()
+
+
+def _read_primary(func):
+    """Runs the read-only DB calls of func on the primary DB.
+
+    For the paths reading back what they just wrote, or deciding what to
+    write from what they read, which a lagging replica would get wrong.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with db_api.read_primary():
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _bulk_error(exc):
+    """Describe the failure of a lease of a bulk creation request.
+
+    As in the API, the message of exceptions which are not raised by Blazar
+    itself, or which come from the database, is hidden.
+    """
+    if (isinstance(exc, common_ex.BlazarException) and
+            not isinstance(exc, db_ex.BlazarDBException)):
+        return {'code': exc.code, 'message': six.text_type(exc)}
+    return {'code': 500, 'message': 'Internal Server Error'}
 
 
 class ManagerService(service_utils.RPCServer):
@@ -61,10 +319,40 @@ class ManagerService(service_utils.RPCServer):
         super(ManagerService, self).__init__(target)
         self.plugins = self._get_plugins()
         self.resource_actions = self._setup_actions()
+        self._timeline = EventTimeline()
+        self._executor = EventExecutor(
+            CONF.manager.max_concurrent_events,
+            dict((resource_type, CONF[resource_type].max_concurrent_events)
+                 for resource_type in self.plugins))
+        self.worker_id = '%s.%d' % (socket.gethostname(), os.getpid())
+        self.metrics = metrics.EventMetrics()
+        self._notifications = notification_api.NotificationQueue()
 
     def start(self):
         super(ManagerService, self).start()
-        self.tg.add_timer(10, self._event)
+        self.tg.add_timer(CONF.manager.event_resync_interval,
+                          self._resync_timeline)
+        self.tg.add_timer(CONF.manager.event_resync_interval,
+                          self._reload_allocation_index)
+        self.tg.add_thread(self._event_loop)
+        self.tg.add_thread(self._notifications.run)
+        interval = CONF.manager.event_metrics_log_interval
+        if interval:
+            self.tg.add_timer(interval, self._log_event_metrics, interval)
+
+    def stop(self):
+        super(ManagerService, self).stop()
+        self._notifications.flush()
+
+    def _log_event_metrics(self):
+        LOG.info('Event metrics: %s', self.metrics.summary())
+
+    def get_event_metrics(self):
+        """Returns the metrics of the events run by this manager."""
+        event_metrics = self.metrics.to_dict()
+        event_metrics['executor'] = self._executor.stats()
+        event_metrics['notifications'] = self._notifications.stats()
+        return event_metrics
 
     def _get_plugins(self):
         """Return dict of resource-plugin class pairs."""
@@ -114,6 +402,7 @@ class ManagerService(service_utils.RPCServer):
         for resource_type, plugin in self.plugins.items():
             plugin = self.plugins[resource_type]
             CONF.register_opts(plugin.get_plugin_opts(), group=resource_type)
+            CONF.register_opts(plugin_executor_opts, group=resource_type)
 
             actions[resource_type] = {}
             actions[resource_type]['on_start'] = plugin.on_start
@@ -123,40 +412,266 @@ class ManagerService(service_utils.RPCServer):
         return actions
 
     @service_utils.with_empty_context
-    def _event(self):
-        """Tries to commit event.
+    def _resync_timeline(self):
+        """Reloads the upcoming events from the DB into the timeline.
 
-        If there is an event in Blazar DB to be done, do it and change its
-        status to 'DONE'.
+        Events whose claim timed out are set back UNDONE first, so that they
+        are run again.
         """
-        LOG.debug('Trying to get event from DB.')
-        event = db_api.event_get_first_sorted_by_filters(
-            sort_key='time',
-            sort_dir='asc',
-            filters={'status': 'UNDONE'}
-        )
+        try:
+            self._requeue_stale_claims()
+            events = db_api.event_get_all_sorted_by_filters(
+                sort_key='time',
+                sort_dir='asc',
+                filters={'status': 'UNDONE'}
+            )
+        except Exception:
+            LOG.exception('Error occurred while loading upcoming events.')
+        else:
+            self._timeline.reset(events)
 
-        if not event:
+    def _reload_allocation_index(self):
+        """Reloads the allocation index from the DB.
+
+        The index then gets the allocations made and drops the allocations
+        deleted by the other managers.
+        """
+        try:
+            allocation_index.get_index().load()
+        except Exception:
+            LOG.exception('Error occurred while loading the allocation index.')
+
+    def _requeue_stale_claims(self):
+        timeout = CONF.manager.event_claim_timeout
+        if not timeout:
             return
+        claimed_before = (datetime.datetime.utcnow() -
+                          datetime.timedelta(seconds=timeout))
+        requeued = db_api.event_requeue_stale_claims(claimed_before)
+        if requeued:
+            LOG.warning('%(count)d events claimed before %(date)s were not '
+                        'completed and have been requeued.',
+                        {'count': requeued, 'date': claimed_before})
+
+    def _seconds_until_next_event(self):
+        """Returns how long the event loop can sleep."""
+        timeout = CONF.manager.event_resync_interval
+        deadline = self._timeline.next_deadline()
+        if deadline is not None:
+            delta = deadline - datetime.datetime.utcnow()
+            timeout = min(timeout, max(0, delta.total_seconds()))
+        return timeout
+
+    def _event_loop(self):
+        """Dispatches due events and sleeps until the next deadline.
+
+        The DB is only queried when the timeline has due events or when due
+        events are left queued by the previous run.
+        """
+        try:
+            self._catch_up()
+        except Exception:
+            LOG.exception('Error occurred while catching up overdue events.')
+
+        queued = 0
+        while True:
+            if (queued or
+                    self._timeline.pop_due(datetime.datetime.utcnow())):
+                try:
+                    queued = self._event()
+                except Exception:
+                    LOG.exception('Error occurred while dispatching events.')
+                    queued = 0
+            self._timeline.wait(
+                lambda: 0 if queued else self._seconds_until_next_event())
 
-        if event['time'] < datetime.datetime.utcnow():
-            db_api.event_update(event['id'], {'status': 'IN_PROGRESS'})
-            event_type = event['event_type']
-            event_fn = getattr(self, event_type, None)
+    @service_utils.with_empty_context
+    def _catch_up(self):
+        """Runs the events which became due while the manager was stopped.
+
+        The overdue events of each lease are run one after the other, in time
+        order. Leases which only have end events to run are handled first,
+        so that their resources are released before the leases waiting to
+        start are handled. Leases are handled in batches of
+        CONF.manager.catch_up_batch_size leases, submitted to the event
+        executor and thus run within its limits, until no overdue event is
+        left.
+        """
+        while True:
+            events = db_api.event_get_all_sorted_by_filters(
+                sort_key='time',
+                sort_dir='asc',
+                filters={'status': 'UNDONE',
+                         'time': {'op': 'lt',
+                                  'border': datetime.datetime.utcnow()}}
+            )
+            if not events:
+                return
+
+            events_by_lease = collections.OrderedDict()
+            for event in events:
+                events_by_lease.setdefault(event['lease_id'], []).append(event)
+            ending = [lease_events for lease_events
+                      in events_by_lease.values()
+                      if lease_events[0]['event_type'] != 'start_lease']
+            starting = [lease_events for lease_events
+                        in events_by_lease.values()
+                        if lease_events[0]['event_type'] == 'start_lease']
+
+            LOG.warning('Catching up with %(events)d overdue events of '
+                        '%(leases)d leases.',
+                        {'events': len(events),
+                         'leases': len(events_by_lease)})
+            batch_size = CONF.manager.catch_up_batch_size
+            done = 0
+            for leases in (ending, starting):
+                for i in range(0, len(leases), batch_size):
+                    batch = leases[i:i + batch_size]
+                    self._executor.submit_all([
+                        (service_utils.with_empty_context(self._run_events),
+                         self._lease_resource_types(lease_events[0]),
+                         (lease_events,))
+                        for lease_events in batch])
+                    done += len(batch)
+                    LOG.info('Caught up with the overdue events of '
+                             '%(done)d/%(leases)d leases.',
+                             {'done': done, 'leases': len(events_by_lease)})
+
+    def _lease_resource_types(self, event):
+        """Returns the resource types of the lease of an event.
+
+        The event executor limits the handlers of each resource type. None
+        are returned if the lease is gone, the events then failing to run.
+        """
+        lease = db_api.lease_get(event['lease_id'])
+        if lease is None:
+            return []
+        return [r['resource_type'] for r in lease['reservations']]
+
+    @_read_primary
+    def _run_events(self, events):
+        """Claims and runs events one after the other."""
+        for event in events:
+            event_fn = self._claim_event(event)
             if event_fn is None:
-                raise exceptions.EventError(error='Event type %s is not '
-                                                  'supported' % event_type)
+                continue
             try:
-                eventlet.spawn_n(service_utils.with_empty_context(event_fn),
-                                 event['lease_id'], event['id'])
                 lease = db_api.lease_get(event['lease_id'])
-                with trusts.create_ctx_from_trust(lease['trust_id']) as ctx:
-                    self._send_notification(lease,
-                                            ctx,
-                                            events=['event.%s' % event_type])
+                self._notify_event(event, lease)
             except Exception:
                 db_api.event_update(event['id'], {'status': 'ERROR'})
                 LOG.exception(_('Error occurred while event handling.'))
+                continue
+            try:
+                event_fn(event['lease_id'], event['id'])
+            except Exception:
+                # NOTE: the event is set in ERROR by the handler wrapper.
+                LOG.exception(_('Error occurred while event handling.'))
+
+    @service_utils.with_empty_context
+    def _event(self):
+        """Tries to commit due events.
+
+        Every UNDONE event whose time has passed is dispatched, up to
+        CONF.manager.event_batch_size events at once. Events exceeding the
+        batch size are left UNDONE and dispatched at the next run.
+
+        :returns: the number of due events still queued.
+        """
+        LOG.debug('Trying to get events from DB.')
+        filters = {'status': 'UNDONE',
+                   'time': {'op': 'lt', 'border': datetime.datetime.utcnow()}}
+        batch_size = CONF.manager.event_batch_size
+        batch = db_api.event_get_all_sorted_by_filters(
+            sort_key='time',
+            sort_dir='asc',
+            filters=filters,
+            limit=batch_size
+        )
+
+        queued = 0
+        if len(batch) == batch_size:
+            # NOTE: the due events are only counted when the batch is full,
+            # so that the usual run does not read the whole queue.
+            queued = db_api.event_count_by_filters(filters) - len(batch)
+
+        for event in batch:
+            self._dispatch_event(event)
+
+        if queued:
+            LOG.warning("%(dispatched)d events dispatched, %(queued)d due "
+                        "events still queued.",
+                        {'dispatched': len(batch), 'queued': queued})
+        if batch:
+            LOG.debug('Event executor: %s', self._executor.stats())
+        return queued
+
+    @_read_primary
+    def _dispatch_event(self, event):
+        """Claims an event and spawns its handler.
+
+        The event is skipped if another manager claimed it first.
+        """
+        event_fn = self._claim_event(event)
+        if event_fn is None:
+            return
+
+        try:
+            lease = db_api.lease_get(event['lease_id'])
+            self._executor.submit(
+                service_utils.with_empty_context(event_fn),
+                [r['resource_type'] for r in lease['reservations']],
+                event['lease_id'], event['id'])
+            self._notify_event(event, lease)
+        except Exception:
+            db_api.event_update(event['id'], {'status': 'ERROR'})
+            LOG.exception(_('Error occurred while event handling.'))
+
+    def _claim_event(self, event):
+        """Claims an event and returns its handler.
+
+        Returns None if the event is not supported or if another manager
+        claimed it first.
+        """
+        event_type = event['event_type']
+        event_fn = getattr(self, event_type, None)
+        if event_fn is None:
+            LOG.error('Event type %(type)s of event %(event)s is not '
+                      'supported', {'type': event_type, 'event': event['id']})
+            db_api.event_update(event['id'], {'status': 'ERROR'})
+            return None
+
+        if not db_api.event_claim(event['id'], self.worker_id):
+            LOG.debug('Event %s was already claimed.', event['id'])
+            return None
+
+        lag = datetime.datetime.utcnow() - event['time']
+        self.metrics.record_lag(event_type, lag.total_seconds())
+        return self._measure_event(event_type, event_fn)
+
+    def _measure_event(self, event_type, event_fn):
+        """Wraps an event handler to record its duration and outcome.
+
+        An event whose handler raises is set in ERROR, so that it is not
+        requeued as a stale claim and run again once partly applied.
+        """
+        def run(lease_id, event_id):
+            status = 'ERROR'
+            with timeutils.StopWatch() as watch:
+                try:
+                    status = event_fn(lease_id, event_id)
+                except Exception:
+                    db_api.event_update(event_id, {'status': 'ERROR'})
+                    raise
+                finally:
+                    self.metrics.record_event(event_type, watch.elapsed(),
+                                              status)
+            return status
+        return run
+
+    def _notify_event(self, event, lease):
+        self._send_notification(lease,
+                                events=['event.%s' % event['event_type']])
 
     def _date_from_string(self, date_string, date_format=LEASE_DATE_FORMAT):
         try:
@@ -167,11 +682,55 @@ class ManagerService(service_utils.RPCServer):
 
         return date
 
-    def get_lease(self, lease_id):
-        return db_api.lease_get(lease_id)
+    def _check_lease_fields(self, fields):
+        """Return the fields to load, always including the lease ID."""
+        if fields is None:
+            return None
+        for field in fields:
+            if field not in leases_utils.LEASE_FIELDS:
+                raise exceptions.InvalidLeaseField(field=field)
+        return ['id'] + [field for field in fields if field != 'id']
+
+    def get_lease(self, lease_id, fields=None):
+        """Get a lease, or only some of its fields.
+
+        :param fields: list among LEASE_FIELDS. If given, the reservations
+            and events of the lease are not loaded.
+        """
+        return db_api.lease_get(lease_id,
+                                fields=self._check_lease_fields(fields))
+
+    def list_leases(self, project_id=None, limit=None, marker=None,
+                    sort_key=None, sort_dir=None, filters=None, fields=None):
+        """List leases, filtered, sorted and paginated in the database.
+
+        :param filters: dict which may hold a status, a project_id, a
+            resource_type, and start_before and end_after dates selecting the
+            leases overlapping a time window.
+        :param fields: list among LEASE_FIELDS. If given, the reservations
+            and events of the leases are not loaded.
+        """
+        fields = self._check_lease_fields(fields)
+        if limit is not None and limit < 1:
+            raise common_ex.InvalidInput(cls='positive integer', value=limit)
+        if sort_key is not None and sort_key not in LEASE_SORT_KEYS:
+            raise exceptions.InvalidSortKey(sort_key=sort_key)
+        if sort_dir is not None and sort_dir not in ('asc', 'desc'):
+            raise exceptions.InvalidSortDir(sort_dir=sort_dir)
+        filters = dict(filters or {})
+        for key in filters:
+            if key not in LEASE_FILTERS:
+                raise exceptions.InvalidLeaseFilter(filter=key)
+        for key in ('start_before', 'end_after'):
+            if key in filters:
+                filters[key] = self._date_from_string(filters[key])
 
-    def list_leases(self, project_id=None):
-        return db_api.lease_list(project_id)
+        try:
+            return db_api.lease_list(project_id, limit=limit, marker=marker,
+                                     sort_key=sort_key, sort_dir=sort_dir,
+                                     filters=filters, fields=fields)
+        except db_ex.BlazarDBNotFound:
+            raise exceptions.MarkerNotFound(marker=marker)
 
     def create_lease(self, lease_values):
         """Create a lease with reservations.
@@ -183,6 +742,90 @@ class ManagerService(service_utils.RPCServer):
         except KeyError:
             raise exceptions.MissingTrustId()
 
+        with trusts.create_ctx_from_trust(trust_id) as ctx:
+            # NOTE: the lease, its events and its reservations are created in
+            # a single transaction, which is rolled back if any of them fails.
+            with db_api.transaction():
+                lease_id = self._create_lease(lease_values, trust_id, ctx)
+            return self._lease_created(lease_id)
+
+    def create_leases(self, leases_values, all_or_nothing=False):
+        """Create several leases in a single call.
+
+        The keystone context of a trust is built only once for all the
+        leases sharing it. Return a list holding, for each lease and in the
+        same order, either {'lease': <lease>} or {'error': {'code': <code>,
+        'message': <message>}}. A lease created but which could not be
+        scheduled or notified afterwards is reported with both {'lease':
+        {'id': <lease ID>}} and the error; its events are still run once the
+        manager resynchronizes its timeline with the DB.
+
+        With all_or_nothing, the leases are created in a single transaction
+        and a failure of any of them rolls back all of them, the plugins
+        deleting the Nova resources they created for them, and raises
+        BulkLeaseCreationFailed.
+        """
+        if len(leases_values) > CONF.manager.max_leases_per_bulk_request:
+            raise exceptions.TooManyLeases(
+                count=len(leases_values),
+                max=CONF.manager.max_leases_per_bulk_request)
+
+        ctxs = {}
+
+        def create(lease_values):
+            try:
+                trust_id = lease_values.pop('trust_id')
+            except KeyError:
+                raise exceptions.MissingTrustId()
+            if trust_id not in ctxs:
+                ctxs[trust_id] = trusts.create_ctx_from_trust(trust_id)
+            with ctxs[trust_id] as ctx:
+                return self._create_lease(lease_values, trust_id, ctx)
+
+        if all_or_nothing:
+            lease_ids = []
+            with db_api.transaction():
+                for index, lease_values in enumerate(leases_values):
+                    try:
+                        lease_ids.append(create(lease_values))
+                    except Exception as e:
+                        LOG.exception('Cannot create lease %d of a bulk '
+                                      'request, rolling back all the leases',
+                                      index)
+                        raise exceptions.BulkLeaseCreationFailed(
+                            index=index, error=_bulk_error(e)['message'])
+            return [self._bulk_lease_created(lease_id)
+                    for lease_id in lease_ids]
+
+        results = []
+        for index, lease_values in enumerate(leases_values):
+            try:
+                with db_api.transaction():
+                    lease_id = create(lease_values)
+            except Exception as e:
+                LOG.exception('Cannot create lease %d of a bulk request',
+                              index)
+                results.append({'error': _bulk_error(e)})
+            else:
+                results.append(self._bulk_lease_created(lease_id))
+        return results
+
+    def _bulk_lease_created(self, lease_id):
+        """Return the result of a lease of a bulk request once committed."""
+        try:
+            return {'lease': self._lease_created(lease_id)}
+        except Exception as e:
+            LOG.exception('Lease %s of a bulk request is created but cannot '
+                          'be scheduled nor notified', lease_id)
+            return {'lease': {'id': lease_id}, 'error': _bulk_error(e)}
+
+    def _create_lease(self, lease_values, trust_id, ctx):
+        """Create a lease, its events and its reservations.
+
+        Must be called within a transaction and the context of the trust.
+        Return the ID of the lease, which is not scheduled nor notified
+        until _lease_created is called once the transaction is committed.
+        """
         # Remove and keep event and reservation values
         events = lease_values.pop("events", [])
         reservations = lease_values.pop("reservations", [])
@@ -207,87 +850,78 @@ class ManagerService(service_utils.RPCServer):
             raise common_ex.NotAuthorized(
                 'Start date must later than current date')
 
-        with trusts.create_ctx_from_trust(trust_id) as ctx:
-            # NOTE(priteau): We should not get user_id from ctx, because we are
-            # in the context of the trustee (blazar user).
-            # lease_values['user_id'] is set in blazar/api/v1/service.py
-            lease_values['project_id'] = ctx.project_id
-            lease_values['start_date'] = start_date
-            lease_values['end_date'] = end_date
-
-            events.append({'event_type': 'start_lease',
-                           'time': start_date,
-                           'status': 'UNDONE'})
-            events.append({'event_type': 'end_lease',
-                           'time': end_date,
-                           'status': 'UNDONE'})
-
-            before_end_date = lease_values.get('before_end_date', None)
-            if before_end_date:
-                # incoming param. Validation check
-                try:
-                    before_end_date = self._date_from_string(
-                        before_end_date)
-                    self._check_date_within_lease_limits(before_end_date,
-                                                         lease_values)
-                except common_ex.BlazarException as e:
-                    LOG.error("Invalid before_end_date param. %s" % e.message)
-                    raise e
-            elif CONF.manager.minutes_before_end_lease > 0:
-                delta = datetime.timedelta(
-                    minutes=CONF.manager.minutes_before_end_lease)
-                before_end_date = lease_values['end_date'] - delta
-
-            if before_end_date:
-                event = {'event_type': 'before_end_lease',
-                         'status': 'UNDONE'}
-                events.append(event)
-                self._update_before_end_event_date(event, before_end_date,
-                                                   lease_values)
-
+        # NOTE(priteau): We should not get user_id from ctx, because we are
+        # in the context of the trustee (blazar user).
+        # lease_values['user_id'] is set in blazar/api/v1/service.py
+        lease_values['project_id'] = ctx.project_id
+        lease_values['start_date'] = start_date
+        lease_values['end_date'] = end_date
+
+        events.append({'event_type': 'start_lease',
+                       'time': start_date,
+                       'status': 'UNDONE'})
+        events.append({'event_type': 'end_lease',
+                       'time': end_date,
+                       'status': 'UNDONE'})
+
+        before_end_date = lease_values.get('before_end_date', None)
+        if before_end_date:
+            # incoming param. Validation check
             try:
-                if trust_id:
-                    lease_values.update({'trust_id': trust_id})
-                lease = db_api.lease_create(lease_values)
-                lease_id = lease['id']
-            except db_ex.BlazarDBDuplicateEntry:
-                LOG.exception('Cannot create a lease - duplicated lease name')
-                raise exceptions.LeaseNameAlreadyExists(
-                    name=lease_values['name'])
-            except db_ex.BlazarDBException:
-                LOG.exception('Cannot create a lease')
-                raise
-            else:
-                try:
-                    for reservation in reservations:
-                        reservation['lease_id'] = lease['id']
-                        reservation['start_date'] = lease['start_date']
-                        reservation['end_date'] = lease['end_date']
-                        self._create_reservation(reservation)
-                except Exception:
-                    LOG.exception("Failed to create reservation for a lease. "
-                                  "Rollback the lease and associated "
-                                  "reservations")
-                    db_api.lease_destroy(lease_id)
-                    raise
+                before_end_date = self._date_from_string(
+                    before_end_date)
+                self._check_date_within_lease_limits(before_end_date,
+                                                     lease_values)
+            except common_ex.BlazarException as e:
+                LOG.error("Invalid before_end_date param. %s" % e.message)
+                raise e
+        elif CONF.manager.minutes_before_end_lease > 0:
+            delta = datetime.timedelta(
+                minutes=CONF.manager.minutes_before_end_lease)
+            before_end_date = lease_values['end_date'] - delta
+
+        if before_end_date:
+            event = {'event_type': 'before_end_lease',
+                     'status': 'UNDONE'}
+            events.append(event)
+            self._update_before_end_event_date(event, before_end_date,
+                                               lease_values)
+
+        if trust_id:
+            lease_values.update({'trust_id': trust_id})
+        lease_values['events'] = events
 
-                try:
-                    for event in events:
-                        event['lease_id'] = lease['id']
-                        db_api.event_create(event)
-                except (exceptions.UnsupportedResourceType,
-                        common_ex.BlazarException):
-                    LOG.exception("Failed to create event for a lease. "
-                                  "Rollback the lease and associated "
-                                  "reservations")
-                    db_api.lease_destroy(lease_id)
-                    raise
+        try:
+            lease = db_api.lease_create(lease_values)
+        except db_ex.BlazarDBDuplicateEntry:
+            LOG.exception('Cannot create a lease - duplicated lease name')
+            raise exceptions.LeaseNameAlreadyExists(
+                name=lease_values['name'])
+        except db_ex.BlazarDBException:
+            LOG.exception('Cannot create a lease')
+            raise
 
-                else:
-                    lease = db_api.lease_get(lease['id'])
-                    self._send_notification(lease, ctx, events=['create'])
-                    return lease
+        try:
+            for reservation in reservations:
+                reservation['lease_id'] = lease['id']
+                reservation['start_date'] = lease['start_date']
+                reservation['end_date'] = lease['end_date']
+                self._create_reservation(reservation)
+        except Exception:
+            LOG.exception("Failed to create reservation for a lease. "
+                          "Rollback the lease and associated reservations")
+            raise
+        return lease['id']
+
+    def _lease_created(self, lease_id):
+        """Schedule the events of a committed lease and notify it."""
+        lease = db_api.lease_get(lease_id)
+        for event in lease['events']:
+            self._timeline.push(event['id'], lease['id'], event['time'])
+        self._send_notification(lease, events=['create'])
+        return lease
 
+    @_read_primary
     def update_lease(self, lease_id, values):
         if not values:
             return db_api.lease_get(lease_id)
@@ -342,6 +976,15 @@ class ManagerService(service_utils.RPCServer):
             raise common_ex.NotAuthorized(
                 'End date must be later than current and start date')
 
+        events = dict((event['event_type'], event)
+                      for event in lease['events'])
+        if 'start_lease' not in events:
+            raise common_ex.BlazarException(
+                'Start lease event not found')
+        if 'end_lease' not in events:
+            raise common_ex.BlazarException(
+                'End lease event not found')
+
         with trusts.create_ctx_from_trust(lease['trust_id']):
             if before_end_date:
                 try:
@@ -374,48 +1017,38 @@ class ManagerService(service_utils.RPCServer):
                 self.plugins[resource_type].update_reservation(
                     reservation['id'], v)
 
-        event = db_api.event_get_first_sorted_by_filters(
-            'lease_id',
-            'asc',
-            {
-                'lease_id': lease_id,
-                'event_type': 'start_lease'
-            }
-        )
-        if not event:
-            raise common_ex.BlazarException(
-                'Start lease event not found')
-        db_api.event_update(event['id'], {'time': values['start_date']})
-
-        event = db_api.event_get_first_sorted_by_filters(
-            'lease_id',
-            'asc',
-            {
-                'lease_id': lease_id,
-                'event_type': 'end_lease'
-            }
-        )
-        if not event:
-            raise common_ex.BlazarException(
-                'End lease event not found')
-        db_api.event_update(event['id'], {'time': values['end_date']})
+        events_values = {'start_lease': {'time': values['start_date']},
+                         'end_lease': {'time': values['end_date']}}
 
         notifications = ['update']
-        self._update_before_end_event(lease, values, notifications,
-                                      before_end_date)
+        before_end_values = self._update_before_end_event(
+            lease, values, notifications, events.get('before_end_lease'),
+            before_end_date)
+        if before_end_values:
+            events_values['before_end_lease'] = before_end_values
 
         try:
             del values['reservations']
         except KeyError:
             pass
-        db_api.lease_update(lease_id, values)
+
+        # NOTE: all the events of the lease are loaded by a single query and
+        # updated with the lease in a single transaction.
+        with db_api.transaction():
+            events = db_api.event_update_all_by_lease_id(lease_id,
+                                                         events_values)
+            db_api.lease_update(lease_id, values)
+
+        for event in events:
+            if event['event_type'] in events_values:
+                self._timeline.push(event['id'], lease_id, event['time'])
 
         lease = db_api.lease_get(lease_id)
-        with trusts.create_ctx_from_trust(lease['trust_id']) as ctx:
-            self._send_notification(lease, ctx, events=notifications)
+        self._send_notification(lease, events=notifications)
 
         return lease
 
+    @_read_primary
     def delete_lease(self, lease_id):
         lease = self.get_lease(lease_id)
         if (datetime.datetime.utcnow() >= lease['start_date'] and
@@ -444,7 +1077,7 @@ class ManagerService(service_utils.RPCServer):
                 raise common_ex.BlazarException('Invalid event status')
             db_api.event_update(end_event['id'], {'status': 'IN_PROGRESS'})
 
-        with trusts.create_ctx_from_trust(lease['trust_id']) as ctx:
+        with trusts.create_ctx_from_trust(lease['trust_id']):
             for reservation in lease['reservations']:
                 if reservation['status'] != 'deleted':
                     plugin = self.plugins[reservation['resource_type']]
@@ -455,54 +1088,86 @@ class ManagerService(service_utils.RPCServer):
                                       "for a lease.")
                         raise
             db_api.lease_destroy(lease_id)
-            self._send_notification(lease, ctx, events=['delete'])
+            self._timeline.discard_lease(lease_id)
+            self._send_notification(lease, events=['delete'])
 
+    @_read_primary
     def start_lease(self, lease_id, event_id):
         lease = self.get_lease(lease_id)
         with trusts.create_ctx_from_trust(lease['trust_id']):
-            self._basic_action(lease_id, event_id, 'on_start', 'active')
+            return self._basic_action(lease_id, event_id, 'on_start',
+                                      'active')
 
+    @_read_primary
     def end_lease(self, lease_id, event_id):
         lease = self.get_lease(lease_id)
         for reservation in lease['reservations']:
             db_api.reservation_update(reservation['id'],
                                       {'status': 'completed'})
         with trusts.create_ctx_from_trust(lease['trust_id']):
-            self._basic_action(lease_id, event_id, 'on_end', 'deleted')
+            return self._basic_action(lease_id, event_id, 'on_end',
+                                      'deleted')
 
+    @_read_primary
     def before_end_lease(self, lease_id, event_id):
         lease = self.get_lease(lease_id)
         with trusts.create_ctx_from_trust(lease['trust_id']):
-            self._basic_action(lease_id, event_id, 'before_end')
+            return self._basic_action(lease_id, event_id, 'before_end')
 
     def _basic_action(self, lease_id, event_id, action_time,
                       reservation_status=None):
-        """Commits basic lease actions such as starting and ending."""
+        """Commits basic lease actions such as starting and ending.
+
+        The actions of the reservations of the lease are run concurrently,
+        at most CONF.manager.max_concurrent_actions at once. The event is
+        set in ERROR if any of them fails.
+
+        :returns: the new status of the event.
+        """
         lease = self.get_lease(lease_id)
+        ctx = context.current()
 
-        event_status = 'DONE'
-        for reservation in lease['reservations']:
-            resource_type = reservation['resource_type']
-            try:
-                self.resource_actions[resource_type][action_time](
-                    reservation['resource_id']
-                )
-            except common_ex.BlazarException:
-                LOG.exception("Failed to execute action %(action)s "
-                              "for lease %(lease)s"
-                              % {
-                                  'action': action_time,
-                                  'lease': lease_id,
-                              })
-                event_status = 'ERROR'
-                db_api.reservation_update(reservation['id'],
-                                          {'status': 'error'})
-            else:
-                if reservation_status is not None:
-                    db_api.reservation_update(reservation['id'],
-                                              {'status': reservation_status})
+        def run_action(reservation):
+            with context.BlazarContext(ctx), db_api.read_primary():
+                return self._reservation_action(lease_id, reservation,
+                                                action_time,
+                                                reservation_status)
+
+        pool = eventlet.GreenPool(CONF.manager.max_concurrent_actions)
+        results = list(pool.imap(run_action, lease['reservations']))
 
+        event_status = 'DONE' if all(results) else 'ERROR'
         db_api.event_update(event_id, {'status': event_status})
+        return event_status
+
+    def _reservation_action(self, lease_id, reservation, action_time,
+                            reservation_status=None):
+        """Runs the action of a reservation, returns False if it failed."""
+        resource_type = reservation['resource_type']
+        watch = timeutils.StopWatch().start()
+        try:
+            self.resource_actions[resource_type][action_time](
+                reservation['resource_id']
+            )
+        except common_ex.BlazarException:
+            self.metrics.record_action(resource_type, action_time,
+                                       watch.elapsed(), False)
+            LOG.exception("Failed to execute action %(action)s "
+                          "for lease %(lease)s"
+                          % {
+                              'action': action_time,
+                              'lease': lease_id,
+                          })
+            db_api.reservation_update(reservation['id'],
+                                      {'status': 'error'})
+            return False
+
+        self.metrics.record_action(resource_type, action_time,
+                                   watch.elapsed(), True)
+        if reservation_status is not None:
+            db_api.reservation_update(reservation['id'],
+                                      {'status': reservation_status})
+        return True
 
     def _create_reservation(self, values):
         resource_type = values['resource_type']
@@ -521,12 +1186,9 @@ class ManagerService(service_utils.RPCServer):
         db_api.reservation_update(reservation['id'],
                                   {'resource_id': resource_id})
 
-    def _send_notification(self, lease, ctx, events=[]):
-        payload = notification_api.format_lease_payload(lease)
-
+    def _send_notification(self, lease, events=[]):
         for event in events:
-            notification_api.send_lease_notification(ctx, payload,
-                                                     'lease.%s' % event)
+            self._notifications.put(lease, event)
 
     def _check_date_within_lease_limits(self, date, lease):
         if not lease['start_date'] < date < lease['end_date']:
@@ -543,32 +1205,29 @@ class ManagerService(service_utils.RPCServer):
             event['time'] = lease['start_date']
 
     def _update_before_end_event(self, old_lease, new_lease,
-                                 notifications, before_end_date=None):
-        event = db_api.event_get_first_sorted_by_filters(
-            'lease_id',
-            'asc',
-            {
-                'lease_id': old_lease['id'],
-                'event_type': 'before_end_lease'
-            }
-        )
-        if event:
+                                 notifications, event,
+                                 before_end_date=None):
+        """Return the values to update the before_end_lease event with.
+
+        Return None if the lease has no such event.
+        """
+        if not event:
             # NOTE(casanch1) do nothing if the event does not exist.
             # This is for backward compatibility
-            update_values = {}
-            if not before_end_date:
-                # before_end_date needs to be calculated based on
-                # previous delta
-                prev_before_end_delta = old_lease['end_date'] - event['time']
-                before_end_date = new_lease['end_date'] - prev_before_end_delta
-
-            self._update_before_end_event_date(update_values, before_end_date,
-                                               new_lease)
-            if event['status'] == 'DONE':
-                update_values['status'] = 'UNDONE'
-                notifications.append('event.before_end_lease.stop')
-
-            db_api.event_update(event['id'], update_values)
+            return None
+        update_values = {}
+        if not before_end_date:
+            # before_end_date needs to be calculated based on
+            # previous delta
+            prev_before_end_delta = old_lease['end_date'] - event['time']
+            before_end_date = new_lease['end_date'] - prev_before_end_delta
+
+        self._update_before_end_event_date(update_values, before_end_date,
+                                           new_lease)
+        if event['status'] == 'DONE':
+            update_values['status'] = 'UNDONE'
+            notifications.append('event.before_end_lease.stop')
+        return update_values
 
     def __getattr__(self, name):
         """RPC Dispatcher for plugins methods."""
@@ -13,9 +13,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from eventlet import queue
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from blazar import context
 from blazar.notification import notifier
 
+CONF = cfg.CONF
 IMPL = notifier.Notifier()
+LOG = logging.getLogger(__name__)
 
 
 def send_lease_notification(context, lease, notification):
@@ -30,3 +37,81 @@ def format_lease_payload(lease):
         'start_date': lease['start_date'],
         'end_date': lease['end_date']
     }
+
+
+class NotificationQueue(object):
+    """Bounded queue of lease notifications sent by a background greenthread.
+
+    Notifications are sent in the context of the owner of the lease, so that
+    sending them does not require a trust. When the queue is full, new
+    notifications are handled according to [notifications]/overflow_policy.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(CONF.notifications.queue_size)
+        self._stats = {'queued': 0, 'sent': 0, 'failed': 0, 'dropped': 0,
+                       'batches': 0}
+
+    def put(self, lease, notification):
+        """Queues a notification about a lease."""
+        ctx = context.BlazarContext(user_id=lease['user_id'],
+                                    project_id=lease['project_id'])
+        item = (ctx, format_lease_payload(lease), notification)
+
+        policy = CONF.notifications.overflow_policy
+        if policy == 'block':
+            self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                LOG.warning('Notification queue is full, dropped a lease '
+                            'notification.')
+                self._stats['dropped'] += 1
+                if policy == 'drop_newest':
+                    return
+                self._queue.get_nowait()
+                self._queue.put_nowait(item)
+        self._stats['queued'] += 1
+
+    def run(self):
+        """Sends the queued notifications, forever."""
+        while True:
+            self._send_batch(self._queue.get())
+
+    def flush(self):
+        """Sends the queued notifications, until the queue is empty."""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._send_batch(item)
+
+    def stats(self):
+        """Returns the notification delivery counters and the queue depth."""
+        stats = dict(self._stats)
+        stats['depth'] = self._queue.qsize()
+        return stats
+
+    def _send_batch(self, item):
+        batch = [item]
+        while len(batch) < CONF.notifications.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        for ctx, payload, notification in batch:
+            try:
+                send_lease_notification(ctx, payload,
+                                        'lease.%s' % notification)
+            except Exception:
+                LOG.exception('Failed to send the %(notification)s '
+                              'notification of lease %(lease)s.',
+                              {'notification': notification,
+                               'lease': payload['lease_id']})
+                self._stats['failed'] += 1
+            else:
+                self._stats['sent'] += 1
+        self._stats['batches'] += 1
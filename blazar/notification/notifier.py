@@ -21,7 +21,23 @@ import oslo_messaging as messaging
 notification_opts = [
     cfg.StrOpt('publisher_id',
                default="blazar.lease",
-               help='Publisher ID for notifications')
+               help='Publisher ID for notifications'),
+    cfg.IntOpt('queue_size',
+               default=1000,
+               min=1,
+               help='Maximum number of lease notifications waiting to be '
+                    'sent by blazar-manager.'),
+    cfg.StrOpt('overflow_policy',
+               default='block',
+               choices=['block', 'drop_oldest', 'drop_newest'],
+               help='What to do with a new lease notification when the queue '
+                    'is full: wait until there is room in the queue, drop '
+                    'the oldest queued notification, or drop the new one.'),
+    cfg.IntOpt('batch_size',
+               default=50,
+               min=1,
+               help='Maximum number of queued lease notifications sent at '
+                    'once.')
 ]
 
 LOG = logging.getLogger(__name__)
@@ -22,6 +22,7 @@ import blazar.db.migration.cli
 import blazar.manager
 import blazar.manager.service
 import blazar.notification.notifier
+import blazar.plugins.instances.instance_plugin
 import blazar.plugins.oshosts.host_plugin
 import blazar.utils.openstack.keystone
 import blazar.utils.openstack.nova
@@ -46,5 +47,8 @@ def list_opts():
         ('notifications', blazar.notification.notifier.notification_opts),
         ('nova', blazar.utils.openstack.nova.nova_opts),
         (blazar.plugins.oshosts.RESOURCE_TYPE,
-         blazar.plugins.oshosts.host_plugin.plugin_opts),
+         itertools.chain(blazar.plugins.oshosts.host_plugin.plugin_opts,
+                         blazar.manager.service.plugin_executor_opts)),
+        (blazar.plugins.instances.instance_plugin.RESOURCE_TYPE,
+         blazar.manager.service.plugin_executor_opts),
     ]
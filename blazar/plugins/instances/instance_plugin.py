@@ -21,6 +21,7 @@ from blazar import context
 from blazar.db import api as db_api
 from blazar.db import utils as db_utils
 from blazar import exceptions
+from blazar.manager import allocation_index
 from blazar.manager import exceptions as mgr_exceptions
 from blazar.plugins import base
 from blazar.plugins import oshosts
@@ -55,14 +56,22 @@ class VirtualInstancePlugin(base.BasePlugin, nova.NovaClientWrapper):
         free = []
         non_free = []
 
+        # NOTE: the reservations of a host are only read if it is not free,
+        # which is found for all the hosts by a single query. As for
+        # get_reservations_by_host_id, the leases only touching the period
+        # overlap it.
+        availability = db_utils.get_hosts_availability(
+            [host['id'] for host in hosts], start_date, end_date,
+            inclusive=True)
         for host in hosts:
+            if availability[host['id']]:
+                free.append({'host': host, 'reservations': None})
+                continue
             reservations = db_utils.get_reservations_by_host_id(host['id'],
                                                                 start_date,
                                                                 end_date)
-            if reservations == []:
-                free.append({'host': host, 'reservations': None})
-            elif not filter(lambda x: x['resource_type'] ==
-                            oshosts.RESOURCE_TYPE, reservations):
+            if not filter(lambda x: x['resource_type'] ==
+                          oshosts.RESOURCE_TYPE, reservations):
                 non_free.append({'host': host, 'reservations': reservations})
 
         return free, non_free
@@ -233,9 +242,12 @@ class VirtualInstancePlugin(base.BasePlugin, nova.NovaClientWrapper):
         instance_reservation = db_api.instance_reservation_create(
             instance_reservation_val)
 
-        for host_id in host_ids:
-            db_api.host_allocation_create({'compute_host_id': host_id,
-                                          'reservation_id': reservation_id})
+        db_api.host_allocation_create_bulk(
+            [{'compute_host_id': host_id, 'reservation_id': reservation_id}
+             for host_id in host_ids])
+        allocation_index.get_index().add(reservation_id, host_ids,
+                                         values['start_date'],
+                                         values['end_date'])
 
         try:
             flavor, group, pool = self._create_resources(instance_reservation)
@@ -245,6 +257,17 @@ class VirtualInstancePlugin(base.BasePlugin, nova.NovaClientWrapper):
             self.cleanup_resources(instance_reservation)
             raise mgr_exceptions.NovaClientError()
 
+        ctx = context.current()
+
+        def cleanup_resources():
+            with ctx:
+                self.cleanup_resources({'reservation_id': reservation_id,
+                                        'server_group_id': group.id})
+
+        # NOTE: the Nova resources are not referenced by the DB anymore if
+        # the transaction creating the reservation is rolled back.
+        db_api.after_rollback(cleanup_resources)
+
         db_api.instance_reservation_update(instance_reservation['id'],
                                            {'flavor_id': flavor.id,
                                             'server_group_id': group.id,
@@ -290,6 +313,8 @@ class VirtualInstancePlugin(base.BasePlugin, nova.NovaClientWrapper):
             reservation_id=instance_reservation['reservation_id'])
         for allocation in allocations:
             db_api.host_allocation_destroy(allocation['id'])
+        allocation_index.get_index().remove(
+            instance_reservation['reservation_id'])
 
         for server in self.nova.servers.list(search_opts={
                 'flavor': instance_reservation['reservation_id'],
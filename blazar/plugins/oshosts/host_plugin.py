@@ -14,14 +14,15 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import datetime
-
 from oslo_config import cfg
+from oslo_log import log as logging
 from oslo_utils import strutils
 
+from blazar import context
 from blazar.db import api as db_api
 from blazar.db import exceptions as db_ex
 from blazar.db import utils as db_utils
+from blazar.manager import allocation_index
 from blazar.manager import exceptions as manager_ex
 from blazar.plugins import base
 from blazar.plugins import oshosts as plugin
@@ -52,6 +53,7 @@ plugin_opts = [
 
 CONF = cfg.CONF
 CONF.register_opts(plugin_opts, group=plugin.RESOURCE_TYPE)
+LOG = logging.getLogger(__name__)
 
 
 before_end_options = ['', 'snapshot', 'default']
@@ -91,6 +93,15 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
         az_name = "%s%s" % (CONF[self.resource_type].blazar_az_prefix,
                             pool_name)
         pool_instance = pool.create(name=pool_name, az=az_name)
+        ctx = context.current()
+
+        def delete_pool():
+            with ctx:
+                pool.delete(pool_instance.id)
+
+        # NOTE: the aggregate is not referenced by the DB anymore if the
+        # transaction creating the reservation is rolled back.
+        db_api.after_rollback(delete_pool)
         host_rsrv_values = {
             'reservation_id': reservation_id,
             'aggregate_id': pool_instance.id,
@@ -101,9 +112,12 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
             'before_end': values['before_end']
         }
         host_reservation = db_api.host_reservation_create(host_rsrv_values)
-        for host_id in host_ids:
-            db_api.host_allocation_create({'compute_host_id': host_id,
-                                          'reservation_id': reservation_id})
+        db_api.host_allocation_create_bulk(
+            [{'compute_host_id': host_id, 'reservation_id': reservation_id}
+             for host_id in host_ids])
+        allocation_index.get_index().add(reservation_id, host_ids,
+                                         values['start_date'],
+                                         values['end_date'])
         return host_reservation['id']
 
     def update_reservation(self, reservation_id, values):
@@ -116,6 +130,8 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
                 and values['start_date'] >= lease['start_date']
                 and values['end_date'] <= lease['end_date']):
             # Nothing to update
+            allocation_index.get_index().move(
+                reservation_id, values['start_date'], values['end_date'])
             return
 
         dates_before = {'start_date': lease['start_date'],
@@ -144,6 +160,8 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
                 'resource_properties')
         if updates:
             db_api.host_reservation_update(host_reservation['id'], updates)
+        allocation_index.get_index().move(
+            reservation_id, values['start_date'], values['end_date'])
 
     def on_start(self, resource_id):
         """Add the hosts in the pool."""
@@ -179,6 +197,8 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
             reservation_id=host_reservation['reservation_id'])
         for allocation in allocations:
             db_api.host_allocation_destroy(allocation['id'])
+        allocation_index.get_index().remove(
+            host_reservation['reservation_id'])
         pool = nova.ReservationPool()
         for host in pool.get_computehosts(host_reservation['aggregate_id']):
             for server in self.nova.servers.list(
@@ -347,12 +367,15 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
                         count_range, start_date, end_date):
         """Return the matching hosts (preferably not allocated)
 
+        The hosts free for the period are found with the allocation index of
+        the manager and checked in the DB. If the index is found out of date
+        for some of them, their allocations are reloaded in the index. If the
+        index does not find enough hosts or is found out of date, the hosts
+        are found with the DB instead.
         """
         count_range = count_range.split('-')
-        min_host = count_range[0]
-        max_host = count_range[1]
-        allocated_host_ids = []
-        not_allocated_host_ids = []
+        min_host = int(count_range[0])
+        max_host = int(count_range[1])
         filter_array = []
         # TODO(frossigneux) support "or" operator
         if hypervisor_properties:
@@ -361,26 +384,55 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
         if resource_properties:
             filter_array += plugins_utils.convert_requirements(
                 resource_properties)
-        for host in db_api.host_get_all_by_queries(filter_array):
-            if not db_api.host_allocation_get_all_by_values(
-                    compute_host_id=host['id']):
-                not_allocated_host_ids.append(host['id'])
-            elif db_utils.get_free_periods(
-                host['id'],
-                start_date,
-                end_date,
-                end_date - start_date,
-            ) == [
-                (start_date, end_date),
-            ]:
-                allocated_host_ids.append(host['id'])
-        if len(not_allocated_host_ids) >= int(min_host):
-            return not_allocated_host_ids[:int(max_host)]
-        all_host_ids = allocated_host_ids + not_allocated_host_ids
-        if len(all_host_ids) >= int(min_host):
-            return all_host_ids[:int(max_host)]
-        else:
+        host_ids = [host['id'] for host
+                    in db_api.host_get_all_by_queries(filter_array)]
+
+        index = allocation_index.get_index()
+        not_allocated_host_ids = []
+        allocated_host_ids = []
+        for host_id in host_ids:
+            if not index.is_allocated(host_id):
+                not_allocated_host_ids.append(host_id)
+            elif index.is_free(host_id, start_date, end_date):
+                allocated_host_ids.append(host_id)
+        matching_host_ids = self._pick_hosts(
+            not_allocated_host_ids, allocated_host_ids, min_host, max_host)
+        if matching_host_ids:
+            availability = db_utils.get_hosts_availability(
+                matching_host_ids, start_date, end_date)
+            busy_host_ids = [host_id for host_id in matching_host_ids
+                             if not availability[host_id]]
+            if not busy_host_ids:
+                return matching_host_ids
+            LOG.warning('Hosts %s found free by the allocation index are '
+                        'allocated, refreshing them in the index.',
+                        busy_host_ids)
+            index.refresh(busy_host_ids)
+        if not host_ids:
+            return []
+
+        # NOTE: the index may also keep allocations deleted by other
+        # managers until it is reloaded, so the hosts are found with the DB
+        # rather than by reloading the whole index for every request the
+        # index finds too few hosts for.
+        not_allocated_host_ids, allocations = (
+            db_api.host_allocation_partition(host_ids, start_date, end_date))
+        allocated_host_ids = [host_id for host_id in host_ids
+                              if host_id in allocations and
+                              not allocations[host_id]]
+        return self._pick_hosts(not_allocated_host_ids, allocated_host_ids,
+                                min_host, max_host)
+
+    def _pick_hosts(self, not_allocated_host_ids, allocated_host_ids,
+                    min_host, max_host):
+        """Picks min_host to max_host free hosts, preferably not allocated."""
+        if len(not_allocated_host_ids) >= min_host:
+            return not_allocated_host_ids[:max_host]
+        matching_host_ids = (allocated_host_ids +
+                             not_allocated_host_ids)[:max_host]
+        if len(matching_host_ids) < min_host:
             return []
+        return matching_host_ids
 
     def _convert_int_param(self, param, name):
         """Checks that the parameter is present and can be converted to int."""
@@ -430,7 +482,7 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
 
         allocs_to_remove = self._allocations_to_remove(
             dates_before, dates_after, max_hosts, hypervisor_properties,
-            resource_properties, allocs)
+            resource_properties, allocs, reservation_id)
 
         if allocs_to_remove and reservation_status == 'active':
             raise manager_ex.NotEnoughHostsAvailable()
@@ -448,44 +500,69 @@ class PhysicalHostPlugin(base.BasePlugin, nova.NovaClientWrapper):
                 for host_id in host_ids:
                     db_api.host_allocation_create(
                         {'compute_host_id': host_id,
-                         'reservation_id': reservation_id})
+                         'reservation_id': reservation_id},
+                        returning=False)
+                allocation_index.get_index().add(
+                    reservation_id, host_ids, dates_before['start_date'],
+                    dates_before['end_date'])
             else:
                 raise manager_ex.NotEnoughHostsAvailable()
 
         for allocation in allocs_to_remove:
             db_api.host_allocation_destroy(allocation['id'])
+        allocation_index.get_index().remove(
+            reservation_id,
+            [allocation['compute_host_id'] for allocation in allocs_to_remove])
 
     def _allocations_to_remove(self, dates_before, dates_after, max_hosts,
                                hypervisor_properties, resource_properties,
-                               allocs):
+                               allocs, reservation_id):
+        index = allocation_index.get_index()
         allocs_to_remove = []
         requested_host_ids = [host['id'] for host in
                               self._filter_hosts_by_properties(
                                   hypervisor_properties, resource_properties)]
 
+        extended = (dates_before['start_date'] > dates_after['start_date'] or
+                    dates_before['end_date'] < dates_after['end_date'])
         for alloc in allocs:
             if alloc['compute_host_id'] not in requested_host_ids:
                 allocs_to_remove.append(alloc)
                 continue
-            if (dates_before['start_date'] > dates_after['start_date'] or
-                    dates_before['end_date'] < dates_after['end_date']):
-                reserved_periods = db_utils.get_reserved_periods(
-                    alloc['compute_host_id'],
-                    dates_after['start_date'],
-                    dates_after['end_date'],
-                    datetime.timedelta(seconds=1))
-
-                max_start = max(dates_before['start_date'],
-                                dates_after['start_date'])
-                min_end = min(dates_before['end_date'],
-                              dates_after['end_date'])
-
-                if not (len(reserved_periods) == 0 or
-                        (len(reserved_periods) == 1 and
-                         reserved_periods[0][0] == max_start and
-                         reserved_periods[0][1] == min_end)):
-                    allocs_to_remove.append(alloc)
-                    continue
+            if extended and not index.is_free(alloc['compute_host_id'],
+                                              dates_after['start_date'],
+                                              dates_after['end_date'],
+                                              reservation_id):
+                allocs_to_remove.append(alloc)
+                continue
+
+        if extended:
+            # NOTE: the index may miss allocations made by other managers, so
+            # the hosts it finds free for the new dates are checked in the DB.
+            kept_allocs = [alloc for alloc in allocs
+                           if alloc not in allocs_to_remove]
+            reserved_periods = db_utils.get_hosts_availability(
+                [alloc['compute_host_id'] for alloc in kept_allocs],
+                dates_after['start_date'], dates_after['end_date'],
+                reserved_periods=True)
+            # The reservation itself only reserves the hosts during the
+            # overlap of its old and new dates.
+            own_period = (max(dates_before['start_date'],
+                              dates_after['start_date']),
+                          min(dates_before['end_date'],
+                              dates_after['end_date']))
+            busy_allocs = [
+                alloc for alloc in kept_allocs
+                if reserved_periods[alloc['compute_host_id']] not in (
+                    [], [own_period])]
+            if busy_allocs:
+                busy_host_ids = [alloc['compute_host_id']
+                                 for alloc in busy_allocs]
+                LOG.warning('Hosts %s found free by the allocation index are '
+                            'allocated, refreshing them in the index.',
+                            busy_host_ids)
+                index.refresh(busy_host_ids)
+                allocs_to_remove.extend(busy_allocs)
 
         kept_hosts = len(allocs) - len(allocs_to_remove)
         if kept_hosts > max_hosts:
@@ -14,7 +14,11 @@
 # limitations under the License.
 
 from blazar.api.v1 import service as service_api
+from blazar import context
+from blazar import exceptions
 from blazar import tests
+from blazar.utils import leases as leases_utils
+from blazar.utils import trusts
 
 
 class RPCApiTestCase(tests.TestCase):
@@ -46,3 +50,93 @@ class RPCApiTestCase(tests.TestCase):
 
     def get_plugins(self):
         pass
+
+
+class GetLeasesTestCase(tests.TestCase):
+    def setUp(self):
+        super(GetLeasesTestCase, self).setUp()
+        self.rpcapi = self.patch(service_api.manager_rpcapi,
+                                 'ManagerRPCAPI').return_value
+        self.enforce = self.patch(service_api.policy, 'enforce')
+        self.api = service_api.API()
+        self.ctx = context.BlazarContext(user_id='fake', project_id='fake')
+        self.ctx.__enter__()
+        self.addCleanup(self.ctx.__exit__, None, None, None)
+
+    def test_get_leases(self):
+        self.api.get_leases({'limit': '10', 'marker': '1', 'sort_key': 'name',
+                             'sort_dir': 'desc', 'status': 'ACTIVE'})
+
+        self.rpcapi.list_leases.assert_called_once_with(
+            project_id=None, limit=10, marker='1', sort_key='name',
+            sort_dir='desc', filters={'status': 'ACTIVE'}, fields=None)
+
+    def test_get_leases_scoped_to_project(self):
+        self.enforce.side_effect = (
+            lambda ctx, action, target, do_raise=True: action != 'admin')
+
+        self.api.get_leases()
+
+        self.rpcapi.list_leases.assert_called_once_with(
+            project_id='fake', limit=None, marker=None, sort_key=None,
+            sort_dir=None, filters={}, fields=None)
+
+    def test_get_leases_fields(self):
+        self.api.get_leases({'fields': 'name,start_date'})
+
+        self.assertEqual(
+            ['name', 'start_date'],
+            self.rpcapi.list_leases.call_args[1]['fields'])
+
+    def test_get_leases_without_detail(self):
+        self.api.get_leases({'detail': 'false'})
+
+        self.assertEqual(
+            list(leases_utils.LEASE_FIELDS),
+            self.rpcapi.list_leases.call_args[1]['fields'])
+
+    def test_get_lease_fields(self):
+        self.api.get_lease('1', {'fields': 'name'})
+
+        self.rpcapi.get_lease.assert_called_once_with('1', fields=['name'])
+
+    def test_get_lease_invalid_detail(self):
+        self.assertRaises(exceptions.InvalidInput,
+                          self.api.get_lease, '1', {'detail': 'maybe'})
+
+    def test_get_leases_invalid_limit(self):
+        self.assertRaises(exceptions.InvalidInput,
+                          self.api.get_leases, {'limit': 'ten'})
+        self.rpcapi.list_leases.assert_not_called()
+
+
+class CreateLeasesTestCase(tests.TestCase):
+    def setUp(self):
+        super(CreateLeasesTestCase, self).setUp()
+        self.rpcapi = self.patch(service_api.manager_rpcapi,
+                                 'ManagerRPCAPI').return_value
+        self.patch(service_api.policy, 'enforce')
+        self.patch(trusts, 'create_trust').return_value.id = 'trust'
+        self.api = service_api.API()
+        self.ctx = context.BlazarContext(user_id='fake', project_id='fake')
+        self.ctx.__enter__()
+        self.addCleanup(self.ctx.__exit__, None, None, None)
+
+    def test_create_leases_all_or_nothing(self):
+        for value, all_or_nothing in ((True, True), ('false', False),
+                                      ('1', True), (None, False)):
+            data = {'leases': [{'name': 'lease'}]}
+            if value is not None:
+                data['all_or_nothing'] = value
+
+            self.api.create_leases(data)
+
+            self.rpcapi.create_leases.assert_called_with(
+                [{'name': 'lease', 'trust_id': 'trust', 'user_id': 'fake'}],
+                all_or_nothing=all_or_nothing)
+
+    def test_create_leases_invalid_all_or_nothing(self):
+        self.assertRaises(exceptions.InvalidInput, self.api.create_leases,
+                          {'leases': [{'name': 'lease'}],
+                           'all_or_nothing': 'maybe'})
+        self.rpcapi.create_leases.assert_not_called()
@@ -27,8 +27,10 @@ class RESTApiTestCase(tests.TestCase):
         self.s_api = service_api
 
         self.render = self.patch(self.u_api, "render")
+        self.get_request_args = self.patch(self.u_api, "get_request_args")
         self.get_leases = self.patch(self.s_api.API, 'get_leases')
         self.create_lease = self.patch(self.s_api.API, 'create_lease')
+        self.create_leases = self.patch(self.s_api.API, 'create_leases')
         self.get_lease = self.patch(self.s_api.API, 'get_lease')
         self.update_lease = self.patch(self.s_api.API, 'update_lease')
         self.delete_lease = self.patch(self.s_api.API, 'delete_lease')
@@ -36,13 +38,20 @@ class RESTApiTestCase(tests.TestCase):
         self.fake_id = '1'
 
     def test_lease_list(self):
+        self.get_request_args.return_value.to_dict.return_value = {
+            'limit': '10'}
         self.api.leases_list()
+        self.get_leases.assert_called_once_with({'limit': '10'})
         self.render.assert_called_once_with(leases=self.get_leases())
 
     def test_leases_create(self):
         self.api.leases_create(data=None)
         self.render.assert_called_once_with(lease=self.create_lease())
 
+    def test_leases_create_bulk(self):
+        self.api.leases_create_bulk(data=None)
+        self.render.assert_called_once_with(leases=self.create_leases())
+
     def test_leases_get(self):
         self.api.leases_get(lease_id=self.fake_id)
         self.render.assert_called_once_with(lease=self.get_lease())
@@ -20,6 +20,7 @@ import six
 
 
 from blazar.tests import api
+from blazar.utils import leases as leases_utils
 from blazar.utils import trusts
 
 
@@ -117,6 +118,40 @@ class TestListLeases(api.APITest):
         response = self.get_json(self.path)
         self.assertEqual([fake_lease(id=id1), fake_lease(id=id2)], response)
 
+    def test_paginated_and_filtered(self):
+        list_leases = self.patch(self.rpcapi, 'list_leases')
+        list_leases.return_value = [self.fake_lease]
+        marker = six.text_type(uuidutils.generate_uuid())
+
+        response = self.get_json(
+            self.path + '?limit=10&marker=%s&sort_key=name&sort_dir=desc'
+            '&status=ACTIVE&start_before=2014-01-02%%2000:00' % marker)
+
+        self.assertEqual([self.fake_lease], response)
+        list_leases.assert_called_once_with(
+            limit=10, marker=marker, sort_key='name', sort_dir='desc',
+            filters={'status': 'ACTIVE', 'start_before': '2014-01-02 00:00'},
+            fields=None)
+
+    def test_sparse_fields(self):
+        list_leases = self.patch(self.rpcapi, 'list_leases')
+        list_leases.return_value = [{'id': self.fake_lease['id'],
+                                     'name': self.fake_lease['name']}]
+
+        response = self.get_json(self.path + '?fields=name')
+
+        self.assertEqual([{'id': self.fake_lease['id'],
+                           'name': self.fake_lease['name']}], response)
+        self.assertEqual(['name'], list_leases.call_args[1]['fields'])
+
+    def test_without_detail(self):
+        list_leases = self.patch(self.rpcapi, 'list_leases')
+
+        self.get_json(self.path + '?detail=false')
+
+        self.assertEqual(list(leases_utils.LEASE_FIELDS),
+                         list_leases.call_args[1]['fields'])
+
     def test_rpc_exception_list(self):
         def fake_list_leases(*args, **kwargs):
             raise Exception("Nah...")
@@ -253,6 +288,76 @@ class TestCreateLease(api.APITest):
         self.assertEqual(expected, response.json)
 
 
+class TestCreateLeasesBulk(api.APITest):
+
+    def setUp(self):
+        super(TestCreateLeasesBulk, self).setUp()
+
+        self.id1 = six.text_type(uuidutils.generate_uuid())
+        self.fake_lease = fake_lease(id=self.id1)
+        self.fake_lease_body = fake_lease_request_body(id=self.id1)
+        self.path = '/leases/bulk'
+        self.create_leases = self.patch(self.rpcapi, 'create_leases')
+
+        self.trusts = trusts
+        self.patch(self.trusts, 'create_trust').return_value = fake_trust()
+
+    def test_create_bulk(self):
+        self.create_leases.return_value = [
+            {'lease': self.fake_lease},
+            {'error': {'code': 409, 'message': 'Lease name exists'}}]
+
+        response = self.post_json(self.path,
+                                  {'leases': [self.fake_lease_body,
+                                              self.fake_lease_body],
+                                   'all_or_nothing': True})
+
+        self.assertEqual(202, response.status_int)
+        self.assertEqual('application/json', response.content_type)
+        self.assertEqual(
+            [{'lease': self.fake_lease},
+             {'error': {'code': 409, 'message': 'Lease name exists'}}],
+            response.json)
+        leases_values, = self.create_leases.call_args[0]
+        self.assertEqual(2, len(leases_values))
+        for lease_values in leases_values:
+            self.assertEqual(fake_trust().id, lease_values['trust_id'])
+        self.assertEqual({'all_or_nothing': True},
+                         self.create_leases.call_args[1])
+
+    def test_create_bulk_all_or_nothing(self):
+        self.create_leases.return_value = [{'lease': self.fake_lease}]
+        for value, all_or_nothing in (('false', False), ('true', True)):
+            response = self.post_json(self.path,
+                                      {'leases': [self.fake_lease_body],
+                                       'all_or_nothing': value})
+
+            self.assertEqual(202, response.status_int)
+            self.assertEqual({'all_or_nothing': all_or_nothing},
+                             self.create_leases.call_args[1])
+
+        response = self.post_json(self.path,
+                                  {'leases': [self.fake_lease_body]})
+
+        self.assertEqual({'all_or_nothing': False},
+                         self.create_leases.call_args[1])
+
+    def test_create_bulk_invalid_all_or_nothing(self):
+        response = self.post_json(self.path,
+                                  {'leases': [self.fake_lease_body],
+                                   'all_or_nothing': 'maybe'},
+                                  expect_errors=True)
+
+        self.assertEqual(400, response.status_int)
+        self.create_leases.assert_not_called()
+
+    def test_create_bulk_without_leases(self):
+        response = self.post_json(self.path, {'leases': []},
+                                  expect_errors=True)
+        self.assertEqual(400, response.status_int)
+        self.create_leases.assert_not_called()
+
+
 class TestUpdateLease(api.APITest):
 
     def setUp(self):
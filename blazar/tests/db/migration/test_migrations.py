@@ -181,3 +181,63 @@ class TestMigrations(migration.BaseWalkMigrationTestCase,
                               engine.execute,
                               computehosts_table.insert(),
                               data)
+
+    def _check_e66f199a5414(self, engine, data):
+        self.assertColumnExists(engine, 'events', 'claimed_by')
+        self.assertColumnExists(engine, 'events', 'claimed_at')
+
+    def _check_3a9b7e4f2c81(self, engine, data):
+        for table in ('leases', 'reservations', 'events',
+                      'computehost_reservations', 'instance_reservations',
+                      'computehost_allocations'):
+            self.assertTableExists(engine, 'shadow_' + table)
+        self.assertColumnExists(engine, 'shadow_events', 'claimed_by')
+        self.assertColumnExists(engine, 'shadow_leases', 'trust_id')
+        self.assertIndexMembers(engine, 'shadow_leases',
+                                'ix_shadow_leases_end_date', ['end_date'])
+        self.assertIndexMembers(engine, 'shadow_computehost_allocations',
+                                'ix_shadow_computehost_allocations_'
+                                'reservation_id', ['reservation_id'])
+
+    def _check_9c4d2e6f8a13(self, engine, data):
+        self.assertIndexMembers(engine, 'events', 'ix_events_status_time',
+                                ['status', 'time'])
+        self.assertIndexMembers(engine, 'leases',
+                                'ix_leases_start_date_end_date',
+                                ['start_date', 'end_date'])
+        self.assertIndexMembers(engine, 'computehost_allocations',
+                                'ix_computehost_allocations_compute_host_id',
+                                ['compute_host_id'])
+        self.assertIndexMembers(engine, 'computehost_extra_capabilities',
+                                'ix_computehost_extra_capabilities_host_name',
+                                ['computehost_id', 'capability_name'])
+
+    def _pre_upgrade_c4e1a8f2b7d5(self, engine):
+        data = [{'id': '1', 'computehost_id': '1', 'capability_name': 'gpus',
+                 'capability_value': '10'},
+                {'id': '2', 'computehost_id': '1', 'capability_name': 'disk',
+                 'capability_value': 'ssd'},
+                {'id': '3', 'computehost_id': '2', 'capability_name': 'gpus',
+                 'capability_value': '2.5'}]
+        extra_capabilities_table = self.get_table(
+            engine, 'computehost_extra_capabilities')
+        # pylint: disable=E1120
+        engine.execute(extra_capabilities_table.insert(), data)
+        return data
+
+    def _check_c4e1a8f2b7d5(self, engine, data):
+        self.assertColumnExists(engine, 'computehost_extra_capabilities',
+                                'numeric_value')
+        self.assertIndexMembers(
+            engine, 'computehost_extra_capabilities',
+            'ix_computehost_extra_capabilities_name_numeric_value',
+            ['capability_name', 'numeric_value'])
+
+        extra_capabilities_table = self.get_table(
+            engine, 'computehost_extra_capabilities')
+        numeric_values = dict(
+            (row.id, row.numeric_value) for row
+            in extra_capabilities_table.select().execute())
+        self.assertEqual(10, numeric_values['1'])
+        self.assertIsNone(numeric_values['2'])
+        self.assertEqual(2.5, numeric_values['3'])
@@ -15,11 +15,16 @@
 
 import datetime
 import operator
+import os
+import tempfile
 
+from oslo_config import cfg
 from oslo_utils import uuidutils
+import sqlalchemy as sa
 
 from blazar.db import exceptions as db_exceptions
 from blazar.db.sqlalchemy import api as db_api
+from blazar.db.sqlalchemy import facade_wrapper
 from blazar.db.sqlalchemy import models
 from blazar.plugins import oshosts as host_plugin
 from blazar import tests
@@ -169,11 +174,12 @@ def _get_fake_host_values(id=_get_fake_random_uuid(), mem=8192, disk=10):
 
 
 def _get_fake_host_extra_capabilities(id=_get_fake_random_uuid(),
-                                      computehost_id=_get_fake_random_uuid()):
+                                      computehost_id=_get_fake_random_uuid(),
+                                      name='vgpu', value='2'):
     return {'id': id,
             'computehost_id': computehost_id,
-            'capability_name': 'vgpu',
-            'capability_value': '2'}
+            'capability_name': name,
+            'capability_value': value}
 
 
 def is_result_sorted_correctly(results, sort_key, sort_dir='asc'):
@@ -207,6 +213,165 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
         self.assertEqual(0, len(db_api.event_get_all()))
         self.assertEqual(1, len(db_api.reservation_get_all()))
 
+    def _record_statements(self):
+        """Record the statements run on tables, i.e. not connection pings."""
+        statements = []
+        engine = db_api.get_engine()
+
+        def record(conn, cursor, statement, parameters, context,
+                   executemany):
+            if not statement.startswith('SELECT') or 'FROM' in statement:
+                statements.append(statement)
+
+        sa.event.listen(engine, 'before_cursor_execute', record)
+        self.addCleanup(sa.event.remove, engine, 'before_cursor_execute',
+                        record)
+        return statements
+
+    def test_create_lease_does_not_read_it_back(self):
+        values = _get_fake_phys_lease_values()
+        values['events'] = [
+            _get_fake_event_values(event_type='start_lease', status='UNDONE'),
+            _get_fake_event_values(event_type='end_lease', status='UNDONE')]
+        for event in values['events']:
+            del event['id']
+        statements = self._record_statements()
+
+        result = db_api.lease_create(values)
+
+        self.assertEqual([], [statement for statement in statements
+                              if statement.startswith('SELECT')])
+        self.assertEqual(1, len([statement for statement in statements
+                                 if statement.startswith(
+                                     'INSERT INTO events')]))
+        lease = db_api.lease_get(result.id).to_dict()
+        created = result.to_dict()
+        for values in (lease, created):
+            values['events'].sort(key=operator.itemgetter('id'))
+        self.assertEqual(lease, created)
+
+    def test_update_does_not_read_back(self):
+        reservation = db_api.reservation_create(
+            _get_fake_phys_reservation_values())
+        statements = self._record_statements()
+
+        result = db_api.reservation_update(reservation.id,
+                                           {'status': 'active'})
+
+        self.assertEqual(1, len([statement for statement in statements
+                                 if statement.startswith('SELECT')]))
+        self.assertEqual('active', result.status)
+        self.assertIsNotNone(result.updated_at)
+        self.assertEqual(db_api.reservation_get(reservation.id).to_dict(),
+                         result.to_dict())
+
+    def _create_leases_with_events(self, count):
+        for _i in range(count):
+            lease = _create_physical_lease(random=True)
+            for event_type in ('start_lease', 'end_lease'):
+                db_api.event_create(_get_fake_event_values(
+                    id=_get_fake_random_uuid(), lease_id=lease['id'],
+                    event_type=event_type))
+
+    def _count_selects(self, func, *args, **kwargs):
+        statements = self._record_statements()
+        result = func(*args, **kwargs)
+        return len([statement for statement in statements
+                    if statement.startswith('SELECT')]), result
+
+    def test_lease_list_loading(self):
+        self._create_leases_with_events(3)
+
+        # leases, reservations, their three dependent tables and events
+        count, leases = self._count_selects(db_api.lease_list)
+        self.assertEqual(6, count)
+        self.assertEqual(3, len(leases))
+        self.assertEqual([1, 1, 1],
+                         [len(lease.reservations) for lease in leases])
+        self.assertEqual([2, 2, 2], [len(lease.events) for lease in leases])
+
+        count, leases = self._count_selects(db_api.lease_list, load='joined')
+        self.assertEqual(1, count)
+        self.assertEqual(3, len(leases))
+
+        count, leases = self._count_selects(
+            db_api.lease_list,
+            load={'reservations.computehost_allocations': 'selectin'})
+        self.assertEqual(2, count)
+        self.assertEqual(3, len(leases))
+        self.assertTrue(all(lease.reservations[0].computehost_allocations
+                            for lease in leases))
+
+    def test_lease_get_loading(self):
+        self._create_leases_with_events(1)
+        lease_id = db_api.lease_get_all()[0].id
+
+        count, lease = self._count_selects(db_api.lease_get, lease_id)
+        self.assertEqual(1, count)
+        self.assertEqual(2, len(lease.to_dict()['events']))
+
+        count, lease = self._count_selects(db_api.lease_get, lease_id,
+                                           load={'events': 'noload'})
+        self.assertEqual(1, count)
+        self.assertEqual([], lease.to_dict()['events'])
+        self.assertEqual(1, len(lease.to_dict()['reservations']))
+
+        count, lease = self._count_selects(db_api.lease_get, lease_id,
+                                           load='raise')
+        self.assertEqual(1, count)
+        self.assertNotIn('reservations', lease.to_dict())
+        self.assertNotIn('events', lease.to_dict())
+        self.assertRaises(sa.exc.InvalidRequestError,
+                          getattr, lease, 'events')
+
+    def test_lease_get_invalid_loading(self):
+        self.assertRaises(db_exceptions.BlazarDBInvalidFilter,
+                          db_api.lease_get, 'fake', load='lazy')
+        self.assertRaises(db_exceptions.BlazarDBInvalidFilter,
+                          db_api.lease_get, 'fake',
+                          load={'trust': 'joined'})
+
+    def _sorted_lease_dict(self, lease):
+        for key in ('reservations', 'events'):
+            lease[key].sort(key=operator.itemgetter('id'))
+        return lease
+
+    def test_lease_get_as_dict(self):
+        self._create_leases_with_events(1)
+        lease = db_api.lease_get_all()[0]
+        reservation = db_api.reservation_create(
+            _get_fake_phys_reservation_values(id=_get_fake_random_uuid(),
+                                              lease_id=lease.id))
+        db_api.instance_reservation_create(_get_fake_instance_values(
+            id=_get_fake_random_uuid(), reservation_id=reservation.id))
+        statements = self._record_statements()
+
+        result = db_api.lease_get_as_dict(lease.id)
+
+        # lease, reservations and events
+        self.assertEqual(3, len(statements))
+        self.assertEqual(
+            self._sorted_lease_dict(db_api.lease_get(lease.id).to_dict()),
+            self._sorted_lease_dict(result))
+        self.assertEqual(2, len(result['reservations']))
+        self.assertIsNone(db_api.lease_get_as_dict('fake'))
+
+    def test_lease_list_as_dicts(self):
+        self._create_leases_with_events(3)
+        expected = [self._sorted_lease_dict(lease.to_dict())
+                    for lease in db_api.lease_list(sort_key='name')]
+
+        self.assertEqual(expected,
+                         [self._sorted_lease_dict(lease) for lease in
+                          db_api.lease_list_as_dicts(sort_key='name')])
+        self.assertEqual(expected[1:2],
+                         [self._sorted_lease_dict(lease) for lease in
+                          db_api.lease_list_as_dicts(
+                              sort_key='name', limit=1,
+                              marker=expected[0]['id'])])
+        self.assertEqual([], db_api.lease_list_as_dicts(
+            filters={'status': 'fake'}))
+
     def test_create_duplicate_leases(self):
         """Create two leases with same names, and checks it raises an error."""
 
@@ -261,6 +426,164 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
                          _get_fake_phys_lease_values()['name'])
         self.assertEqual(1, len(db_api.event_get_all()))
 
+    def test_create_lease_with_events_without_id(self):
+        lease = _get_fake_phys_lease_values()
+        for event_type in ('start_lease', 'end_lease'):
+            event = _get_fake_event_values(event_type=event_type)
+            del event['id']
+            del event['lease_id']
+            lease['events'].append(event)
+
+        result = db_api.lease_create(lease)
+
+        self.assertEqual(2, len(result['events']))
+        for event in result['events']:
+            self.assertEqual(lease['id'], event['lease_id'])
+            self.assertIsNotNone(event['id'])
+
+    def test_transaction_commit(self):
+        with db_api.transaction():
+            lease = db_api.lease_create(_get_fake_phys_lease_values())
+            db_api.event_create(_get_fake_event_values(lease_id=lease['id']))
+            self.assertEqual(1, len(db_api.event_get_all()))
+
+        self.assertIsNotNone(db_api.lease_get(lease['id']))
+        self.assertEqual(1, len(db_api.event_get_all()))
+
+    def test_transaction_rollback(self):
+        def create_lease():
+            with db_api.transaction():
+                lease = db_api.lease_create(_get_fake_phys_lease_values())
+                db_api.event_create(
+                    _get_fake_event_values(lease_id=lease['id']))
+                raise RuntimeError()
+
+        self.assertRaises(RuntimeError, create_lease)
+
+        self.assertEqual([], db_api.lease_get_all())
+        self.assertEqual([], db_api.reservation_get_all())
+        self.assertEqual([], db_api.event_get_all())
+
+    def test_transaction_nested(self):
+        def create_lease():
+            with db_api.transaction():
+                db_api.lease_create(_get_fake_phys_lease_values())
+                with db_api.transaction():
+                    db_api.event_create(_get_fake_event_values())
+                raise RuntimeError()
+
+        self.assertRaises(RuntimeError, create_lease)
+
+        self.assertEqual([], db_api.lease_get_all())
+        self.assertEqual([], db_api.event_get_all())
+
+    def test_transaction_after_rollback(self):
+        calls = []
+
+        def create_lease():
+            with db_api.transaction():
+                db_api.after_rollback(lambda: calls.append(1))
+                with db_api.transaction():
+                    db_api.after_rollback(lambda: calls.append(2))
+                raise RuntimeError()
+
+        with db_api.transaction():
+            db_api.after_rollback(lambda: calls.append(0))
+        db_api.after_rollback(lambda: calls.append(0))
+        self.assertEqual([], calls)
+
+        self.assertRaises(RuntimeError, create_lease)
+
+        self.assertEqual([2, 1], calls)
+
+    def test_unit_of_work_after_rollback(self):
+        calls = []
+
+        def create_lease():
+            with db_api.unit_of_work(transactional=True):
+                db_api.after_rollback(lambda: calls.append(1))
+                raise RuntimeError()
+
+        with db_api.unit_of_work():
+            db_api.after_rollback(lambda: calls.append(0))
+            self.assertRaises(RuntimeError, create_lease)
+
+        self.assertEqual([1], calls)
+
+    def test_unit_of_work(self):
+        checkouts = []
+        engine = db_api.get_engine()
+
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            checkouts.append(dbapi_connection)
+
+        sa.event.listen(engine, 'checkout', checkout)
+        self.addCleanup(sa.event.remove, engine, 'checkout', checkout)
+
+        with db_api.unit_of_work():
+            session = db_api.get_session()
+            lease = db_api.lease_create(_get_fake_phys_lease_values())
+            db_api.event_create(_get_fake_event_values(lease_id=lease['id']))
+            with db_api.unit_of_work():
+                self.assertIs(session, db_api.get_session())
+                db_api.lease_get(lease['id'])
+            self.assertEqual(1, len(db_api.event_get_all()))
+
+        self.assertEqual(1, len(checkouts))
+        self.assertIsNot(session, db_api.get_session())
+        self.assertEqual(1, len(db_api.event_get_all()))
+
+    def test_unit_of_work_transaction(self):
+        def create_lease():
+            with db_api.unit_of_work():
+                db_api.event_create(_get_fake_event_values())
+                with db_api.transaction():
+                    db_api.lease_create(_get_fake_phys_lease_values())
+                    raise RuntimeError()
+
+        self.assertRaises(RuntimeError, create_lease)
+
+        self.assertEqual([], db_api.lease_get_all())
+        self.assertEqual(1, len(db_api.event_get_all()))
+
+    def test_unit_of_work_transactional(self):
+        def create_lease():
+            with db_api.unit_of_work(transactional=True):
+                db_api.lease_create(_get_fake_phys_lease_values())
+                db_api.event_create(_get_fake_event_values())
+                raise RuntimeError()
+
+        self.assertRaises(RuntimeError, create_lease)
+
+        self.assertEqual([], db_api.lease_get_all())
+        self.assertEqual([], db_api.event_get_all())
+
+    def test_unit_of_work_claim_then_get(self):
+        db_api.event_create(_get_fake_event_values(id='1', status='UNDONE'))
+
+        with db_api.unit_of_work():
+            # NOTE: the identity map only holds weak references
+            loaded = db_api.event_get('1')
+            self.assertEqual('UNDONE', loaded.status)
+            self.assertTrue(db_api.event_claim('1', 'worker'))
+            event = db_api.event_get('1')
+            self.assertEqual('IN_PROGRESS', event.status)
+            self.assertEqual('worker', event.claimed_by)
+
+    def test_unit_of_work_bulk_insert_then_get(self):
+        lease = db_api.lease_create(_get_fake_phys_lease_values(
+            id='lease', name='lease'))
+        reservation_id = lease['reservations'][0]['id']
+
+        with db_api.unit_of_work():
+            loaded = db_api.reservation_get(reservation_id)
+            self.assertIsNone(loaded.computehost_allocations)
+            db_api.host_allocation_create_bulk(
+                [{'compute_host_id': 'host',
+                  'reservation_id': reservation_id}])
+            self.assertEqual('host', db_api.reservation_get(
+                reservation_id).computehost_allocations.compute_host_id)
+
     def test_delete_wrong_lease(self):
         """Delete a lease that doesn't exist and check that raises an error."""
         self.assertRaises(db_exceptions.BlazarDBNotFound,
@@ -299,16 +622,148 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
         _create_physical_lease(random=True)
         self.assertEqual(2, len(db_api.lease_get_all()))
 
+    def _create_leases_for_list(self):
+        for id, name, start, end, status in (
+                ('1', 'fake3', '2030-01-01 00:00', '2030-01-02 00:00',
+                 'PENDING'),
+                ('2', 'fake1', '2030-01-03 00:00', '2030-01-04 00:00',
+                 'ACTIVE'),
+                ('3', 'fake2', '2030-01-05 00:00', '2030-01-06 00:00',
+                 'ACTIVE')):
+            values = _get_fake_phys_lease_values(
+                id=id, name=name, start_date=_get_datetime(start),
+                end_date=_get_datetime(end))
+            values['status'] = status
+            values['reservations'][0]['id'] = _get_fake_random_uuid()
+            db_api.lease_create(values)
+
     def test_lease_list(self):
-        """Not implemented yet until lease_list returns list of IDs."""
-        # TODO(sbauza): Enable this test when lease_list will return only IDs
-        self.assertTrue(True)
-        return
-        _create_physical_lease(
-            values=_get_fake_phys_lease_values(id='1', name='fake1'))
-        _create_physical_lease(
-            values=_get_fake_phys_lease_values(id='2', name='fake2'))
-        self.assertEqual(['1', '2'], db_api.lease_list())
+        self._create_leases_for_list()
+
+        self.assertEqual(['2', '3', '1'],
+                         [lease.id for lease in
+                          db_api.lease_list(sort_key='name')])
+        self.assertEqual(['1', '3', '2'],
+                         [lease.id for lease in
+                          db_api.lease_list(sort_key='name',
+                                            sort_dir='desc')])
+        self.assertEqual([], db_api.lease_list(project_id='other'))
+
+    def test_lease_list_paginated(self):
+        self._create_leases_for_list()
+
+        page = db_api.lease_list(limit=2, sort_key='start_date')
+        self.assertEqual(['1', '2'], [lease.id for lease in page])
+        page = db_api.lease_list(limit=2, marker=page[-1].id,
+                                 sort_key='start_date')
+        self.assertEqual(['3'], [lease.id for lease in page])
+
+    def test_lease_list_filtered(self):
+        self._create_leases_for_list()
+
+        def ids(**filters):
+            return sorted(lease.id for lease in
+                          db_api.lease_list(filters=filters))
+
+        self.assertEqual(['2', '3'], ids(status='ACTIVE'))
+        self.assertEqual(['1', '2', '3'],
+                         ids(resource_type=host_plugin.RESOURCE_TYPE))
+        self.assertEqual([], ids(resource_type='virtual:instance'))
+        self.assertEqual(['2'],
+                         ids(start_before=_get_datetime('2030-01-04 00:00'),
+                             end_after=_get_datetime('2030-01-02 12:00')))
+
+    def test_lease_list_fields(self):
+        self._create_leases_for_list()
+
+        leases = db_api.lease_list(sort_key='name', fields=['id', 'name'])
+
+        self.assertEqual([{'id': '2', 'name': 'fake1'},
+                          {'id': '3', 'name': 'fake2'},
+                          {'id': '1', 'name': 'fake3'}], leases)
+
+    def test_lease_get_fields(self):
+        self._create_leases_for_list()
+
+        lease = db_api.lease_get('1', fields=['id', 'start_date',
+                                              'created_at'])
+
+        self.assertEqual(['created_at', 'id', 'start_date'], sorted(lease))
+        self.assertEqual(_get_datetime('2030-01-01 00:00'),
+                         lease['start_date'])
+        self.assertIsInstance(lease['created_at'], str)
+        self.assertIsNone(db_api.lease_get('fake', fields=['id']))
+        self.assertRaises(db_exceptions.BlazarDBInvalidFilter,
+                          db_api.lease_get, '1', fields=['reservations'])
+
+    def test_lease_list_invalid_filter(self):
+        self.assertRaises(db_exceptions.BlazarDBInvalidFilter,
+                          db_api.lease_list, filters={'trust_id': 'fake'})
+        self.assertRaises(db_exceptions.BlazarDBInvalidFilter,
+                          db_api.lease_list, sort_key='fake')
+
+    def test_lease_list_marker_not_found(self):
+        self.assertRaises(db_exceptions.BlazarDBNotFound,
+                          db_api.lease_list, marker='fake')
+
+    def _create_finished_lease(self, end_date, event_status='DONE'):
+        values = _get_fake_phys_lease_values(
+            id=_get_fake_random_uuid(), name=_get_fake_random_uuid(),
+            start_date=_get_datetime('2000-01-01 00:00'),
+            end_date=_get_datetime(end_date))
+        lease = _create_physical_lease(values=values)
+        db_api.event_create(_get_fake_event_values(
+            id=_get_fake_random_uuid(), lease_id=lease['id'],
+            event_type='end_lease', status=event_status))
+        return lease['id']
+
+    def _count_archived(self, table):
+        return db_api.get_session().execute(
+            models.SHADOW_TABLES[table].count()).scalar()
+
+    def test_archive_leases(self):
+        finished = self._create_finished_lease('2000-01-02 00:00')
+        running = self._create_finished_lease('2000-01-02 00:00',
+                                              event_status='UNDONE')
+        recent = self._create_finished_lease('2020-01-02 00:00')
+
+        archived = db_api.archive_leases(_get_datetime('2010-01-01 00:00'),
+                                         10)
+
+        self.assertEqual(1, archived)
+        self.assertIsNone(db_api.lease_get(finished))
+        self.assertIsNotNone(db_api.lease_get(running))
+        self.assertIsNotNone(db_api.lease_get(recent))
+        self.assertEqual(2, len(db_api.reservation_get_all()))
+        self.assertEqual(2, len(db_api.event_get_all()))
+        self.assertEqual(2, len(db_api.host_allocation_get_all()))
+        for table in ('leases', 'reservations', 'events',
+                      'computehost_reservations', 'computehost_allocations'):
+            self.assertEqual(1, self._count_archived(table))
+
+    def test_archive_leases_in_batches(self):
+        for _i in range(3):
+            self._create_finished_lease('2000-01-02 00:00')
+        before = _get_datetime('2010-01-01 00:00')
+
+        self.assertEqual(2, db_api.archive_leases(before, 2))
+        self.assertEqual(1, db_api.archive_leases(before, 2))
+        self.assertEqual(0, db_api.archive_leases(before, 2))
+        self.assertEqual([], db_api.lease_get_all())
+        self.assertEqual(3, self._count_archived('leases'))
+
+    def test_purge_archived_leases(self):
+        self._create_finished_lease('2000-01-02 00:00')
+        self._create_finished_lease('2005-01-02 00:00')
+        db_api.archive_leases(_get_datetime('2010-01-01 00:00'), 10)
+
+        purged = db_api.purge_archived_leases(
+            _get_datetime('2003-01-01 00:00'), 10)
+
+        self.assertEqual(1, purged)
+        for table in ('leases', 'reservations', 'events',
+                      'computehost_reservations', 'computehost_allocations'):
+            self.assertEqual(1, self._count_archived(table))
 
     def test_lease_update(self):
         """Update both start_time and name and check lease has been updated."""
@@ -504,6 +959,77 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
         self.assertRaises(db_exceptions.BlazarDBNotFound,
                           db_api.host_get_all_by_queries, ['apples < 2048'])
 
+    def test_search_for_hosts_by_typed_extra_capability(self):
+        for host_id, gpus, disk in (('1', '9', 'ssd'), ('2', '10', 'hdd'),
+                                    ('3', '2.5', None)):
+            db_api.host_create(_get_fake_host_values(id=host_id))
+            db_api.host_extra_capability_create(
+                _get_fake_host_extra_capabilities(
+                    id=_get_fake_random_uuid(), computehost_id=host_id,
+                    name='gpus', value=gpus))
+            if disk:
+                db_api.host_extra_capability_create(
+                    _get_fake_host_extra_capabilities(
+                        id=_get_fake_random_uuid(), computehost_id=host_id,
+                        name='disk', value=disk))
+
+        def search(*queries):
+            return sorted(host['id'] for host
+                          in db_api.host_get_all_by_queries(list(queries)))
+
+        self.assertEqual(['2'], search('gpus > 9'))
+        self.assertEqual(['1', '3'], search('gpus < 10'))
+        self.assertEqual(['1', '2'], search('gpus >= 9.0'))
+        self.assertEqual(['3'], search('gpus == 2.50'))
+        self.assertEqual(['1', '2'], search('gpus != 2.5'))
+        self.assertEqual([], search('gpus == 1e1'))
+        self.assertEqual(['1'], search('disk == ssd'))
+        self.assertEqual(['2'], search('disk != ssd'))
+        self.assertEqual(['1'], search('disk > hdd', 'gpus <= 9'))
+        self.assertRaises(NotImplementedError,
+                          db_api.host_get_all_by_queries, ['gpus like 9'])
+
+    def test_search_for_hosts_by_extra_capability_without_numeric_value(self):
+        for host_id, gpus in (('1', '9'), ('2', '10'), ('3', 'ssd'),
+                              ('4', '1..2'), ('5', '-2-'), ('6', 'nan')):
+            db_api.host_create(_get_fake_host_values(id=host_id))
+            db_api.host_extra_capability_create(
+                _get_fake_host_extra_capabilities(
+                    id=host_id, computehost_id=host_id, name='gpus',
+                    value=gpus))
+        # NOTE: the rows written by a manager not setting numeric_value yet
+        db_api.get_session().query(models.ComputeHostExtraCapability).update(
+            {'numeric_value': None})
+
+        def search(*queries):
+            return sorted(host['id'] for host
+                          in db_api.host_get_all_by_queries(list(queries)))
+
+        self.assertEqual(['2'], search('gpus > 9'))
+        self.assertEqual(['1'], search('gpus < 10'))
+        self.assertEqual(['1'], search('gpus <= 9.0'))
+        self.assertEqual(['2', '3', '4', '5', '6'], search('gpus != 9'))
+        self.assertEqual(['6'], search('gpus == nan'))
+        self.assertEqual(['3', '6'], search('gpus > inf'))
+
+    def test_host_extra_capability_numeric_value(self):
+        for id, value, numeric_value in (('1', '9', 9), ('2', 'ssd', None),
+                                         ('3', 'nan', None),
+                                         ('4', '1e40', None),
+                                         ('5', '1e3', None),
+                                         ('6', ' 5', None),
+                                         ('7', '-.5', -0.5)):
+            result = db_api.host_extra_capability_create(
+                _get_fake_host_extra_capabilities(id=id, value=value))
+            self.assertEqual(numeric_value, result.numeric_value)
+
+        result = db_api.host_extra_capability_update(
+            '2', {'capability_value': '2.5'})
+        self.assertEqual(2.5, result.numeric_value)
+        result = db_api.host_extra_capability_update(
+            '1', {'capability_value': 'hdd'})
+        self.assertIsNone(result.numeric_value)
+
     def test_search_for_hosts_by_composed_queries(self):
         """Create one host and test composed queries."""
 
@@ -552,7 +1078,7 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
 
     def test_create_host_extra_capability(self):
         result = db_api.host_extra_capability_create(
-            _get_fake_host_extra_capabilities(id=1))
+            _get_fake_host_extra_capabilities(id='1'))
         self.assertEqual(result['id'], _get_fake_host_values(id='1')['id'])
 
     def test_create_duplicated_host_extra_capability(self):
@@ -672,6 +1198,18 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
 
         self.assertEqual(2, len(db_api.host_allocation_get_all()))
 
+    def test_host_allocation_create_bulk(self):
+        ids = db_api.host_allocation_create_bulk(
+            [_get_fake_host_allocation_values(compute_host_id='1'),
+             _get_fake_host_allocation_values(compute_host_id='2')])
+
+        self.assertEqual(2, len(ids))
+        self.assertEqual(
+            ['1', '2'],
+            sorted(db_api.host_allocation_get(allocation_id).compute_host_id
+                   for allocation_id in ids))
+        self.assertEqual([], db_api.host_allocation_create_bulk([]))
+
     def test_host_allocation_create_for_duplicated_hosts(self):
         db_api.host_allocation_create(
             _get_fake_host_allocation_values(id='1')
@@ -681,6 +1219,67 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
                           db_api.host_allocation_create,
                           _get_fake_host_allocation_values(id='1'))
 
+    def test_host_allocation_create_not_returning(self):
+        self.assertIsNone(db_api.host_allocation_create(
+            _get_fake_host_allocation_values(id='1'), returning=False))
+        self.assertIsNotNone(db_api.host_allocation_get('1'))
+
+    def test_host_allocation_get_all_with_dates(self):
+        for name, host_id, start, end in (
+                ('lease-1', 'host-1', '2030-01-01 00:00', '2030-01-02 00:00'),
+                ('lease-2', 'host-2', '2030-01-02 00:00', '2030-01-03 00:00')):
+            _create_physical_lease(_get_fake_phys_lease_values(
+                id=name, name=name, start_date=_get_datetime(start),
+                end_date=_get_datetime(end), resource_id=host_id))
+
+        allocations = db_api.host_allocation_get_all_with_dates()
+
+        self.assertEqual(
+            [('host-1', _get_datetime('2030-01-01 00:00'),
+              _get_datetime('2030-01-02 00:00')),
+             ('host-2', _get_datetime('2030-01-02 00:00'),
+              _get_datetime('2030-01-03 00:00'))],
+            sorted((allocation['compute_host_id'], allocation['start_date'],
+                    allocation['end_date']) for allocation in allocations))
+        self.assertEqual(
+            ['host-2'],
+            [allocation['compute_host_id'] for allocation
+             in db_api.host_allocation_get_all_with_dates(
+                 start_date=_get_datetime('2030-01-02 00:00'),
+                 end_date=_get_datetime('2030-01-04 00:00'))])
+        self.assertEqual(
+            [], db_api.host_allocation_get_all_with_dates(
+                ['host-1'], _get_datetime('2030-01-02 00:00'),
+                _get_datetime('2030-01-04 00:00')))
+        self.assertEqual(
+            ['host-1'],
+            [allocation['compute_host_id'] for allocation
+             in db_api.host_allocation_get_all_with_dates(['host-1'])])
+
+    def test_host_allocation_partition(self):
+        for host_id in ('host-1', 'host-2', 'host-3'):
+            db_api.host_create(_get_fake_host_values(id=host_id))
+        for name, host_id, start, end in (
+                ('lease-1', 'host-1', '2030-01-01 00:00', '2030-01-02 00:00'),
+                ('lease-2', 'host-2', '2030-01-02 00:00', '2030-01-03 00:00')):
+            _create_physical_lease(_get_fake_phys_lease_values(
+                id=name, name=name, start_date=_get_datetime(start),
+                end_date=_get_datetime(end), resource_id=host_id))
+
+        not_allocated, allocated = db_api.host_allocation_partition(
+            ['host-3', 'host-2', 'host-1'], _get_datetime('2030-01-02 00:00'),
+            _get_datetime('2030-01-04 00:00'))
+
+        self.assertEqual(['host-3'], not_allocated)
+        self.assertEqual(['host-1', 'host-2'], sorted(allocated))
+        self.assertEqual([], allocated['host-1'])
+        self.assertEqual(
+            [('lease-2', _get_datetime('2030-01-02 00:00'),
+              _get_datetime('2030-01-03 00:00'))],
+            [(db_api.reservation_get(allocation['reservation_id'])['lease_id'],
+              allocation['start_date'], allocation['end_date'])
+             for allocation in allocated['host-2']])
+
     def test_host_allocation_update_for_host(self):
         host_allocation = db_api.host_allocation_create(
             _get_fake_host_allocation_values(
@@ -999,3 +1598,167 @@ class SQLAlchemyDBApiTestCase(tests.DBTestCase):
         self.assertTrue(is_result_sorted_correctly(filtered_events,
                                                    sort_key=sort_key,
                                                    sort_dir=sort_dir))
+
+    def test_event_get_sorted_by_time_filter(self):
+        def check_query(border, op, expected_ids):
+            filtered_events = db_api.event_get_all_sorted_by_filters(
+                sort_key='time',
+                sort_dir='asc',
+                filters={'time': {'border': border, 'op': op}}
+            )
+            self.assertEqual(expected_ids, [ev.id for ev in filtered_events])
+
+        time1 = _get_datetime('2030-01-01 01:00')
+        time2 = _get_datetime('2030-01-01 02:00')
+        time3 = _get_datetime('2030-01-01 03:00')
+        db_api.event_create(_get_fake_event_values(id='1', time=time1))
+        db_api.event_create(_get_fake_event_values(id='2', time=time2))
+        db_api.event_create(_get_fake_event_values(id='3', time=time3))
+
+        check_query(time2, 'lt', ['1'])
+        check_query(time2, 'le', ['1', '2'])
+        check_query(time2, 'gt', ['3'])
+        check_query(time2, 'ge', ['2', '3'])
+        check_query(time2, 'eq', ['2'])
+
+    def test_event_get_sorted_by_filters_limit(self):
+        for i in range(3):
+            db_api.event_create(_get_fake_event_values(
+                id=str(i), time=_get_datetime('2030-01-01 0%d:00' % i)))
+        filters = {'time': {'border': _get_datetime('2030-01-01 02:00'),
+                            'op': 'le'}}
+
+        events = db_api.event_get_all_sorted_by_filters(
+            sort_key='time', sort_dir='desc', filters=filters, limit=2)
+
+        self.assertEqual(['2', '1'], [ev.id for ev in events])
+        self.assertEqual(3, db_api.event_count_by_filters(filters))
+        self.assertEqual(0, db_api.event_count_by_filters(
+            {'status': 'IN_PROGRESS'}))
+
+    def test_event_get_sorted_by_time_filter_invalid_operator(self):
+        self.assertRaises(db_exceptions.BlazarDBInvalidFilterOperator,
+                          db_api.event_get_all_sorted_by_filters,
+                          sort_key='time',
+                          sort_dir='asc',
+                          filters={'time': {'border': _get_datetime(),
+                                            'op': 'foo'}})
+
+    def test_event_update_all_by_lease_id(self):
+        db_api.event_create(_get_fake_event_values(
+            id='1', event_type='start_lease', status='UNDONE'))
+        db_api.event_create(_get_fake_event_values(
+            id='2', event_type='end_lease', status='UNDONE'))
+        db_api.event_create(_get_fake_event_values(
+            id='3', event_type='before_end_lease', status='DONE'))
+        db_api.event_create(_get_fake_event_values(
+            id='4', lease_id='other', event_type='start_lease'))
+
+        events = db_api.event_update_all_by_lease_id(
+            _get_fake_lease_uuid(),
+            {'end_lease': {'time': _get_datetime('2030-04-01 00:00')},
+             'before_end_lease': {'time': _get_datetime('2030-03-31 00:00'),
+                                  'status': 'UNDONE'}})
+
+        self.assertEqual(['1', '2', '3'],
+                         sorted(event['id'] for event in events))
+        self.assertEqual(_get_datetime('2030-03-01 00:00'),
+                         db_api.event_get('1')['time'])
+        self.assertEqual(_get_datetime('2030-04-01 00:00'),
+                         db_api.event_get('2')['time'])
+        self.assertEqual('UNDONE', db_api.event_get('3')['status'])
+        self.assertEqual(_get_datetime('2030-03-01 00:00'),
+                         db_api.event_get('4')['time'])
+
+    def test_event_claim(self):
+        db_api.event_create(_get_fake_event_values(id='1', status='UNDONE'))
+
+        self.assertTrue(db_api.event_claim('1', 'worker1'))
+        self.assertFalse(db_api.event_claim('1', 'worker2'))
+
+        event = db_api.event_get('1')
+        self.assertEqual('IN_PROGRESS', event['status'])
+        self.assertEqual('worker1', event['claimed_by'])
+        self.assertIsNotNone(event['claimed_at'])
+
+    def test_event_claim_not_undone(self):
+        db_api.event_create(_get_fake_event_values(id='1', status='DONE'))
+
+        self.assertFalse(db_api.event_claim('1', 'worker1'))
+        self.assertEqual('DONE', db_api.event_get('1')['status'])
+
+    def test_event_requeue_stale_claims(self):
+        db_api.event_create(_get_fake_event_values(id='1', status='UNDONE'))
+        db_api.event_create(_get_fake_event_values(id='2', status='UNDONE'))
+        db_api.event_create(_get_fake_event_values(id='3',
+                                                   status='IN_PROGRESS'))
+        db_api.event_claim('1', 'worker1')
+        db_api.event_update('1', {'claimed_at': _get_datetime('2000-01-01 '
+                                                              '00:00')})
+        db_api.event_claim('2', 'worker1')
+
+        requeued = db_api.event_requeue_stale_claims(
+            _get_datetime('2010-01-01 00:00'))
+
+        self.assertEqual(1, requeued)
+        event = db_api.event_get('1')
+        self.assertEqual('UNDONE', event['status'])
+        self.assertIsNone(event['claimed_by'])
+        self.assertIsNone(event['claimed_at'])
+        self.assertEqual('IN_PROGRESS', db_api.event_get('2')['status'])
+        self.assertEqual('IN_PROGRESS', db_api.event_get('3')['status'])
+
+    def test_event_requeue_stale_claims_in_error(self):
+        db_api.event_create(_get_fake_event_values(id='1', status='UNDONE'))
+        db_api.event_claim('1', 'worker1')
+        db_api.event_update('1', {'status': 'ERROR',
+                                  'claimed_at': _get_datetime('2000-01-01 '
+                                                              '00:00')})
+
+        self.assertEqual(0, db_api.event_requeue_stale_claims(
+            _get_datetime('2010-01-01 00:00')))
+        self.assertEqual('ERROR', db_api.event_get('1')['status'])
+
+
+class SQLAlchemyDBReplicaTestCase(tests.DBTestCase):
+    """Test case for the routing of read-only calls to a replica."""
+
+    def setUp(self):
+        super(SQLAlchemyDBReplicaTestCase, self).setUp()
+        # NOTE: the replica is an empty DB, so that the leases written to the
+        # primary are only found when they are read from the primary.
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        cfg.CONF.set_override('slave_connection', 'sqlite:///' + path,
+                              group='database')
+        self.addCleanup(cfg.CONF.clear_override, 'slave_connection',
+                        group='database')
+        facade_wrapper._clear_engine()
+        self.addCleanup(facade_wrapper._clear_engine)
+        models.Lease.metadata.create_all(
+            facade_wrapper._get_facade().get_engine(use_slave=True))
+        self.lease = db_api.lease_create(_get_fake_phys_lease_values())
+
+    def test_read_from_replica(self):
+        self.assertIsNone(db_api.lease_get_as_dict(self.lease.id))
+        self.assertEqual([], db_api.lease_list())
+        self.assertEqual(1, len(db_api.reservation_get_all()))
+
+    def test_read_primary(self):
+        with db_api.read_primary():
+            self.assertIsNotNone(db_api.lease_get_as_dict(self.lease.id))
+            self.assertEqual(1, len(db_api.lease_list()))
+        self.assertIsNone(db_api.lease_get_as_dict(self.lease.id))
+
+    def test_read_in_transaction(self):
+        with db_api.transaction():
+            self.assertIsNotNone(db_api.lease_get_as_dict(self.lease.id))
+
+    def test_read_in_unit_of_work(self):
+        with db_api.unit_of_work():
+            self.assertIsNone(db_api.lease_get_as_dict(self.lease.id))
+            db_api.event_create(_get_fake_event_values(
+                lease_id=self.lease.id))
+            self.assertIsNotNone(db_api.lease_get_as_dict(self.lease.id))
+        self.assertIsNone(db_api.lease_get_as_dict(self.lease.id))
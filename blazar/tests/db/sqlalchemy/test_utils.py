@@ -376,5 +376,67 @@ class SQLAlchemyDBUtilsTestCase(tests.DBTestCase):
         self.check_reservation(expected, 'r1',
                                '2030-01-01 08:00', '2030-01-01 17:00')
 
+    def test_get_hosts_availability(self):
+        self._setup_leases()
+
+        ret = db_utils.get_hosts_availability(
+            ['r1', 'r2', 'r4'], _get_datetime('2030-01-01 10:00'),
+            _get_datetime('2030-01-01 11:00'))
+        self.assertEqual({'r1': False, 'r2': True, 'r4': True}, ret)
+
+        # Leases ending when the period starts do not overlap it
+        ret = db_utils.get_hosts_availability(
+            ['r1', 'r2'], _get_datetime('2030-01-01 12:45'),
+            _get_datetime('2030-01-01 13:00'))
+        self.assertEqual({'r1': True, 'r2': True}, ret)
+
+        self.assertEqual({}, db_utils.get_hosts_availability(
+            [], _get_datetime('2030-01-01 10:00'),
+            _get_datetime('2030-01-01 11:00')))
+
+    def test_get_hosts_availability_inclusive(self):
+        self._setup_leases()
+
+        # Leases ending when the period starts, or starting when it ends,
+        # overlap it, as for get_reservations_by_host_id
+        for start, end, expected in (
+                ('2030-01-01 12:45', '2030-01-01 12:50',
+                 {'r1': True, 'r2': False, 'r4': True}),
+                ('2030-01-01 12:50', '2030-01-01 13:00',
+                 {'r1': False, 'r2': True, 'r4': True}),
+                ('2030-01-01 12:50', '2030-01-01 12:55',
+                 {'r1': True, 'r2': True, 'r4': True})):
+            start, end = _get_datetime(start), _get_datetime(end)
+            ret = db_utils.get_hosts_availability(
+                ['r1', 'r2', 'r4'], start, end, inclusive=True)
+            self.assertEqual(expected, ret)
+            self.assertEqual(
+                expected,
+                dict((host_id, not db_utils.get_reservations_by_host_id(
+                    host_id, start, end)) for host_id in expected))
+
+    def test_get_hosts_availability_reserved_periods(self):
+        self._setup_leases()
+        fake_lease = _get_fake_phys_lease_values(
+            id='lease4',
+            name='fake_phys_lease_r4',
+            start_date=_get_datetime('2030-01-01 10:00'),
+            end_date=_get_datetime('2030-01-01 11:30'),
+            resource_id='r1')
+        _create_physical_lease(values=fake_lease)
+
+        ret = db_utils.get_hosts_availability(
+            ['r1', 'r2', 'r4'], _get_datetime('2030-01-01 09:30'),
+            _get_datetime('2030-01-01 13:30'), reserved_periods=True)
+
+        self.assertEqual({
+            'r1': [(_get_datetime('2030-01-01 09:30'),
+                    _get_datetime('2030-01-01 11:30')),
+                   (_get_datetime('2030-01-01 13:00'),
+                    _get_datetime('2030-01-01 13:30'))],
+            'r2': [(_get_datetime('2030-01-01 11:00'),
+                    _get_datetime('2030-01-01 12:45'))],
+            'r4': []}, ret)
+
 # TODO(frossigneux) longest_availability
 # TODO(frossigneux) shortest_availability
@@ -0,0 +1,156 @@
+# Copyright (c) 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+
+from blazar.db import api as db_api
+from blazar.manager import allocation_index
+from blazar import tests
+
+
+def _date(hour):
+    return datetime.datetime(2030, 1, 1) + datetime.timedelta(hours=hour)
+
+
+class HostAllocationIndexTestCase(tests.TestCase):
+    def setUp(self):
+        super(HostAllocationIndexTestCase, self).setUp()
+        self.index = allocation_index.HostAllocationIndex()
+        self.index.add('reservation-1', ['host-1', 'host-2'], _date(2),
+                       _date(4))
+        self.index.add('reservation-2', ['host-1'], _date(6), _date(8))
+        self.rollback_callbacks = []
+        self.patch(db_api, 'after_rollback').side_effect = (
+            self.rollback_callbacks.append)
+
+    def _rollback(self):
+        for callback in reversed(self.rollback_callbacks):
+            callback()
+
+    def test_is_free(self):
+        self.assertTrue(self.index.is_free('host-1', _date(0), _date(2)))
+        self.assertTrue(self.index.is_free('host-1', _date(4), _date(6)))
+        self.assertTrue(self.index.is_free('host-1', _date(8), _date(9)))
+        self.assertTrue(self.index.is_free('host-3', _date(0), _date(9)))
+        self.assertFalse(self.index.is_free('host-1', _date(1), _date(3)))
+        self.assertFalse(self.index.is_free('host-1', _date(3), _date(7)))
+        self.assertFalse(self.index.is_free('host-1', _date(0), _date(9)))
+        self.assertFalse(self.index.is_free('host-2', _date(3), _date(9)))
+        self.assertTrue(self.index.is_free('host-2', _date(5), _date(9)))
+
+    def test_is_free_overlapping_allocations(self):
+        self.index.add('reservation-3', ['host-1'], _date(1), _date(10))
+
+        self.assertFalse(self.index.is_free('host-1', _date(8), _date(9)))
+        self.assertTrue(self.index.is_free('host-1', _date(10), _date(11)))
+
+    def test_is_free_ignored_reservation(self):
+        self.assertTrue(self.index.is_free(
+            'host-1', _date(1), _date(5), ignored_reservation='reservation-1'))
+        self.assertFalse(self.index.is_free(
+            'host-1', _date(1), _date(7), ignored_reservation='reservation-1'))
+
+    def test_remove(self):
+        self.index.remove('reservation-1', ['host-2'])
+
+        self.assertFalse(self.index.is_allocated('host-2'))
+        self.assertFalse(self.index.is_free('host-1', _date(2), _date(3)))
+
+        self.index.remove('reservation-1')
+
+        self.assertTrue(self.index.is_free('host-1', _date(2), _date(3)))
+        self.assertTrue(self.index.is_allocated('host-1'))
+        self.index.remove('unknown')
+
+    def test_move(self):
+        self.index.move('reservation-1', _date(4), _date(5))
+
+        self.assertTrue(self.index.is_free('host-2', _date(2), _date(4)))
+        self.assertFalse(self.index.is_free('host-2', _date(4), _date(5)))
+        self.assertFalse(self.index.is_free('host-1', _date(4), _date(5)))
+
+    def test_add_to_reservation(self):
+        self.index.add('reservation-2', ['host-2'], _date(0), _date(1))
+
+        self.assertFalse(self.index.is_free('host-2', _date(6), _date(7)))
+        self.assertTrue(self.index.is_free('host-2', _date(0), _date(1)))
+
+    def test_load(self):
+        get_all = self.patch(db_api, 'host_allocation_get_all_with_dates')
+        get_all.return_value = [
+            {'compute_host_id': 'host-3', 'reservation_id': 'reservation-3',
+             'start_date': _date(0), 'end_date': _date(1)}]
+
+        self.index.load()
+
+        self.assertTrue(self.index.loaded)
+        self.assertFalse(self.index.is_allocated('host-1'))
+        self.assertFalse(self.index.is_free('host-3', _date(0), _date(1)))
+        self.index.move('reservation-3', _date(2), _date(3))
+        self.assertTrue(self.index.is_free('host-3', _date(0), _date(1)))
+
+    def test_refresh(self):
+        get_all = self.patch(db_api, 'host_allocation_get_all_with_dates')
+        get_all.return_value = [
+            {'compute_host_id': 'host-1', 'reservation_id': 'reservation-3',
+             'start_date': _date(0), 'end_date': _date(1)}]
+
+        self.index.refresh(['host-1', 'host-3'])
+
+        get_all.assert_called_once_with(host_ids=set(['host-1', 'host-3']))
+        self.assertTrue(self.index.is_free('host-1', _date(2), _date(9)))
+        self.assertFalse(self.index.is_free('host-1', _date(0), _date(1)))
+        self.assertFalse(self.index.is_free('host-2', _date(2), _date(4)))
+        self.assertFalse(self.index.is_allocated('host-3'))
+        self.index.move('reservation-1', _date(5), _date(6))
+        self.assertTrue(self.index.is_free('host-1', _date(5), _date(6)))
+
+    def test_rollback_add(self):
+        self.index.add('reservation-1', ['host-2', 'host-3'], _date(0),
+                       _date(1))
+        self.index.add('reservation-3', ['host-3'], _date(0), _date(1))
+
+        self._rollback()
+
+        self.assertFalse(self.index.is_allocated('host-3'))
+        self.assertFalse(self.index.is_free('host-2', _date(2), _date(3)))
+        self.index.add('reservation-3', ['host-3'], _date(0), _date(1))
+        self.assertFalse(self.index.is_free('host-3', _date(0), _date(1)))
+
+    def test_rollback_remove(self):
+        self.index.remove('reservation-1', ['host-2'])
+        self.index.remove('reservation-1')
+
+        self._rollback()
+
+        self.assertFalse(self.index.is_free('host-1', _date(2), _date(3)))
+        self.assertFalse(self.index.is_free('host-2', _date(2), _date(3)))
+        self.assertTrue(self.index.is_free('host-2', _date(4), _date(5)))
+
+    def test_rollback_move(self):
+        self.index.move('reservation-1', _date(4), _date(5))
+
+        self._rollback()
+
+        self.assertFalse(self.index.is_free('host-2', _date(2), _date(4)))
+        self.assertTrue(self.index.is_free('host-2', _date(4), _date(5)))
+
+    def test_rollback_load(self):
+        self.patch(db_api, 'host_allocation_get_all_with_dates')
+        self.index.load()
+
+        self._rollback()
+
+        self.assertFalse(self.index.loaded)
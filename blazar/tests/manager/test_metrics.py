@@ -0,0 +1,79 @@
+# Copyright (c) 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from blazar.manager import metrics
+from blazar import tests
+
+
+class HistogramTestCase(tests.TestCase):
+    def setUp(self):
+        super(HistogramTestCase, self).setUp()
+        self.histogram = metrics.Histogram(buckets=(1, 10))
+
+    def test_observe(self):
+        for value in (0.5, 1, 2, 20):
+            self.histogram.observe(value)
+
+        self.assertEqual({'count': 4,
+                          'sum': 23.5,
+                          'max': 20,
+                          'buckets': [[1, 2], [10, 1], ['+Inf', 1]]},
+                         self.histogram.to_dict())
+
+    def test_percentile(self):
+        self.assertIsNone(self.histogram.percentile(50))
+
+        for value in (0.5, 0.5, 2, 20):
+            self.histogram.observe(value)
+
+        self.assertEqual(1, self.histogram.percentile(50))
+        self.assertEqual(10, self.histogram.percentile(75))
+        self.assertEqual(20, self.histogram.percentile(95))
+
+
+class EventMetricsTestCase(tests.TestCase):
+    def setUp(self):
+        super(EventMetricsTestCase, self).setUp()
+        self.metrics = metrics.EventMetrics()
+
+    def test_to_dict(self):
+        self.metrics.record_lag('start_lease', 0.2)
+        self.metrics.record_event('start_lease', 2, 'DONE')
+        self.metrics.record_event('start_lease', 3, 'ERROR')
+        self.metrics.record_action('physical:host', 'on_start', 1, True)
+        self.metrics.record_action('physical:host', 'on_start', 2, False)
+
+        result = self.metrics.to_dict()
+
+        self.assertEqual(1, result['events']['lag']['start_lease']['count'])
+        self.assertEqual(
+            2, result['events']['duration']['start_lease']['count'])
+        self.assertEqual({'DONE': 1, 'ERROR': 1},
+                         result['events']['outcomes']['start_lease'])
+        self.assertEqual(
+            3, result['actions']['duration']['physical:host:on_start']['sum'])
+        self.assertEqual({'success': 1, 'failure': 1},
+                         result['actions']['outcomes']
+                         ['physical:host:on_start'])
+
+    def test_summary(self):
+        self.assertEqual('no events', self.metrics.summary())
+
+        self.metrics.record_lag('end_lease', 0.2)
+        self.metrics.record_event('end_lease', 2, 'DONE')
+
+        self.assertEqual('end_lease: 1 claimed, lag p95 <=0.5s max 0.2s, '
+                         '1 run (DONE 1), duration p95 <=5s max 2.0s',
+                         self.metrics.summary())
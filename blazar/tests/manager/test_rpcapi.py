@@ -32,16 +32,37 @@ class RPCAPITestCase(tests.TestCase):
 
     def test_get_lease(self):
         self.manager.get_lease(self.fake_id)
-        self.call.assert_called_once_with('get_lease', lease_id=1)
+        self.call.assert_called_once_with('get_lease', lease_id=1,
+                                          fields=None)
 
     def test_list_leases(self):
         self.manager.list_leases('fake')
-        self.call.assert_called_once_with('list_leases', project_id='fake')
+        self.call.assert_called_once_with('list_leases', project_id='fake',
+                                          limit=None, marker=None,
+                                          sort_key=None, sort_dir=None,
+                                          filters=None, fields=None)
+
+    def test_list_leases_paginated(self):
+        self.manager.list_leases('fake', limit=10, marker='1',
+                                 sort_key='name', sort_dir='desc',
+                                 filters={'status': 'ACTIVE'},
+                                 fields=['name'])
+        self.call.assert_called_once_with('list_leases', project_id='fake',
+                                          limit=10, marker='1',
+                                          sort_key='name', sort_dir='desc',
+                                          filters={'status': 'ACTIVE'},
+                                          fields=['name'])
 
     def test_create_lease(self):
         self.manager.create_lease(self.fake_values)
         self.call.assert_called_once_with('create_lease', lease_values={})
 
+    def test_create_leases(self):
+        self.manager.create_leases([self.fake_values], all_or_nothing=True)
+        self.call.assert_called_once_with('create_leases',
+                                          leases_values=[{}],
+                                          all_or_nothing=True)
+
     def test_update_lease(self):
         self.manager.update_lease(self.fake_id,
                                   self.fake_values)
@@ -52,3 +73,7 @@ class RPCAPITestCase(tests.TestCase):
     def test_delete_lease(self):
         self.manager.delete_lease(self.fake_id)
         self.call.assert_called_once_with('delete_lease', lease_id=1)
+
+    def test_get_event_metrics(self):
+        self.manager.get_event_metrics()
+        self.call.assert_called_once_with('get_event_metrics')
@@ -19,7 +19,6 @@ import eventlet
 import mock
 from oslo_config import cfg
 from stevedore import enabled
-import testtools
 
 from blazar import context
 from blazar.db import api as db_api
@@ -112,13 +111,16 @@ class ServiceTestCase(tests.TestCase):
                       'user_id': self.user_id,
                       'project_id': self.project_id,
                       'events': [
-                          {'event_type': 'start_lease',
+                          {'id': '1',
+                           'event_type': 'start_lease',
                            'time': datetime.datetime(2013, 12, 20, 13, 00),
                            'status': 'UNDONE'},
-                          {'event_type': 'end_lease',
+                          {'id': '2',
+                           'event_type': 'end_lease',
                            'time': datetime.datetime(2013, 12, 20, 15, 00),
                            'status': 'UNDONE'},
-                          {'event_type': 'before_end_lease',
+                          {'id': '3',
+                           'event_type': 'before_end_lease',
                            'time': datetime.datetime(2013, 12, 20, 13, 00),
                            'status': 'UNDONE'}
                       ],
@@ -144,7 +146,13 @@ class ServiceTestCase(tests.TestCase):
         self.reservation_create = self.patch(self.db_api, 'reservation_create')
         self.reservation_update = self.patch(self.db_api, 'reservation_update')
         self.event_create = self.patch(self.db_api, 'event_create')
+        self.transaction = self.patch(self.db_api, 'transaction')
         self.event_update = self.patch(self.db_api, 'event_update')
+        self.event_update_all = self.patch(self.db_api,
+                                           'event_update_all_by_lease_id')
+        self.event_update_all.return_value = []
+        self.event_claim = self.patch(self.db_api, 'event_claim')
+        self.event_claim.return_value = True
         self.manager.plugins = {'virtual:instance': self.fake_plugin}
         self.manager.resource_actions = (
             {'virtual:instance':
@@ -201,68 +209,407 @@ class ServiceTestCase(tests.TestCase):
         self.assertEqual(actions, self.manager._setup_actions())
 
     def test_no_events(self):
-        events = self.patch(self.db_api, 'event_get_first_sorted_by_filters')
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
         event_update = self.patch(self.db_api, 'event_update')
-        events.return_value = None
+        events.return_value = []
 
-        self.manager._event()
+        self.assertEqual(0, self.manager._event())
 
         self.assertFalse(event_update.called)
 
     def test_event_all_okay(self):
-        events = self.patch(self.db_api, 'event_get_first_sorted_by_filters')
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
         event_update = self.patch(self.db_api, 'event_update')
-        events.return_value = {'id': '111-222-333', 'time': self.good_date,
-                               'event_type': 'end_lease',
-                               'lease_id': self.lease_id}
+        events.return_value = [{'id': '111-222-333', 'time': self.good_date,
+                                'event_type': 'end_lease',
+                                'lease_id': self.lease_id}]
 
         self.manager._event()
 
-        event_update.assert_called_once_with('111-222-333',
-                                             {'status': 'IN_PROGRESS'})
-        expected_context = self.trust_ctx.return_value
+        self.event_claim.assert_called_once_with('111-222-333',
+                                                 self.manager.worker_id)
+        event_update.assert_not_called()
+        self.manager._notifications.flush()
+        expected_context = self.ctx.return_value
         self.fake_notifier.assert_called_once_with(
-            expected_context.__enter__.return_value,
+            expected_context,
             notifier_api.format_lease_payload(self.lease),
             'lease.event.end_lease')
 
+    def test_event_filters_on_due_time(self):
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        events.return_value = []
+        target = datetime.datetime(2013, 12, 20, 13, 00)
+
+        with mock.patch.object(datetime,
+                               'datetime',
+                               mock.Mock(wraps=datetime.datetime)) as patched:
+            patched.utcnow.return_value = target
+            self.manager._event()
+
+        events.assert_called_once_with(
+            sort_key='time', sort_dir='asc',
+            filters={'status': 'UNDONE',
+                     'time': {'op': 'lt', 'border': target}},
+            limit=100)
+
+    def test_event_batch(self):
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        event_count = self.patch(self.db_api, 'event_count_by_filters')
+        event_update = self.patch(self.db_api, 'event_update')
+        spawn_n = self.patch(eventlet, 'spawn_n')
+        events.return_value = [{'id': str(i), 'time': self.good_date,
+                                'event_type': 'start_lease',
+                                'lease_id': self.lease_id}
+                               for i in range(3)]
+        event_count.return_value = 5
+        self.cfg.CONF.set_override('event_batch_size', 3, group='manager')
+        self.addCleanup(self.cfg.CONF.clear_override, 'event_batch_size',
+                        group='manager')
+
+        queued = self.manager._event()
+
+        self.assertEqual(3, events.call_args[1]['limit'])
+        event_count.assert_called_once_with(events.call_args[1]['filters'])
+        self.assertEqual(2, queued)
+        self.assertEqual(3, spawn_n.call_count)
+        self.event_claim.assert_has_calls(
+            [mock.call(str(i), self.manager.worker_id) for i in range(3)])
+        self.assertEqual(3, self.event_claim.call_count)
+        event_update.assert_not_called()
+
+    def test_event_executor_limits(self):
+        self.cfg.CONF.set_override('max_concurrent_events', 5,
+                                   group='manager')
+        self.addCleanup(self.cfg.CONF.clear_override, 'max_concurrent_events',
+                        group='manager')
+        self.cfg.CONF.set_override('max_concurrent_events', 2,
+                                   group='fake:plugin')
+        self.addCleanup(self.cfg.CONF.clear_override, 'max_concurrent_events',
+                        group='fake:plugin')
+        executor = self.patch(self.service, 'EventExecutor')
+
+        self.service.ManagerService()
+
+        executor.assert_called_once_with(5, {'fake:plugin': 2})
+
     def test_event_wrong_event_status(self):
-        events = self.patch(self.db_api, 'event_get_first_sorted_by_filters')
-        self.patch(self.db_api, 'event_update')
-        events.return_value = {'id': '111-222-333', 'time': self.good_date,
-                               'event_type': 'wrong_type',
-                               'lease_id': self.lease_id}
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        event_update = self.patch(self.db_api, 'event_update')
+        spawn_n = self.patch(eventlet, 'spawn_n')
+        events.return_value = [{'id': '111-222-333', 'time': self.good_date,
+                                'event_type': 'wrong_type',
+                                'lease_id': self.lease_id},
+                               {'id': '444-555-666', 'time': self.good_date,
+                                'event_type': 'end_lease',
+                                'lease_id': self.lease_id}]
+
+        self.manager._event()
 
-        self.assertRaises(manager_ex.EventError,
-                          self.manager._event)
+        event_update.assert_called_once_with('111-222-333',
+                                             {'status': 'ERROR'})
+        self.event_claim.assert_called_once_with('444-555-666',
+                                                 self.manager.worker_id)
+        self.assertEqual(1, spawn_n.call_count)
 
     def test_event_wrong_eventlet_fail(self):
-        events = self.patch(self.db_api, 'event_get_first_sorted_by_filters')
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
         event_update = self.patch(self.db_api, 'event_update')
-        calls = [mock.call('111-222-333', {'status': 'IN_PROGRESS'}),
-                 mock.call('111-222-333', {'status': 'ERROR'})]
         self.patch(eventlet, 'spawn_n').side_effect = Exception
-        events.return_value = {'id': '111-222-333', 'time': self.good_date,
-                               'event_type': 'end_lease',
-                               'lease_id': self.lease_id}
+        events.return_value = [{'id': '111-222-333', 'time': self.good_date,
+                                'event_type': 'end_lease',
+                                'lease_id': self.lease_id}]
 
         self.manager._event()
 
-        event_update.assert_has_calls(calls)
+        self.event_claim.assert_called_once_with('111-222-333',
+                                                 self.manager.worker_id)
+        event_update.assert_called_once_with('111-222-333',
+                                             {'status': 'ERROR'})
+
+    def test_event_metrics(self):
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        submit = self.patch(self.manager._executor, 'submit')
+        basic_action = self.patch(self.manager, '_basic_action')
+        basic_action.return_value = 'DONE'
+        events.return_value = [{'id': '111-222-333',
+                                'time': datetime.datetime(2013, 12, 20,
+                                                          13, 00),
+                                'event_type': 'start_lease',
+                                'lease_id': self.lease_id}]
+
+        with mock.patch.object(datetime,
+                               'datetime',
+                               mock.Mock(wraps=datetime.datetime)) as patched:
+            patched.utcnow.return_value = datetime.datetime(2013, 12, 20,
+                                                            13, 00, 3)
+            self.manager._event()
+
+        handler = submit.call_args[0][0]
+        self.assertEqual('DONE', handler(self.lease_id, '111-222-333'))
+
+        result = self.manager.get_event_metrics()
+        self.assertEqual(3, result['events']['lag']['start_lease']['sum'])
+        self.assertEqual(
+            1, result['events']['duration']['start_lease']['count'])
+        self.assertEqual({'DONE': 1},
+                         result['events']['outcomes']['start_lease'])
+        self.assertEqual(self.manager._executor.stats(), result['executor'])
+
+    def test_event_handler_error(self):
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        event_update = self.patch(self.db_api, 'event_update')
+        self.patch(self.manager, '_basic_action').side_effect = (
+            Exception('Nova is unavailable'))
+        events.return_value = [{'id': '111-222-333', 'time': self.good_date,
+                                'event_type': 'start_lease',
+                                'lease_id': self.lease_id}]
+
+        self.manager._event()
+        eventlet.sleep(0)
+
+        event_update.assert_called_once_with('111-222-333',
+                                             {'status': 'ERROR'})
+        self.assertEqual(0, self.manager._executor.stats()['in_flight'])
+
+    def test_event_metrics_handler_error(self):
+        self.patch(self.db_api, 'event_update')
+        handler = mock.Mock(side_effect=exceptions.BlazarException)
+
+        run = self.manager._measure_event('end_lease', handler)
+
+        self.assertRaises(exceptions.BlazarException, run, self.lease_id, '1')
+        self.assertEqual({'ERROR': 1},
+                         self.manager.metrics.outcomes['end_lease'])
+
+    def test_event_already_claimed(self):
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        submit = self.patch(self.manager._executor, 'submit')
+        self.event_claim.side_effect = [False, True]
+        events.return_value = [{'id': '111-222-333', 'time': self.good_date,
+                                'event_type': 'start_lease',
+                                'lease_id': self.lease_id},
+                               {'id': '444-555-666', 'time': self.good_date,
+                                'event_type': 'end_lease',
+                                'lease_id': self.lease_id}]
+
+        self.manager._event()
+
+        self.assertEqual(2, self.event_claim.call_count)
+        submit.assert_called_once_with(mock.ANY, ['virtual:instance'],
+                                       self.lease_id, '444-555-666')
+        self.manager._notifications.flush()
+        self.fake_notifier.assert_called_once_with(
+            mock.ANY, mock.ANY, 'lease.event.end_lease')
+
+    def _patch_event_handlers(self):
+        calls = []
+        for event_type in ('start_lease', 'end_lease', 'before_end_lease'):
+            handler = self.patch(self.manager, event_type)
+            handler.side_effect = (
+                lambda lease_id, event_id: calls.append(event_id))
+        return calls
+
+    def test_catch_up(self):
+        def event(event_id, lease_id, event_type, hour):
+            return {'id': event_id, 'lease_id': lease_id,
+                    'event_type': event_type,
+                    'time': datetime.datetime(2013, 12, 20, hour, 00)}
+
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        events.side_effect = [[event('b-start', 'b', 'start_lease', 10),
+                               event('a-end', 'a', 'end_lease', 11),
+                               event('c-before', 'c', 'before_end_lease', 11),
+                               event('b-end', 'b', 'end_lease', 12),
+                               event('c-end', 'c', 'end_lease', 13)],
+                              []]
+        calls = self._patch_event_handlers()
+        self.cfg.CONF.set_override('catch_up_batch_size', 1, group='manager')
+        self.addCleanup(self.cfg.CONF.clear_override, 'catch_up_batch_size',
+                        group='manager')
+
+        self.manager._catch_up()
+
+        self.assertEqual(['a-end', 'c-before', 'c-end', 'b-start', 'b-end'],
+                         calls)
+        self.assertEqual(5, self.event_claim.call_count)
+        self.manager._notifications.flush()
+        self.assertEqual(5, self.fake_notifier.call_count)
+        self.assertEqual(2, events.call_count)
+
+    def test_catch_up_executor_limits(self):
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        events.side_effect = [[{'id': str(i), 'lease_id': str(i),
+                                'event_type': 'end_lease',
+                                'time': self.good_date} for i in range(3)],
+                              []]
+        self.manager._executor = self.service.EventExecutor(
+            10, {'virtual:instance': 1})
+        running = []
+        concurrency = []
+
+        def end_lease(lease_id, event_id):
+            running.append(event_id)
+            concurrency.append(len(running))
+            eventlet.sleep(0)
+            running.remove(event_id)
+        self.patch(self.manager, 'end_lease').side_effect = end_lease
+
+        self.manager._catch_up()
+
+        self.assertEqual([1, 1, 1], concurrency)
+        self.lease_get.assert_has_calls([mock.call(str(i))
+                                         for i in range(3)], any_order=True)
+
+    def test_catch_up_no_events(self):
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        events.return_value = []
+        calls = self._patch_event_handlers()
+
+        self.manager._catch_up()
+
+        self.assertEqual([], calls)
+        self.event_claim.assert_not_called()
+
+    def test_catch_up_event_error(self):
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        events.side_effect = [[{'id': '1', 'lease_id': self.lease_id,
+                                'event_type': 'start_lease',
+                                'time': self.good_date},
+                               {'id': '2', 'lease_id': self.lease_id,
+                                'event_type': 'end_lease',
+                                'time': self.good_date}],
+                              []]
+        calls = self._patch_event_handlers()
+        self.manager.start_lease.side_effect = Exception
+
+        self.manager._catch_up()
+
+        self.event_update.assert_called_once_with('1', {'status': 'ERROR'})
+        self.assertEqual(['2'], calls)
+
+    def test_resync_timeline(self):
+        self.patch(self.db_api, 'event_requeue_stale_claims').return_value = 0
+        events = self.patch(self.db_api, 'event_get_all_sorted_by_filters')
+        events.return_value = [{'id': '111-222-333', 'time': self.good_date,
+                                'lease_id': self.lease_id}]
+
+        self.manager._resync_timeline()
+
+        events.assert_called_once_with(sort_key='time', sort_dir='asc',
+                                       filters={'status': 'UNDONE'})
+        self.assertEqual(self.good_date,
+                         self.manager._timeline.next_deadline())
+
+    def test_requeue_stale_claims(self):
+        requeue = self.patch(self.db_api, 'event_requeue_stale_claims')
+        requeue.return_value = 2
+        self.cfg.CONF.set_override('event_claim_timeout', 600,
+                                   group='manager')
+        self.addCleanup(self.cfg.CONF.clear_override, 'event_claim_timeout',
+                        group='manager')
+        now = datetime.datetime(2013, 12, 20, 13, 00)
+
+        with mock.patch.object(datetime,
+                               'datetime',
+                               mock.Mock(wraps=datetime.datetime)) as patched:
+            patched.utcnow.return_value = now
+            self.manager._requeue_stale_claims()
+
+        requeue.assert_called_once_with(datetime.datetime(2013, 12, 20,
+                                                          12, 50))
+
+    def test_requeue_stale_claims_disabled(self):
+        requeue = self.patch(self.db_api, 'event_requeue_stale_claims')
+        self.cfg.CONF.set_override('event_claim_timeout', 0, group='manager')
+        self.addCleanup(self.cfg.CONF.clear_override, 'event_claim_timeout',
+                        group='manager')
+
+        self.manager._requeue_stale_claims()
+
+        requeue.assert_not_called()
+
+    def test_seconds_until_next_event(self):
+        self.cfg.CONF.set_override('event_resync_interval', 300,
+                                   group='manager')
+        self.addCleanup(self.cfg.CONF.clear_override, 'event_resync_interval',
+                        group='manager')
+        now = datetime.datetime(2013, 12, 20, 13, 00)
+
+        with mock.patch.object(datetime,
+                               'datetime',
+                               mock.Mock(wraps=datetime.datetime)) as patched:
+            patched.utcnow.return_value = now
+            self.assertEqual(300, self.manager._seconds_until_next_event())
+            self.manager._timeline.push(
+                '1', self.lease_id, now + datetime.timedelta(seconds=42))
+            self.assertEqual(42, self.manager._seconds_until_next_event())
+            self.manager._timeline.push(
+                '1', self.lease_id, now - datetime.timedelta(seconds=42))
+            self.assertEqual(0, self.manager._seconds_until_next_event())
+            self.manager._timeline.push(
+                '1', self.lease_id, now + datetime.timedelta(hours=1))
+            self.assertEqual(300, self.manager._seconds_until_next_event())
 
     def test_get_lease(self):
         lease = self.manager.get_lease(self.lease_id)
 
-        self.lease_get.assert_called_once_with('11-22-33')
+        self.lease_get.assert_called_once_with('11-22-33', fields=None)
         self.assertEqual(lease, self.lease)
 
-    @testtools.skip('incorrect decorator')
-    def test_list_leases(self):
-        # NOTE(starodubcevna): This func works incorrect, and we need to skip
-        # it. It'll be fix in coming soon patches
-        self.manager.list_leases()
+    def test_get_lease_fields(self):
+        self.manager.get_lease(self.lease_id, fields=['name', 'id'])
+
+        self.lease_get.assert_called_once_with('11-22-33',
+                                               fields=['id', 'name'])
 
-        self.lease_list.assert_called_once_with()
+    def test_get_lease_invalid_field(self):
+        self.assertRaises(manager_ex.InvalidLeaseField,
+                          self.manager.get_lease, self.lease_id,
+                          fields=['events'])
+
+    def test_list_leases(self):
+        leases = self.manager.list_leases()
+
+        self.lease_list.assert_called_once_with(
+            None, limit=None, marker=None, sort_key=None, sort_dir=None,
+            filters={}, fields=None)
+        self.assertEqual(self.lease_list.return_value, leases)
+
+    def test_list_leases_paginated_and_filtered(self):
+        self.manager.list_leases(
+            project_id='555', limit=10, marker='11-22-33',
+            sort_key='start_date', sort_dir='desc',
+            filters={'status': 'ACTIVE',
+                     'start_before': '2013-12-21 00:00',
+                     'end_after': '2013-12-20 00:00'})
+
+        self.lease_list.assert_called_once_with(
+            '555', limit=10, marker='11-22-33', sort_key='start_date',
+            sort_dir='desc',
+            filters={'status': 'ACTIVE',
+                     'start_before': datetime.datetime(2013, 12, 21),
+                     'end_after': datetime.datetime(2013, 12, 20)},
+            fields=None)
+
+    def test_list_leases_invalid_parameters(self):
+        self.assertRaises(exceptions.InvalidInput,
+                          self.manager.list_leases, limit=0)
+        self.assertRaises(manager_ex.InvalidSortKey,
+                          self.manager.list_leases, sort_key='trust_id')
+        self.assertRaises(manager_ex.InvalidSortDir,
+                          self.manager.list_leases, sort_dir='up')
+        self.assertRaises(manager_ex.InvalidLeaseFilter,
+                          self.manager.list_leases,
+                          filters={'trust_id': 'fake'})
+        self.lease_list.assert_not_called()
+
+    def test_list_leases_marker_not_found(self):
+        self.lease_list.side_effect = db_ex.BlazarDBNotFound(id='fake',
+                                                             model='Lease')
+
+        self.assertRaises(manager_ex.MarkerNotFound,
+                          self.manager.list_leases, marker='fake')
 
     def test_create_lease_now(self):
         trust_id = 'exxee111qwwwwe'
@@ -281,9 +628,10 @@ class ServiceTestCase(tests.TestCase):
         self.trust_ctx.assert_called_once_with(trust_id)
         self.lease_create.assert_called_once_with(lease_values)
         self.assertEqual(lease, self.lease)
-        expected_context = self.trust_ctx.return_value
+        self.manager._notifications.flush()
+        expected_context = self.ctx.return_value
         self.fake_notifier.assert_called_once_with(
-            expected_context.__enter__.return_value,
+            expected_context,
             notifier_api.format_lease_payload(lease),
             'lease.create')
 
@@ -350,6 +698,66 @@ class ServiceTestCase(tests.TestCase):
                          event['time'])
         self.assertEqual('UNDONE', event['status'])
 
+    def test_create_lease_pushes_events_to_timeline(self):
+        lease_values = {
+            'id': self.lease_id,
+            'reservations': [],
+            'start_date': '2026-11-13 13:13',
+            'end_date': '2026-12-13 13:13',
+            'trust_id': 'exxee111qwwwwe'}
+        self.lease_create.return_value = self.lease
+
+        self.manager.create_lease(lease_values)
+
+        timeline = self.manager._timeline
+        self.assertEqual(3, len(timeline))
+        self.assertEqual(datetime.datetime(2013, 12, 20, 13, 00),
+                         timeline.next_deadline())
+        self.assertEqual(['1', '3', '2'],
+                         timeline.pop_due(datetime.datetime(2013, 12, 21)))
+
+    def test_create_lease_single_transaction(self):
+        lease_values = {
+            'id': self.lease_id,
+            'reservations': [{'resource_type': 'virtual:instance'}],
+            'start_date': '2026-11-13 13:13',
+            'end_date': '2026-12-13 13:13',
+            'trust_id': 'exxee111qwwwwe'}
+        transaction = self.transaction.return_value
+        self.lease_create.side_effect = (
+            lambda values: self.assertTrue(transaction.__enter__.called) or
+            self.lease)
+        self.reservation_create.side_effect = (
+            lambda values: self.assertFalse(transaction.__exit__.called) or
+            {'id': '111'})
+
+        self.manager.create_lease(lease_values)
+
+        self.assertEqual(3, len(lease_values['events']))
+        self.event_create.assert_not_called()
+        transaction.__exit__.assert_called_once_with(None, None, None)
+
+    def test_create_lease_reservation_failure_rolls_back(self):
+        lease_values = {
+            'id': self.lease_id,
+            'reservations': [{'resource_type': 'virtual:instance'}],
+            'start_date': '2026-11-13 13:13',
+            'end_date': '2026-12-13 13:13',
+            'trust_id': 'exxee111qwwwwe'}
+        self.lease_create.return_value = self.lease
+        self.fake_plugin.reserve_resource.side_effect = (
+            manager_ex.NotEnoughHostsAvailable)
+
+        self.assertRaises(manager_ex.NotEnoughHostsAvailable,
+                          self.manager.create_lease, lease_values)
+
+        exit = self.transaction.return_value.__exit__
+        self.assertEqual(manager_ex.NotEnoughHostsAvailable,
+                         exit.call_args[0][0])
+        self.lease_destroy.assert_not_called()
+        self.assertEqual(0, len(self.manager._timeline))
+        self.fake_notifier.assert_not_called()
+
     def test_create_lease_before_end_event_is_before_lease_start(self):
         lease_values = {
             'id': self.lease_id,
@@ -594,6 +1002,145 @@ class ServiceTestCase(tests.TestCase):
         self.assertRaises(manager_ex.MissingTrustId,
                           self.manager.create_lease, lease_values)
 
+    def _bulk_leases_values(self, count):
+        return [{'name': 'lease%d' % i,
+                 'reservations': [{'resource_type': 'virtual:instance'}],
+                 'start_date': '2026-11-13 13:13',
+                 'end_date': '2026-12-13 13:13',
+                 'trust_id': 'exxee111qwwwwe'} for i in range(count)]
+
+    def test_create_leases(self):
+        leases_values = self._bulk_leases_values(3)
+        self.lease_create.return_value = self.lease
+
+        results = self.manager.create_leases(leases_values)
+
+        self.assertEqual([{'lease': self.lease}] * 3, results)
+        self.trust_ctx.assert_called_once_with('exxee111qwwwwe')
+        self.assertEqual(3, self.lease_create.call_count)
+        self.assertEqual(3, self.transaction.call_count)
+        self.manager._notifications.flush()
+        self.assertEqual(3, self.fake_notifier.call_count)
+
+    def test_create_leases_reports_failures(self):
+        leases_values = self._bulk_leases_values(3)
+        self.lease_create.side_effect = [self.lease,
+                                         db_ex.BlazarDBDuplicateEntry,
+                                         db_ex.BlazarDBException]
+
+        results = self.manager.create_leases(leases_values)
+
+        self.assertEqual({'lease': self.lease}, results[0])
+        self.assertEqual(
+            {'error': {'code': 409,
+                       'message': 'The lease with name: lease1 already '
+                                  'exists'}},
+            results[1])
+        self.assertEqual(
+            {'error': {'code': 500, 'message': 'Internal Server Error'}},
+            results[2])
+        self.manager._notifications.flush()
+        self.assertEqual(1, self.fake_notifier.call_count)
+
+    def test_create_leases_reports_failures_after_commit(self):
+        leases_values = self._bulk_leases_values(2)
+        self.lease_create.return_value = self.lease
+        self.lease_get.side_effect = [self.lease, db_ex.BlazarDBException]
+
+        results = self.manager.create_leases(leases_values)
+
+        self.assertEqual(
+            [{'lease': self.lease},
+             {'lease': {'id': self.lease_id},
+              'error': {'code': 500, 'message': 'Internal Server Error'}}],
+            results)
+        self.assertEqual(2, self.lease_create.call_count)
+
+    def test_create_leases_all_or_nothing(self):
+        leases_values = self._bulk_leases_values(2)
+        self.lease_create.return_value = self.lease
+
+        results = self.manager.create_leases(leases_values,
+                                             all_or_nothing=True)
+
+        self.assertEqual([{'lease': self.lease}] * 2, results)
+        self.transaction.assert_called_once_with()
+
+    def test_create_leases_all_or_nothing_rolls_back(self):
+        leases_values = self._bulk_leases_values(2)
+        self.lease_create.side_effect = [self.lease,
+                                         db_ex.BlazarDBDuplicateEntry]
+
+        self.assertRaises(manager_ex.BulkLeaseCreationFailed,
+                          self.manager.create_leases, leases_values,
+                          all_or_nothing=True)
+
+        exit = self.transaction.return_value.__exit__
+        self.assertEqual(manager_ex.BulkLeaseCreationFailed,
+                         exit.call_args[0][0])
+        self.assertEqual(0, len(self.manager._timeline))
+        self.manager._notifications.flush()
+        self.fake_notifier.assert_not_called()
+
+    def test_create_leases_all_or_nothing_releases_resources(self):
+        leases_values = self._bulk_leases_values(2)
+        self.lease_create.side_effect = [self.lease,
+                                         db_ex.BlazarDBDuplicateEntry]
+        self.reservation_create.return_value = {'id': 'reservation-1'}
+        rollback_callbacks = []
+        self.patch(self.db_api, 'after_rollback').side_effect = (
+            rollback_callbacks.append)
+
+        def rollback(exc_type, exc_value, traceback):
+            if exc_type is not None:
+                for callback in reversed(rollback_callbacks):
+                    callback()
+            return False
+
+        self.transaction.return_value.__exit__.side_effect = rollback
+        delete_aggregate = mock.Mock()
+
+        def reserve_resource(reservation_id, values):
+            # Like the host plugin, delete the aggregate of the reservation
+            # if the transaction is rolled back.
+            self.db_api.after_rollback(
+                lambda: delete_aggregate(reservation_id))
+            return 'aggregate-1'
+
+        self.fake_plugin.reserve_resource.side_effect = reserve_resource
+
+        self.assertRaises(manager_ex.BulkLeaseCreationFailed,
+                          self.manager.create_leases, leases_values,
+                          all_or_nothing=True)
+
+        self.fake_plugin.reserve_resource.assert_called_once_with(
+            'reservation-1', mock.ANY)
+        delete_aggregate.assert_called_once_with('reservation-1')
+
+    def test_create_leases_too_many(self):
+        self.cfg.CONF.set_override('max_leases_per_bulk_request', 1,
+                                   group='manager')
+        self.addCleanup(self.cfg.CONF.clear_override,
+                        'max_leases_per_bulk_request', group='manager')
+
+        self.assertRaises(manager_ex.TooManyLeases,
+                          self.manager.create_leases,
+                          self._bulk_leases_values(2))
+        self.lease_create.assert_not_called()
+
+    def _set_lease_events(self, before_end_time=None,
+                          before_end_status='UNDONE'):
+        events = [{'id': u'2eeb784a-2d84-4a89-a201-9d42d61eecb1',
+                   'event_type': 'start_lease'},
+                  {'id': u'7085381b-45e0-4e5d-b24a-f965f5e6e5d7',
+                   'event_type': 'end_lease'}]
+        if before_end_time:
+            events.append({'id': u'452bf850-e223-4035-9d13-eb0b0197228f',
+                           'event_type': 'before_end_lease',
+                           'time': before_end_time,
+                           'status': before_end_status})
+        self.lease['events'] = events
+
     def test_update_lease_completed_lease_rename(self):
         lease_values = {'name': 'renamed'}
         target = datetime.datetime(2015, 1, 1)
@@ -606,16 +1153,9 @@ class ServiceTestCase(tests.TestCase):
         self.assertEqual(lease, self.lease)
 
     def test_update_lease_not_started_modify_dates(self):
-        def fake_event_get(sort_key, sort_dir, filters):
-            if filters['event_type'] == 'start_lease':
-                return {'id': u'2eeb784a-2d84-4a89-a201-9d42d61eecb1'}
-            elif filters['event_type'] == 'end_lease':
-                return {'id': u'7085381b-45e0-4e5d-b24a-f965f5e6e5d7'}
-            elif filters['event_type'] == 'before_end_lease':
-                delta = datetime.timedelta(hours=1)
-                return {'id': u'452bf850-e223-4035-9d13-eb0b0197228f',
-                        'time': self.lease['end_date'] - delta,
-                        'status': 'UNDONE'}
+        self._set_lease_events(
+            before_end_time=(self.lease['end_date'] -
+                             datetime.timedelta(hours=1)))
 
         lease_values = {
             'name': 'renamed',
@@ -630,8 +1170,6 @@ class ServiceTestCase(tests.TestCase):
                 'resource_type': 'virtual:instance',
             }
         ]
-        event_get = self.patch(db_api, 'event_get_first_sorted_by_filters')
-        event_get.side_effect = fake_event_get
         target = datetime.datetime(2013, 12, 15)
         with mock.patch.object(datetime,
                                'datetime',
@@ -645,27 +1183,18 @@ class ServiceTestCase(tests.TestCase):
                 'end_date': datetime.datetime(2015, 12, 1, 22, 00)
             }
         )
-        calls = [mock.call('2eeb784a-2d84-4a89-a201-9d42d61eecb1',
-                           {'time': datetime.datetime(2015, 12, 1, 20, 00)}),
-                 mock.call('7085381b-45e0-4e5d-b24a-f965f5e6e5d7',
-                           {'time': datetime.datetime(2015, 12, 1, 22, 00)}),
-                 mock.call('452bf850-e223-4035-9d13-eb0b0197228f',
-                           {'time': datetime.datetime(2015, 12, 1, 21, 00)})
-                 ]
-        self.event_update.assert_has_calls(calls)
+        self.event_update_all.assert_called_once_with(
+            self.lease_id,
+            {'start_lease': {'time': datetime.datetime(2015, 12, 1, 20, 00)},
+             'end_lease': {'time': datetime.datetime(2015, 12, 1, 22, 00)},
+             'before_end_lease': {
+                 'time': datetime.datetime(2015, 12, 1, 21, 00)}})
         self.lease_update.assert_called_once_with(self.lease_id, lease_values)
 
     def test_update_modify_reservations(self):
-        def fake_event_get(sort_key, sort_dir, filters):
-            if filters['event_type'] == 'start_lease':
-                return {'id': u'2eeb784a-2d84-4a89-a201-9d42d61eecb1'}
-            elif filters['event_type'] == 'end_lease':
-                return {'id': u'7085381b-45e0-4e5d-b24a-f965f5e6e5d7'}
-            elif filters['event_type'] == 'before_end_lease':
-                delta = datetime.timedelta(hours=1)
-                return {'id': u'452bf850-e223-4035-9d13-eb0b0197228f',
-                        'time': self.lease['end_date'] - delta,
-                        'status': 'UNDONE'}
+        self._set_lease_events(
+            before_end_time=(self.lease['end_date'] -
+                             datetime.timedelta(hours=1)))
 
         lease_values = {
             'reservations': [
@@ -684,8 +1213,6 @@ class ServiceTestCase(tests.TestCase):
                 'resource_type': 'virtual:instance',
             }
         ]
-        event_get = self.patch(db_api, 'event_get_first_sorted_by_filters')
-        event_get.side_effect = fake_event_get
         target = datetime.datetime(2013, 12, 15)
         with mock.patch.object(datetime,
                                'datetime',
@@ -702,14 +1229,12 @@ class ServiceTestCase(tests.TestCase):
                 'max': 3
             }
         )
-        calls = [mock.call('2eeb784a-2d84-4a89-a201-9d42d61eecb1',
-                           {'time': datetime.datetime(2013, 12, 20, 13, 00)}),
-                 mock.call('7085381b-45e0-4e5d-b24a-f965f5e6e5d7',
-                           {'time': datetime.datetime(2013, 12, 20, 15, 00)}),
-                 mock.call('452bf850-e223-4035-9d13-eb0b0197228f',
-                           {'time': datetime.datetime(2013, 12, 20, 14, 00)})
-                 ]
-        self.event_update.assert_has_calls(calls)
+        self.event_update_all.assert_called_once_with(
+            self.lease_id,
+            {'start_lease': {'time': datetime.datetime(2013, 12, 20, 13, 00)},
+             'end_lease': {'time': datetime.datetime(2013, 12, 20, 15, 00)},
+             'before_end_lease': {
+                 'time': datetime.datetime(2013, 12, 20, 14, 00)}})
         self.lease_update.assert_called_once_with(self.lease_id, lease_values)
 
     def test_update_modify_reservations_with_invalid_param(self):
@@ -766,13 +1291,7 @@ class ServiceTestCase(tests.TestCase):
                 self.lease_id, lease_values)
 
     def test_update_lease_started_modify_end_date_without_before_end(self):
-        def fake_event_get(sort_key, sort_dir, filters):
-            if filters['event_type'] == 'start_lease':
-                return {'id': u'2eeb784a-2d84-4a89-a201-9d42d61eecb1'}
-            elif filters['event_type'] == 'end_lease':
-                return {'id': u'7085381b-45e0-4e5d-b24a-f965f5e6e5d7'}
-            else:
-                return None
+        self._set_lease_events()
 
         lease_values = {
             'name': 'renamed',
@@ -788,8 +1307,6 @@ class ServiceTestCase(tests.TestCase):
                 'end_date': datetime.datetime(2013, 12, 20, 15, 00)
             }
         ]
-        event_get = self.patch(db_api, 'event_get_first_sorted_by_filters')
-        event_get.side_effect = fake_event_get
         target = datetime.datetime(2013, 12, 20, 14, 00)
         with mock.patch.object(datetime,
                                'datetime',
@@ -803,25 +1320,17 @@ class ServiceTestCase(tests.TestCase):
                 'end_date': datetime.datetime(2013, 12, 20, 16, 00)
             }
         )
-        calls = [mock.call('2eeb784a-2d84-4a89-a201-9d42d61eecb1',
-                           {'time': datetime.datetime(2013, 12, 20, 13, 00)}),
-                 mock.call('7085381b-45e0-4e5d-b24a-f965f5e6e5d7',
-                           {'time': datetime.datetime(2013, 12, 20, 16, 00)})
-                 ]
-        self.event_update.assert_has_calls(calls)
+        self.event_update_all.assert_called_once_with(
+            self.lease_id,
+            {'start_lease': {'time': datetime.datetime(2013, 12, 20, 13, 00)},
+             'end_lease': {'time': datetime.datetime(2013, 12, 20, 16, 00)}})
         self.lease_update.assert_called_once_with(self.lease_id, lease_values)
 
     def test_update_lease_started_modify_end_date_and_before_end(self):
-        def fake_event_get(sort_key, sort_dir, filters):
-            if filters['event_type'] == 'start_lease':
-                return {'id': u'2eeb784a-2d84-4a89-a201-9d42d61eecb1'}
-            elif filters['event_type'] == 'end_lease':
-                return {'id': u'7085381b-45e0-4e5d-b24a-f965f5e6e5d7'}
-            elif filters['event_type'] == 'before_end_lease':
-                delta = datetime.timedelta(hours=1)
-                return {'id': u'452bf850-e223-4035-9d13-eb0b0197228f',
-                        'time': self.lease['end_date'] - delta,
-                        'status': 'DONE'}
+        self._set_lease_events(
+            before_end_time=(self.lease['end_date'] -
+                             datetime.timedelta(hours=1)),
+            before_end_status='DONE')
 
         lease_values = {
             'name': 'renamed',
@@ -837,8 +1346,6 @@ class ServiceTestCase(tests.TestCase):
                 'end_date': datetime.datetime(2013, 12, 20, 15, 00)
             }
         ]
-        event_get = self.patch(db_api, 'event_get_first_sorted_by_filters')
-        event_get.side_effect = fake_event_get
         target = datetime.datetime(2013, 12, 20, 14, 00)
         with mock.patch.object(datetime,
                                'datetime',
@@ -852,39 +1359,31 @@ class ServiceTestCase(tests.TestCase):
                 'end_date': datetime.datetime(2013, 12, 20, 16, 00)
             }
         )
-        expected_context = self.trust_ctx.return_value
-        calls = [mock.call(expected_context.__enter__.return_value,
+        self.manager._notifications.flush()
+        expected_context = self.ctx.return_value
+        calls = [mock.call(expected_context,
                            notifier_api.format_lease_payload(self.lease),
                            'lease.update'),
-                 mock.call(expected_context.__enter__.return_value,
+                 mock.call(expected_context,
                            notifier_api.format_lease_payload(self.lease),
                            'lease.event.before_end_lease.stop'),
                  ]
         self.fake_notifier.assert_has_calls(calls)
 
-        calls = [mock.call('2eeb784a-2d84-4a89-a201-9d42d61eecb1',
-                           {'time': datetime.datetime(2013, 12, 20, 13, 00)}),
-                 mock.call('7085381b-45e0-4e5d-b24a-f965f5e6e5d7',
-                           {'time': datetime.datetime(2013, 12, 20, 16, 00)}),
-                 mock.call('452bf850-e223-4035-9d13-eb0b0197228f',
-                           {'time': datetime.datetime(2013, 12, 20, 15, 00),
-                            'status': 'UNDONE'})
-                 ]
-        self.event_update.assert_has_calls(calls)
+        self.event_update_all.assert_called_once_with(
+            self.lease_id,
+            {'start_lease': {'time': datetime.datetime(2013, 12, 20, 13, 00)},
+             'end_lease': {'time': datetime.datetime(2013, 12, 20, 16, 00)},
+             'before_end_lease': {
+                 'time': datetime.datetime(2013, 12, 20, 15, 00),
+                 'status': 'UNDONE'}})
         self.lease_update.assert_called_once_with(self.lease_id, lease_values)
 
     def test_update_lease_started_modify_before_end_with_param(self):
         before_end_date = '2013-12-20 14:00'
 
-        def fake_event_get(sort_key, sort_dir, filters):
-            if filters['event_type'] == 'start_lease':
-                return {'id': u'2eeb784a-2d84-4a89-a201-9d42d61eecb1'}
-            elif filters['event_type'] == 'end_lease':
-                return {'id': u'7085381b-45e0-4e5d-b24a-f965f5e6e5d7'}
-            elif filters['event_type'] == 'before_end_lease':
-                return {'id': u'452bf850-e223-4035-9d13-eb0b0197228f',
-                        'time': before_end_date,
-                        'status': 'DONE'}
+        self._set_lease_events(before_end_time=before_end_date,
+                               before_end_status='DONE')
 
         lease_values = {
             'name': 'renamed',
@@ -901,8 +1400,6 @@ class ServiceTestCase(tests.TestCase):
                 'end_date': datetime.datetime(2013, 12, 20, 15, 00)
             }
         ]
-        event_get = self.patch(db_api, 'event_get_first_sorted_by_filters')
-        event_get.side_effect = fake_event_get
         target = datetime.datetime(2013, 12, 20, 14, 00)
         with mock.patch.object(datetime,
                                'datetime',
@@ -916,27 +1413,25 @@ class ServiceTestCase(tests.TestCase):
                 'end_date': datetime.datetime(2013, 12, 20, 16, 00)
             }
         )
-        expected_context = self.trust_ctx.return_value
-        calls = [mock.call(expected_context.__enter__.return_value,
+        self.manager._notifications.flush()
+        expected_context = self.ctx.return_value
+        calls = [mock.call(expected_context,
                            notifier_api.format_lease_payload(self.lease),
                            'lease.update'),
-                 mock.call(expected_context.__enter__.return_value,
+                 mock.call(expected_context,
                            notifier_api.format_lease_payload(self.lease),
                            'lease.event.before_end_lease.stop'),
                  ]
         self.fake_notifier.assert_has_calls(calls)
 
-        calls = [mock.call('2eeb784a-2d84-4a89-a201-9d42d61eecb1',
-                           {'time': datetime.datetime(2013, 12, 20, 13, 00)}),
-                 mock.call('7085381b-45e0-4e5d-b24a-f965f5e6e5d7',
-                           {'time': datetime.datetime(2013, 12, 20, 16, 00)}),
-                 mock.call('452bf850-e223-4035-9d13-eb0b0197228f',
-                           {'time': datetime.datetime.strptime(
-                               before_end_date,
-                               service.LEASE_DATE_FORMAT),
-                            'status': 'UNDONE'})
-                 ]
-        self.event_update.assert_has_calls(calls)
+        self.event_update_all.assert_called_once_with(
+            self.lease_id,
+            {'start_lease': {'time': datetime.datetime(2013, 12, 20, 13, 00)},
+             'end_lease': {'time': datetime.datetime(2013, 12, 20, 16, 00)},
+             'before_end_lease': {
+                 'time': datetime.datetime.strptime(
+                     before_end_date, service.LEASE_DATE_FORMAT),
+                 'status': 'UNDONE'}})
         self.lease_update.assert_called_once_with(self.lease_id, lease_values)
 
     def test_update_lease_started_before_end_lower_date_than_start(self):
@@ -1123,8 +1618,7 @@ class ServiceTestCase(tests.TestCase):
                 self.lease_id, lease_values)
 
     def test_update_lease_start_date_event_not_found(self):
-        events = self.patch(self.db_api, 'event_get_first_sorted_by_filters')
-        events.return_value = None
+        self.lease['events'] = []
         lease_values = {
             'name': 'renamed',
             'start_date': '2013-12-15 20:00'
@@ -1135,15 +1629,9 @@ class ServiceTestCase(tests.TestCase):
                           lease_values)
 
     def test_update_lease_end_date_event_not_found(self):
-        def fake_event_get(sort_key, sort_dir, filters):
-            if filters['event_type'] == 'start_lease':
-                return {'id': u'2eeb784a-2d84-4a89-a201-9d42d61eecb1'}
-            else:
-                return None
-
-        events = self.patch(self.db_api, 'event_get_first_sorted_by_filters')
-        events.side_effect = fake_event_get
-        event_update = self.patch(self.db_api, 'event_update')
+        self.lease['events'] = [
+            {'id': u'2eeb784a-2d84-4a89-a201-9d42d61eecb1',
+             'event_type': 'start_lease'}]
         reservation_get_all = (
             self.patch(self.db_api, 'reservation_get_all_by_lease_id'))
         reservation_get_all.return_value = []
@@ -1161,9 +1649,36 @@ class ServiceTestCase(tests.TestCase):
                               self.manager.update_lease,
                               self.lease_id,
                               lease_values)
-        event_update.assert_called_once_with(
-            '2eeb784a-2d84-4a89-a201-9d42d61eecb1',
-            {'time': datetime.datetime(2013, 12, 20, 13, 0)})
+        self.event_update_all.assert_not_called()
+        self.lease_update.assert_not_called()
+
+    def test_update_lease_single_transaction(self):
+        self._set_lease_events()
+        self.patch(self.db_api,
+                   'reservation_get_all_by_lease_id').return_value = []
+        transaction = self.transaction.return_value
+        self.event_update_all.side_effect = (
+            lambda lease_id, values: self.assertTrue(
+                transaction.__enter__.called) or
+            [{'id': u'7085381b-45e0-4e5d-b24a-f965f5e6e5d7',
+              'event_type': 'end_lease',
+              'time': datetime.datetime(2013, 12, 20, 16, 00)}])
+        self.lease_update.side_effect = (
+            lambda lease_id, values: self.assertFalse(
+                transaction.__exit__.called))
+
+        target = datetime.datetime(2013, 12, 20, 14, 00)
+        with mock.patch.object(datetime,
+                               'datetime',
+                               mock.Mock(wraps=datetime.datetime)) as patched:
+            patched.utcnow.return_value = target
+            self.manager.update_lease(self.lease_id,
+                                      {'end_date': '2013-12-20 16:00'})
+
+        transaction.__exit__.assert_called_once_with(None, None, None)
+        self.event_update.assert_not_called()
+        self.assertEqual(datetime.datetime(2013, 12, 20, 16, 00),
+                         self.manager._timeline.next_deadline())
 
     def test_delete_lease_before_starting_date(self):
         fake_get_lease = self.patch(self.manager, 'get_lease')
@@ -1180,6 +1695,24 @@ class ServiceTestCase(tests.TestCase):
         self.lease_destroy.assert_called_once_with(self.lease_id)
         self.fake_plugin.on_end.assert_called_with('111')
 
+    def test_delete_lease_discards_timeline_events(self):
+        fake_get_lease = self.patch(self.manager, 'get_lease')
+        fake_get_lease.return_value = self.lease
+        self.manager._timeline.push('1', self.lease_id,
+                                    datetime.datetime(2013, 12, 20, 13, 00))
+        self.manager._timeline.push('2', 'other-lease',
+                                    datetime.datetime(2013, 12, 20, 14, 00))
+
+        target = datetime.datetime(2013, 12, 20, 12, 00)
+        with mock.patch.object(datetime,
+                               'datetime',
+                               mock.Mock(wraps=datetime.datetime)) as patched:
+            patched.utcnow.return_value = target
+            self.manager.delete_lease(self.lease_id)
+
+        self.assertEqual(datetime.datetime(2013, 12, 20, 14, 00),
+                         self.manager._timeline.next_deadline())
+
     def test_delete_lease_after_ending_date(self):
         self.lease['reservations'][0]['status'] = 'deleted'
         fake_get_lease = self.patch(self.manager, 'get_lease')
@@ -1192,10 +1725,11 @@ class ServiceTestCase(tests.TestCase):
             patched.utcnow.return_value = target
             self.manager.delete_lease(self.lease_id)
 
-        expected_context = self.trust_ctx.return_value
+        self.manager._notifications.flush()
+        expected_context = self.ctx.return_value
         self.lease_destroy.assert_called_once_with(self.lease_id)
         self.fake_notifier.assert_called_once_with(
-            expected_context.__enter__.return_value,
+            expected_context,
             self.notifier_api.format_lease_payload(self.lease),
             'lease.delete')
         self.fake_plugin.on_end.assert_not_called()
@@ -1257,6 +1791,16 @@ class ServiceTestCase(tests.TestCase):
         basic_action.assert_called_once_with(self.lease_id, '1', 'on_start',
                                              'active')
 
+    def test_start_lease_reads_primary(self):
+        read_primary = self.patch(self.db_api, 'read_primary').return_value
+        self.patch(self.manager, '_basic_action').side_effect = (
+            lambda *args: self.assertTrue(read_primary.__enter__.called) or
+            self.assertFalse(read_primary.__exit__.called))
+
+        self.manager.start_lease(self.lease_id, '1')
+
+        read_primary.__exit__.assert_called_once_with(None, None, None)
+
     def test_end_lease(self):
         basic_action = self.patch(self.manager, '_basic_action')
 
@@ -1327,6 +1871,60 @@ class ServiceTestCase(tests.TestCase):
             '111', {'status': 'error'})
         self.event_update.assert_called_once_with('1', {'status': 'ERROR'})
 
+    def test_basic_action_several_reservations(self):
+        def on_end(resource_id):
+            if resource_id == '222':
+                raise exceptions.BlazarException(resource_id)
+
+        self.manager.resource_actions = (
+            {'virtual:instance': {'on_end': on_end}})
+        self.lease['reservations'] = [
+            {'id': str(i), 'resource_id': str(i), 'resource_type':
+             'virtual:instance', 'status': 'active'}
+            for i in ('111', '222', '333')]
+        self.patch(self.manager, 'get_lease').return_value = self.lease
+
+        self.manager._basic_action(self.lease_id, '1', 'on_end',
+                                   reservation_status='deleted')
+
+        self.reservation_update.assert_has_calls(
+            [mock.call('111', {'status': 'deleted'}),
+             mock.call('222', {'status': 'error'}),
+             mock.call('333', {'status': 'deleted'})], any_order=True)
+        self.assertEqual(3, self.reservation_update.call_count)
+        self.event_update.assert_called_once_with('1', {'status': 'ERROR'})
+        self.assertEqual(
+            {'success': 2, 'failure': 1},
+            self.manager.metrics.action_outcomes['virtual:instance:on_end'])
+
+    def test_basic_action_concurrency(self):
+        self.cfg.CONF.set_override('max_concurrent_actions', 2,
+                                   group='manager')
+        self.addCleanup(self.cfg.CONF.clear_override, 'max_concurrent_actions',
+                        group='manager')
+        running = []
+        max_running = []
+
+        def on_start(resource_id):
+            running.append(resource_id)
+            max_running.append(len(running))
+            eventlet.sleep(0)
+            running.remove(resource_id)
+
+        self.manager.resource_actions = (
+            {'virtual:instance': {'on_start': on_start}})
+        self.lease['reservations'] = [
+            {'id': str(i), 'resource_id': str(i), 'resource_type':
+             'virtual:instance', 'status': 'pending'}
+            for i in range(5)]
+        self.patch(self.manager, 'get_lease').return_value = self.lease
+
+        self.manager._basic_action(self.lease_id, '1', 'on_start')
+
+        self.assertEqual(2, max(max_running))
+        self.assertEqual(5, len(max_running))
+        self.event_update.assert_called_once_with('1', {'status': 'DONE'})
+
     def test_getattr_with_correct_plugin_and_method(self):
         self.fake_list_computehosts = (
             self.patch(self.fake_phys_plugin, 'list_computehosts'))
@@ -1362,3 +1960,172 @@ class ServiceTestCase(tests.TestCase):
         self.manager.plugins = {'physical:host': None}
         self.assertRaises(AttributeError, getattr, self.manager,
                           'physical:host:method_not_present')
+
+
+class EventTimelineTestCase(tests.TestCase):
+    def setUp(self):
+        super(EventTimelineTestCase, self).setUp()
+        self.timeline = service.EventTimeline()
+        self.date = datetime.datetime(2013, 12, 20, 13, 00)
+
+    def _time(self, minutes):
+        return self.date + datetime.timedelta(minutes=minutes)
+
+    def test_empty(self):
+        self.assertEqual(0, len(self.timeline))
+        self.assertIsNone(self.timeline.next_deadline())
+        self.assertEqual([], self.timeline.pop_due(self._time(60)))
+
+    def test_push(self):
+        self.timeline.push('2', 'lease', self._time(20))
+        self.timeline.push('1', 'lease', self._time(10))
+        self.timeline.push('3', 'lease', self._time(30))
+
+        self.assertEqual(3, len(self.timeline))
+        self.assertEqual(self._time(10), self.timeline.next_deadline())
+
+    def test_push_earlier_event_wakes_up(self):
+        self.timeline.push('1', 'lease', self._time(10))
+        self.timeline.wait(lambda: 0)
+
+        self.timeline.push('2', 'lease', self._time(20))
+        self.assertFalse(self.timeline._changed.is_set())
+        self.timeline.push('3', 'lease', self._time(5))
+        self.assertTrue(self.timeline._changed.is_set())
+
+    def test_push_while_computing_timeout_wakes_up(self):
+        self.timeline.push('1', 'lease', self._time(10))
+
+        def timeout():
+            self.timeline.push('2', 'lease', self._time(5))
+            return 0
+
+        self.timeline.wait(timeout)
+
+        self.assertTrue(self.timeline._changed.is_set())
+
+    def test_push_moves_event(self):
+        self.timeline.push('1', 'lease', self._time(10))
+        self.timeline.push('2', 'lease', self._time(20))
+        self.timeline.push('1', 'lease', self._time(30))
+
+        self.assertEqual(2, len(self.timeline))
+        self.assertEqual(self._time(20), self.timeline.next_deadline())
+        self.assertEqual(['2'], self.timeline.pop_due(self._time(25)))
+        self.assertEqual(['1'], self.timeline.pop_due(self._time(35)))
+
+    def test_pop_due(self):
+        self.timeline.push('1', 'lease', self._time(10))
+        self.timeline.push('2', 'lease', self._time(20))
+        self.timeline.push('3', 'lease', self._time(30))
+
+        self.assertEqual(['1', '2'], self.timeline.pop_due(self._time(25)))
+        self.assertEqual([], self.timeline.pop_due(self._time(30)))
+        self.assertEqual(self._time(30), self.timeline.next_deadline())
+
+    def test_discard_lease(self):
+        self.timeline.push('1', 'lease1', self._time(10))
+        self.timeline.push('2', 'lease2', self._time(20))
+        self.timeline.push('3', 'lease1', self._time(30))
+
+        self.timeline.discard_lease('lease1')
+
+        self.assertEqual(1, len(self.timeline))
+        self.assertEqual(['2'], self.timeline.pop_due(self._time(60)))
+
+    def test_reset(self):
+        self.timeline.push('1', 'lease', self._time(10))
+
+        self.timeline.reset([{'id': '3', 'lease_id': 'lease',
+                              'time': self._time(30)},
+                             {'id': '2', 'lease_id': 'lease',
+                              'time': self._time(20)}])
+
+        self.assertEqual(2, len(self.timeline))
+        self.assertEqual(['2', '3'], self.timeline.pop_due(self._time(60)))
+
+
+class EventExecutorTestCase(tests.TestCase):
+    def setUp(self):
+        super(EventExecutorTestCase, self).setUp()
+        self.done = eventlet.event.Event()
+        self.ran = []
+
+    def _handler(self, name):
+        self.ran.append(name)
+        self.done.wait()
+
+    def _submit_all(self, executor, resource_types):
+        for i, types in enumerate(resource_types):
+            executor.submit(self._handler, types, i)
+        eventlet.sleep(0)
+
+    def _complete_all(self):
+        self.done.send()
+        for i in range(10):
+            eventlet.sleep(0)
+
+    def test_global_limit(self):
+        executor = service.EventExecutor(2)
+
+        self._submit_all(executor, [['virtual:instance']] * 5)
+
+        self.assertEqual(2, len(self.ran))
+        self.assertEqual({'queued': 3,
+                          'in_flight': 2,
+                          'in_flight_by_resource_type': {
+                              'virtual:instance': 2}},
+                         executor.stats())
+
+        self._complete_all()
+
+        self.assertEqual(list(range(5)), sorted(self.ran))
+        self.assertEqual({'queued': 0,
+                          'in_flight': 0,
+                          'in_flight_by_resource_type': {}},
+                         executor.stats())
+
+    def test_resource_type_limit(self):
+        executor = service.EventExecutor(10, {'physical:host': 1,
+                                              'virtual:instance': 0})
+
+        self._submit_all(executor, [['physical:host'],
+                                    ['physical:host'],
+                                    ['virtual:instance'],
+                                    ['virtual:instance'],
+                                    ['physical:host', 'virtual:instance']])
+
+        self.assertEqual([0, 2, 3], self.ran)
+        self.assertEqual(2, executor.stats()['queued'])
+
+        self._complete_all()
+
+        self.assertEqual(list(range(5)), sorted(self.ran))
+
+    def test_submit_all(self):
+        executor = service.EventExecutor(1)
+        handler = mock.Mock(side_effect=[None, Exception, None])
+
+        executor.submit_all([(handler, [], (i,)) for i in range(3)])
+
+        handler.assert_has_calls([mock.call(i) for i in range(3)])
+        self.assertEqual({'queued': 0,
+                          'in_flight': 0,
+                          'in_flight_by_resource_type': {}},
+                         executor.stats())
+
+    def test_submit_all_nothing(self):
+        executor = service.EventExecutor(1)
+
+        executor.submit_all([])
+
+    def test_handler_error(self):
+        executor = service.EventExecutor(1)
+        handler = mock.Mock(side_effect=Exception)
+
+        executor.submit(handler, [], 'arg')
+        self._submit_all(executor, [[]])
+
+        handler.assert_called_once_with('arg')
+        self.assertEqual([0], self.ran)
+        self._complete_all()
@@ -0,0 +1,112 @@
+# Copyright (c) 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+
+import mock
+from oslo_config import cfg
+
+from blazar import context
+from blazar.notification import api as notification_api
+from blazar import tests
+
+CONF = cfg.CONF
+
+
+class NotificationQueueTestCase(tests.TestCase):
+    def setUp(self):
+        super(NotificationQueueTestCase, self).setUp()
+
+        self.send = self.patch(notification_api, 'send_lease_notification')
+        self.ctx = self.patch(context, 'BlazarContext')
+        CONF.set_override('queue_size', 2, 'notifications')
+        self.addCleanup(CONF.clear_override, 'queue_size', 'notifications')
+
+        self.lease = {'id': 'lease1',
+                      'user_id': 'user1',
+                      'project_id': 'project1',
+                      'start_date': datetime.datetime(2013, 12, 20, 13, 00),
+                      'end_date': datetime.datetime(2013, 12, 20, 15, 00),
+                      'trust_id': 'trust1'}
+        self.payload = notification_api.format_lease_payload(self.lease)
+        self.queue = notification_api.NotificationQueue()
+
+    def _set_overflow_policy(self, policy):
+        CONF.set_override('overflow_policy', policy, 'notifications')
+        self.addCleanup(CONF.clear_override, 'overflow_policy',
+                        'notifications')
+
+    def test_put_and_flush(self):
+        self.queue.put(self.lease, 'create')
+        self.queue.put(self.lease, 'event.start_lease')
+
+        self.send.assert_not_called()
+        self.assertEqual(2, self.queue.stats()['depth'])
+
+        self.queue.flush()
+
+        self.ctx.assert_called_with(user_id='user1', project_id='project1')
+        self.send.assert_has_calls([
+            mock.call(self.ctx.return_value, self.payload, 'lease.create'),
+            mock.call(self.ctx.return_value, self.payload,
+                      'lease.event.start_lease')])
+        self.assertEqual({'queued': 2, 'sent': 2, 'failed': 0, 'dropped': 0,
+                          'batches': 1, 'depth': 0},
+                         self.queue.stats())
+
+    def test_batch_size(self):
+        CONF.set_override('batch_size', 1, 'notifications')
+        self.addCleanup(CONF.clear_override, 'batch_size', 'notifications')
+
+        self.queue.put(self.lease, 'create')
+        self.queue.put(self.lease, 'update')
+        self.queue.flush()
+
+        self.assertEqual(2, self.send.call_count)
+        self.assertEqual(2, self.queue.stats()['batches'])
+
+    def test_send_failure(self):
+        self.send.side_effect = [Exception, None]
+
+        self.queue.put(self.lease, 'create')
+        self.queue.put(self.lease, 'update')
+        self.queue.flush()
+
+        self.assertEqual(2, self.send.call_count)
+        stats = self.queue.stats()
+        self.assertEqual(1, stats['sent'])
+        self.assertEqual(1, stats['failed'])
+
+    def test_overflow_drop_oldest(self):
+        self._set_overflow_policy('drop_oldest')
+
+        for notification in ('create', 'update', 'delete'):
+            self.queue.put(self.lease, notification)
+        self.queue.flush()
+
+        self.assertEqual(['lease.update', 'lease.delete'],
+                         [c[0][2] for c in self.send.call_args_list])
+        self.assertEqual(1, self.queue.stats()['dropped'])
+
+    def test_overflow_drop_newest(self):
+        self._set_overflow_policy('drop_newest')
+
+        for notification in ('create', 'update', 'delete'):
+            self.queue.put(self.lease, notification)
+        self.queue.flush()
+
+        self.assertEqual(['lease.create', 'lease.update'],
+                         [c[0][2] for c in self.send.call_args_list])
+        self.assertEqual(1, self.queue.stats()['dropped'])
@@ -22,6 +22,7 @@ from blazar import context
 from blazar.db import api as db_api
 from blazar.db import utils as db_utils
 from blazar import exceptions
+from blazar.manager import allocation_index
 from blazar.manager import exceptions as mgr_exceptions
 from blazar.plugins.instances import instance_plugin
 from blazar.plugins import oshosts
@@ -33,6 +34,20 @@ class TestVirtualInstancePlugin(tests.TestCase):
 
     def setUp(self):
         super(TestVirtualInstancePlugin, self).setUp()
+        self.index = allocation_index.HostAllocationIndex()
+        self.index.loaded = True
+        self.patch(allocation_index, 'get_index').return_value = self.index
+
+    def _patch_reservations(self, get_reservations_by_host_id):
+        mock_get_reservations = self.patch(db_utils,
+                                           'get_reservations_by_host_id')
+        mock_get_reservations.side_effect = get_reservations_by_host_id
+        self.patch(db_utils, 'get_hosts_availability').side_effect = (
+            lambda host_ids, start, end, inclusive=False: dict(
+                (host_id, not get_reservations_by_host_id(host_id, start,
+                                                          end))
+                for host_id in host_ids))
+        return mock_get_reservations
 
     def get_input_values(self, vcpus, memory, disk, amount, affinity,
                          start, end, lease_id):
@@ -71,6 +86,7 @@ class TestVirtualInstancePlugin(tests.TestCase):
 
     def test_reserve_resource(self):
         plugin = instance_plugin.VirtualInstancePlugin()
+        self.set_context(mock.MagicMock())
         mock_pickup_hosts = self.patch(plugin, 'pickup_hosts')
         mock_pickup_hosts.return_value = ['host1', 'host2']
 
@@ -78,7 +94,7 @@ class TestVirtualInstancePlugin(tests.TestCase):
         fake_instance_reservation = {'id': 'instance-reservation-id1'}
         mock_inst_create.return_value = fake_instance_reservation
 
-        mock_alloc_create = self.patch(db_api, 'host_allocation_create')
+        mock_alloc_create = self.patch(db_api, 'host_allocation_create_bulk')
 
         mock_create_resources = self.patch(plugin, '_create_resources')
         mock_flavor = mock.MagicMock(id=1)
@@ -105,10 +121,11 @@ class TestVirtualInstancePlugin(tests.TestCase):
                                                   inputs['start_date'],
                                                   inputs['end_date'])
 
-        mock_alloc_create.assert_any_call({'compute_host_id': 'host1',
-                                           'reservation_id': 'res_id1'})
-        mock_alloc_create.assert_any_call({'compute_host_id': 'host2',
-                                           'reservation_id': 'res_id1'})
+        mock_alloc_create.assert_called_once_with(
+            [{'compute_host_id': 'host1', 'reservation_id': 'res_id1'},
+             {'compute_host_id': 'host2', 'reservation_id': 'res_id1'}])
+        self.assertTrue(self.index.is_allocated('host1'))
+        self.assertTrue(self.index.is_allocated('host2'))
         mock_create_resources.assert_called_once_with(
             fake_instance_reservation)
         mock_inst_update.assert_called_once_with('instance-reservation-id1',
@@ -116,6 +133,33 @@ class TestVirtualInstancePlugin(tests.TestCase):
                                                   'server_group_id': 2,
                                                   'aggregate_id': 3})
 
+    def test_reserve_resource_rollback_cleans_up_resources(self):
+        plugin = instance_plugin.VirtualInstancePlugin()
+        self.set_context(mock.MagicMock())
+        self.patch(plugin, 'pickup_hosts').return_value = ['host1']
+        self.patch(db_api, 'instance_reservation_create').return_value = {
+            'id': 'instance-reservation-id1'}
+        self.patch(db_api, 'host_allocation_create_bulk')
+        self.patch(plugin, '_create_resources').return_value = (
+            mock.MagicMock(id=1), mock.MagicMock(id=2), mock.MagicMock(id=3))
+        self.patch(db_api, 'instance_reservation_update')
+        rollback_callbacks = []
+        self.patch(db_api, 'after_rollback').side_effect = (
+            rollback_callbacks.append)
+        mock_cleanup_resources = self.patch(plugin, 'cleanup_resources')
+        inputs = self.get_input_values(2, 4018, 10, 1, False,
+                                       '2030-01-01 08:00', '2030-01-01 08:00',
+                                       'lease-1')
+
+        plugin.reserve_resource('res_id1', inputs)
+
+        mock_cleanup_resources.assert_not_called()
+        for callback in reversed(rollback_callbacks):
+            callback()
+        mock_cleanup_resources.assert_called_once_with(
+            {'reservation_id': 'res_id1', 'server_group_id': 2})
+        self.assertFalse(self.index.is_allocated('host1'))
+
     def test_error_with_affinity(self):
         plugin = instance_plugin.VirtualInstancePlugin()
         inputs = self.get_input_values(2, 4018, 10, 1, True,
@@ -144,10 +188,7 @@ class TestVirtualInstancePlugin(tests.TestCase):
                       self.generate_host_info('host-3', 4, 4096, 1000)]
         mock_host_get_query.return_value = hosts_list
 
-        mock_get_reservations = self.patch(db_utils,
-                                           'get_reservations_by_host_id')
-
-        mock_get_reservations.side_effect = fake_get_reservation_by_host
+        self._patch_reservations(fake_get_reservation_by_host)
         plugin.max_usages = fake_max_usages
         expected = ['host-2', 'host-3']
         ret = plugin.pickup_hosts(1, 1024, 20, 2,
@@ -169,10 +210,7 @@ class TestVirtualInstancePlugin(tests.TestCase):
                       self.generate_host_info('host-3', 4, 4096, 1000)]
         mock_host_get_query.return_value = hosts_list
 
-        mock_get_reservations = self.patch(db_utils,
-                                           'get_reservations_by_host_id')
-
-        mock_get_reservations.side_effect = fake_get_reservation_by_host
+        self._patch_reservations(fake_get_reservation_by_host)
 
         expected = ['host-1', 'host-2']
         ret = plugin.pickup_hosts(1, 1024, 20, 2,
@@ -202,10 +240,8 @@ class TestVirtualInstancePlugin(tests.TestCase):
                       self.generate_host_info('host-3', 4, 4096, 1000)]
         mock_host_get_query.return_value = hosts_list
 
-        mock_get_reservations = self.patch(db_utils,
-                                           'get_reservations_by_host_id')
-
-        mock_get_reservations.side_effect = fake_get_reservation_by_host
+        mock_get_reservations = self._patch_reservations(
+            fake_get_reservation_by_host)
 
         mock_max_usages = self.patch(plugin, 'max_usages')
         mock_max_usages.return_value = (0, 0, 0)
@@ -217,6 +253,10 @@ class TestVirtualInstancePlugin(tests.TestCase):
         self.assertEqual(expected, ret)
         expected_query = ['vcpus >= 1', 'memory_mb >= 1024', 'local_gb >= 20']
         mock_host_get_query.assert_called_once_with(expected_query)
+        self.assertEqual(
+            [mock.call('host-1', '2030-01-01 08:00', '2030-01-01 12:00'),
+             mock.call('host-3', '2030-01-01 08:00', '2030-01-01 12:00')],
+            mock_get_reservations.call_args_list)
 
     def test_pickup_host_from_less_hosts(self):
         def fake_get_reservation_by_host(host_id, start, end):
@@ -243,10 +283,7 @@ class TestVirtualInstancePlugin(tests.TestCase):
                       self.generate_host_info('host-3', 4, 4096, 1000)]
         mock_host_get_query.return_value = hosts_list
 
-        mock_get_reservations = self.patch(db_utils,
-                                           'get_reservations_by_host_id')
-
-        mock_get_reservations.side_effect = fake_get_reservation_by_host
+        self._patch_reservations(fake_get_reservation_by_host)
 
         mock_max_usages = self.patch(plugin, 'max_usages')
         mock_max_usages.return_value = (1, 1024, 100)
@@ -503,9 +540,14 @@ class TestVirtualInstancePlugin(tests.TestCase):
         mock_nova.servers.list.return_value = fake_servers
 
         mock_cleanup_resources = self.patch(plugin, 'cleanup_resources')
+        self.index.add('reservation-id1', ['host1'],
+                       datetime.datetime(2030, 1, 1, 8, 0),
+                       datetime.datetime(2030, 1, 1, 9, 0))
 
         plugin.on_end('resource-id1')
 
+        self.assertFalse(self.index.is_allocated('host1'))
+
         mock_nova.flavor_access.remove_tenant_access.assert_called_once_with(
             'reservation-id1', 'fake-project-id')
 
@@ -516,3 +558,46 @@ class TestVirtualInstancePlugin(tests.TestCase):
             fake.delete.assert_called_once()
         mock_cleanup_resources.assert_called_once_with(
             fake_instance_reservation)
+
+
+class FilterHostsByReservationTestCase(tests.DBTestCase):
+
+    def setUp(self):
+        super(FilterHostsByReservationTestCase, self).setUp()
+        self.plugin = instance_plugin.VirtualInstancePlugin()
+        self.host = {'id': 'host-1'}
+
+    def _create_lease(self, lease_id, resource_type, start, end):
+        db_api.lease_create({
+            'id': lease_id, 'name': lease_id, 'trust_id': 'trust',
+            'start_date': datetime.datetime(2030, 1, 1, start, 0),
+            'end_date': datetime.datetime(2030, 1, 1, end, 0),
+            'reservations': [{'id': lease_id, 'resource_id': lease_id,
+                              'resource_type': resource_type}],
+            'events': []})
+        db_api.host_allocation_create({'compute_host_id': self.host['id'],
+                                       'reservation_id': lease_id})
+
+    def _filter_hosts(self):
+        free, non_free = self.plugin.filter_hosts_by_reservation(
+            [self.host], datetime.datetime(2030, 1, 1, 10, 0),
+            datetime.datetime(2030, 1, 1, 12, 0))
+        return ([item['host']['id'] for item in free],
+                [item['host']['id'] for item in non_free])
+
+    def test_touching_host_lease(self):
+        # The leases ending when the period starts overlap it
+        self._create_lease('lease-1', oshosts.RESOURCE_TYPE, 8, 10)
+
+        self.assertEqual(([], []), self._filter_hosts())
+
+    def test_touching_host_lease_and_instance_lease(self):
+        self._create_lease('lease-1', oshosts.RESOURCE_TYPE, 8, 10)
+        self._create_lease('lease-2', instance_plugin.RESOURCE_TYPE, 11, 13)
+
+        self.assertEqual(([], []), self._filter_hosts())
+
+    def test_touching_instance_lease(self):
+        self._create_lease('lease-1', instance_plugin.RESOURCE_TYPE, 12, 13)
+
+        self.assertEqual(([], ['host-1']), self._filter_hosts())
@@ -24,6 +24,7 @@ from blazar import context
 from blazar.db import api as db_api
 from blazar.db import exceptions as db_exceptions
 from blazar.db import utils as db_utils
+from blazar.manager import allocation_index
 from blazar.manager import exceptions as manager_exceptions
 from blazar.manager import service
 from blazar.plugins import oshosts as plugin
@@ -113,6 +114,23 @@ class PhysicalHostPluginTestCase(tests.TestCase):
         self.db_api = db_api
         self.db_utils = db_utils
 
+        self.index = allocation_index.HostAllocationIndex()
+        self.index.loaded = True
+        self.patch(allocation_index, 'get_index').return_value = self.index
+        self.db_host_allocation_get_all_with_dates = self.patch(
+            self.db_api, 'host_allocation_get_all_with_dates')
+        self.db_host_allocation_get_all_with_dates.return_value = []
+        self.db_host_allocation_partition = self.patch(
+            self.db_api, 'host_allocation_partition')
+        self.db_host_allocation_partition.side_effect = (
+            lambda host_ids, start_date, end_date: (list(host_ids), {}))
+        self.get_hosts_availability = self.patch(self.db_utils,
+                                                 'get_hosts_availability')
+        self.get_hosts_availability.side_effect = (
+            lambda host_ids, start_date, end_date, reserved_periods=False:
+            dict((host_id, [] if reserved_periods else True)
+                 for host_id in host_ids))
+
         self.db_host_get = self.patch(self.db_api, 'host_get')
         self.db_host_get.return_value = self.fake_host
         self.db_host_list = self.patch(self.db_api, 'host_list')
@@ -347,9 +365,9 @@ class PhysicalHostPluginTestCase(tests.TestCase):
                                              'host_reservation_create')
         matching_hosts = self.patch(self.fake_phys_plugin, '_matching_hosts')
         matching_hosts.return_value = ['host1', 'host2']
-        host_allocation_create = self.patch(
+        host_allocation_create_bulk = self.patch(
             self.db_api,
-            'host_allocation_create')
+            'host_allocation_create_bulk')
         self.fake_phys_plugin.reserve_resource(
             u'441c1476-9f8f-4700-9f30-cd9b6fef3509',
             values)
@@ -363,17 +381,42 @@ class PhysicalHostPluginTestCase(tests.TestCase):
             'before_end': 'default'
         }
         host_reservation_create.assert_called_once_with(host_values)
-        calls = [
-            mock.call(
-                {'compute_host_id': 'host1',
-                 'reservation_id': u'441c1476-9f8f-4700-9f30-cd9b6fef3509',
-                 }),
-            mock.call(
-                {'compute_host_id': 'host2',
-                 'reservation_id': u'441c1476-9f8f-4700-9f30-cd9b6fef3509',
-                 }),
-        ]
-        host_allocation_create.assert_has_calls(calls)
+        host_allocation_create_bulk.assert_called_once_with([
+            {'compute_host_id': 'host1',
+             'reservation_id': u'441c1476-9f8f-4700-9f30-cd9b6fef3509'},
+            {'compute_host_id': 'host2',
+             'reservation_id': u'441c1476-9f8f-4700-9f30-cd9b6fef3509'},
+        ])
+
+    def test_create_reservation_rollback_deletes_aggregate(self):
+        values = {
+            'lease_id': u'018c1b43-e69e-4aef-a543-09681539cf4c',
+            'min': u'1',
+            'max': u'1',
+            'hypervisor_properties': '["=", "$memory_mb", "256"]',
+            'resource_properties': '',
+            'start_date': datetime.datetime(2013, 12, 19, 20, 00),
+            'end_date': datetime.datetime(2013, 12, 19, 21, 00),
+            'resource_type': plugin.RESOURCE_TYPE,
+        }
+        self.rp_create.return_value = mock.MagicMock(id=1)
+        self.patch(self.db_api, 'host_reservation_create')
+        self.patch(self.db_api, 'host_allocation_create_bulk')
+        matching_hosts = self.patch(self.fake_phys_plugin, '_matching_hosts')
+        matching_hosts.return_value = ['host1']
+        rollback_callbacks = []
+        self.patch(self.db_api, 'after_rollback').side_effect = (
+            rollback_callbacks.append)
+        pool_delete = self.patch(self.nova.ReservationPool, 'delete')
+
+        self.fake_phys_plugin.reserve_resource(
+            u'441c1476-9f8f-4700-9f30-cd9b6fef3509', values)
+
+        pool_delete.assert_not_called()
+        for callback in reversed(rollback_callbacks):
+            callback()
+        pool_delete.assert_called_once_with(1)
+        self.assertFalse(self.index.is_allocated('host1'))
 
     def test_create_reservation_with_missing_param_min(self):
         values = {
@@ -529,12 +572,9 @@ class PhysicalHostPluginTestCase(tests.TestCase):
         host_get_all_by_queries = self.patch(self.db_api,
                                              'host_get_all_by_queries')
         host_get_all_by_queries.return_value = [{'id': 'host1'}]
-        get_reserved_periods = self.patch(self.db_utils,
-                                          'get_reserved_periods')
-        get_reserved_periods.return_value = [
-            (datetime.datetime(2013, 12, 19, 20, 00),
-             datetime.datetime(2013, 12, 19, 21, 00))
-        ]
+        self.index.add('706eb3bc-07ed-4383-be93-b32845ece672', ['host1'],
+                       datetime.datetime(2013, 12, 19, 20, 00),
+                       datetime.datetime(2013, 12, 19, 21, 00))
         host_allocation_create = self.patch(
             self.db_api,
             'host_allocation_create')
@@ -548,6 +588,76 @@ class PhysicalHostPluginTestCase(tests.TestCase):
         host_allocation_create.assert_not_called()
         host_allocation_destroy.assert_not_called()
 
+    def test_update_reservation_extend_allocated_host(self):
+        values = {
+            'start_date': datetime.datetime(2013, 12, 19, 20, 00),
+            'end_date': datetime.datetime(2013, 12, 19, 21, 30)
+        }
+        reservation_get = self.patch(self.db_api, 'reservation_get')
+        reservation_get.return_value = {
+            'lease_id': u'10870923-6d56-45c9-b592-f788053f5baa',
+            'resource_id': u'91253650-cc34-4c4f-bbe8-c943aa7d0c9b',
+            'status': 'pending'
+        }
+        lease_get = self.patch(self.db_api, 'lease_get')
+        lease_get.return_value = {
+            'start_date': datetime.datetime(2013, 12, 19, 20, 00),
+            'end_date': datetime.datetime(2013, 12, 19, 21, 00)
+        }
+        host_reservation_get = self.patch(self.db_api, 'host_reservation_get')
+        host_reservation_get.return_value = {
+            'count_range': '1-1',
+            'hypervisor_properties': '["=", "$memory_mb", "256"]',
+            'resource_properties': ''
+        }
+        host_allocation_get_all = self.patch(
+            self.db_api,
+            'host_allocation_get_all_by_values')
+        host_allocation_get_all.return_value = [
+            {
+                'id': u'dd305477-4df8-4547-87f6-69069ee546a6',
+                'compute_host_id': 'host1'
+            }
+        ]
+        host_get_all_by_queries = self.patch(self.db_api,
+                                             'host_get_all_by_queries')
+        host_get_all_by_queries.return_value = [{'id': 'host1'},
+                                                {'id': 'host2'}]
+        # The allocation of host1 by another manager is missing from the
+        # index.
+        self._allocations_in_db([
+            {'compute_host_id': 'host1',
+             'reservation_id': '706eb3bc-07ed-4383-be93-b32845ece672',
+             'start_date': datetime.datetime(2013, 12, 19, 20, 00),
+             'end_date': datetime.datetime(2013, 12, 19, 21, 00)},
+            {'compute_host_id': 'host1',
+             'reservation_id': 'other-reservation',
+             'start_date': datetime.datetime(2013, 12, 19, 21, 15),
+             'end_date': datetime.datetime(2013, 12, 19, 22, 00)}])
+        self.index.add('706eb3bc-07ed-4383-be93-b32845ece672', ['host1'],
+                       datetime.datetime(2013, 12, 19, 20, 00),
+                       datetime.datetime(2013, 12, 19, 21, 00))
+        host_allocation_create = self.patch(
+            self.db_api,
+            'host_allocation_create')
+        host_allocation_destroy = self.patch(
+            self.db_api,
+            'host_allocation_destroy')
+
+        self.fake_phys_plugin.update_reservation(
+            '706eb3bc-07ed-4383-be93-b32845ece672',
+            values)
+
+        host_allocation_destroy.assert_called_once_with(
+            u'dd305477-4df8-4547-87f6-69069ee546a6')
+        host_allocation_create.assert_called_once_with(
+            {'compute_host_id': 'host2',
+             'reservation_id': '706eb3bc-07ed-4383-be93-b32845ece672'},
+            returning=False)
+        self.assertFalse(self.index.is_free(
+            'host1', datetime.datetime(2013, 12, 19, 21, 30),
+            datetime.datetime(2013, 12, 19, 21, 45)))
+
     def test_update_reservation_move_failure(self):
         values = {
             'start_date': datetime.datetime(2013, 12, 20, 20, 00),
@@ -584,12 +694,9 @@ class PhysicalHostPluginTestCase(tests.TestCase):
         host_get_all_by_queries = self.patch(self.db_api,
                                              'host_get_all_by_queries')
         host_get_all_by_queries.return_value = [{'id': 'host1'}]
-        get_reserved_periods = self.patch(self.db_utils,
-                                          'get_reserved_periods')
-        get_reserved_periods.return_value = [
-            (datetime.datetime(2013, 12, 20, 20, 30),
-             datetime.datetime(2013, 12, 20, 21, 00))
-        ]
+        self.index.add('other-reservation', ['host1'],
+                       datetime.datetime(2013, 12, 20, 20, 30),
+                       datetime.datetime(2013, 12, 20, 21, 00))
         get_computehosts = self.patch(self.nova.ReservationPool,
                                       'get_computehosts')
         get_computehosts.return_value = ['host1']
@@ -638,12 +745,9 @@ class PhysicalHostPluginTestCase(tests.TestCase):
         host_get_all_by_queries = self.patch(self.db_api,
                                              'host_get_all_by_queries')
         host_get_all_by_queries.return_value = [{'id': 'host1'}]
-        get_reserved_periods = self.patch(self.db_utils,
-                                          'get_reserved_periods')
-        get_reserved_periods.return_value = [
-            (datetime.datetime(2013, 12, 19, 20, 30),
-             datetime.datetime(2013, 12, 19, 21, 00))
-        ]
+        self.index.add('706eb3bc-07ed-4383-be93-b32845ece672', ['host1'],
+                       datetime.datetime(2013, 12, 19, 20, 00),
+                       datetime.datetime(2013, 12, 19, 21, 00))
         host_allocation_create = self.patch(
             self.db_api,
             'host_allocation_create')
@@ -701,12 +805,9 @@ class PhysicalHostPluginTestCase(tests.TestCase):
         host_allocation_destroy = self.patch(
             self.db_api,
             'host_allocation_destroy')
-        get_reserved_periods = self.patch(self.db_utils,
-                                          'get_reserved_periods')
-        get_reserved_periods.return_value = [
-            (datetime.datetime(2013, 12, 20, 20, 30),
-             datetime.datetime(2013, 12, 20, 21, 00))
-        ]
+        self.index.add('other-reservation', ['host1'],
+                       datetime.datetime(2013, 12, 20, 20, 30),
+                       datetime.datetime(2013, 12, 20, 21, 00))
         matching_hosts = self.patch(self.fake_phys_plugin, '_matching_hosts')
         matching_hosts.return_value = ['host2']
         self.fake_phys_plugin.update_reservation(
@@ -720,7 +821,8 @@ class PhysicalHostPluginTestCase(tests.TestCase):
             {
                 'compute_host_id': 'host2',
                 'reservation_id': '706eb3bc-07ed-4383-be93-b32845ece672'
-            }
+            },
+            returning=False
         )
 
     def test_update_reservation_min_increase_success(self):
@@ -792,7 +894,8 @@ class PhysicalHostPluginTestCase(tests.TestCase):
             {
                 'compute_host_id': 'host3',
                 'reservation_id': '706eb3bc-07ed-4383-be93-b32845ece672'
-            }
+            },
+            returning=False
         )
         host_reservation_update.assert_called_with(
             '91253650-cc34-4c4f-bbe8-c943aa7d0c9b',
@@ -987,7 +1090,8 @@ class PhysicalHostPluginTestCase(tests.TestCase):
             {
                 'compute_host_id': 'host3',
                 'reservation_id': '706eb3bc-07ed-4383-be93-b32845ece672'
-            }
+            },
+            returning=False
         )
         host_reservation_update.assert_called_with(
             '91253650-cc34-4c4f-bbe8-c943aa7d0c9b',
@@ -1177,7 +1281,8 @@ class PhysicalHostPluginTestCase(tests.TestCase):
             {
                 'compute_host_id': 'host2',
                 'reservation_id': '706eb3bc-07ed-4383-be93-b32845ece672'
-            }
+            },
+            returning=False
         )
         host_allocation_destroy.assert_called_with(
             'dd305477-4df8-4547-87f6-69069ee546a6'
@@ -1353,9 +1458,6 @@ class PhysicalHostPluginTestCase(tests.TestCase):
         delete_pool.assert_called_with(1)
 
     def test_matching_hosts_not_allocated_hosts(self):
-        def host_allocation_get_all_by_values(**kwargs):
-            if kwargs['compute_host_id'] == 'host1':
-                return True
         host_get = self.patch(
             self.db_api,
             'host_get_all_by_queries')
@@ -1364,17 +1466,9 @@ class PhysicalHostPluginTestCase(tests.TestCase):
             {'id': 'host2'},
             {'id': 'host3'},
         ]
-        host_get = self.patch(
-            self.db_api,
-            'host_allocation_get_all_by_values')
-        host_get.side_effect = host_allocation_get_all_by_values
-        host_get = self.patch(
-            self.db_utils,
-            'get_free_periods')
-        host_get.return_value = [
-            (datetime.datetime(2013, 12, 19, 20, 00),
-             datetime.datetime(2013, 12, 19, 21, 00)),
-        ]
+        self.index.add('other-reservation', ['host1'],
+                       datetime.datetime(2013, 12, 18, 20, 00),
+                       datetime.datetime(2013, 12, 18, 21, 00))
         result = self.fake_phys_plugin._matching_hosts(
             '[]', '[]', '1-3',
             datetime.datetime(2013, 12, 19, 20, 00),
@@ -1382,9 +1476,6 @@ class PhysicalHostPluginTestCase(tests.TestCase):
         self.assertEqual(['host2', 'host3'], result)
 
     def test_matching_hosts_allocated_hosts(self):
-        def host_allocation_get_all_by_values(**kwargs):
-            if kwargs['compute_host_id'] == 'host1':
-                return True
         host_get = self.patch(
             self.db_api,
             'host_get_all_by_queries')
@@ -1393,22 +1484,141 @@ class PhysicalHostPluginTestCase(tests.TestCase):
             {'id': 'host2'},
             {'id': 'host3'},
         ]
+        self.index.add('other-reservation', ['host1'],
+                       datetime.datetime(2013, 12, 19, 19, 00),
+                       datetime.datetime(2013, 12, 19, 20, 00))
+        result = self.fake_phys_plugin._matching_hosts(
+            '[]', '[]', '3-3',
+            datetime.datetime(2013, 12, 19, 20, 00),
+            datetime.datetime(2013, 12, 19, 21, 00))
+        self.assertEqual(['host1', 'host2', 'host3'], result)
+        self.get_hosts_availability.assert_called_once_with(
+            ['host1', 'host2', 'host3'],
+            datetime.datetime(2013, 12, 19, 20, 00),
+            datetime.datetime(2013, 12, 19, 21, 00))
+
+    def _allocations_in_db(self, allocations):
+        def get_all_with_dates(host_ids=None, start_date=None,
+                               end_date=None):
+            return [allocation for allocation in allocations
+                    if (host_ids is None or
+                        allocation['compute_host_id'] in host_ids) and
+                    (start_date is None or
+                     allocation['end_date'] > start_date) and
+                    (end_date is None or
+                     allocation['start_date'] < end_date)]
+
+        def get_hosts_availability(host_ids, start_date, end_date,
+                                   reserved_periods=False):
+            periods = dict((host_id, []) for host_id in host_ids)
+            for allocation in sorted(
+                    get_all_with_dates(host_ids, start_date, end_date),
+                    key=lambda allocation: allocation['start_date']):
+                host_periods = periods[allocation['compute_host_id']]
+                start = max(allocation['start_date'], start_date)
+                end = min(allocation['end_date'], end_date)
+                if host_periods and start <= host_periods[-1][1]:
+                    host_periods[-1] = (host_periods[-1][0],
+                                        max(end, host_periods[-1][1]))
+                else:
+                    host_periods.append((start, end))
+            if reserved_periods:
+                return periods
+            return dict((host_id, not host_periods)
+                        for host_id, host_periods in periods.items())
+
+        def host_allocation_partition(host_ids, start_date, end_date):
+            allocated = dict(
+                (allocation['compute_host_id'], []) for allocation
+                in get_all_with_dates(host_ids))
+            for allocation in get_all_with_dates(host_ids, start_date,
+                                                 end_date):
+                allocated[allocation['compute_host_id']].append(allocation)
+            return ([host_id for host_id in host_ids
+                     if host_id not in allocated], allocated)
+
+        self.db_host_allocation_get_all_with_dates.side_effect = (
+            get_all_with_dates)
+        self.get_hosts_availability.side_effect = get_hosts_availability
+        self.db_host_allocation_partition.side_effect = (
+            host_allocation_partition)
+
+    def test_matching_hosts_reserved_hosts(self):
         host_get = self.patch(
             self.db_api,
-            'host_allocation_get_all_by_values')
-        host_get.side_effect = host_allocation_get_all_by_values
+            'host_get_all_by_queries')
+        host_get.return_value = [
+            {'id': 'host1'},
+            {'id': 'host2'},
+        ]
+        self._allocations_in_db([
+            {'compute_host_id': 'host1',
+             'reservation_id': 'other-reservation',
+             'start_date': datetime.datetime(2013, 12, 19, 20, 30),
+             'end_date': datetime.datetime(2013, 12, 19, 22, 00)}])
+        self.index.load()
+        self.db_host_allocation_get_all_with_dates.reset_mock()
+        result = self.fake_phys_plugin._matching_hosts(
+            '[]', '[]', '2-2',
+            datetime.datetime(2013, 12, 19, 20, 00),
+            datetime.datetime(2013, 12, 19, 21, 00))
+        self.assertEqual([], result)
+        self.get_hosts_availability.assert_not_called()
+        self.db_host_allocation_get_all_with_dates.assert_not_called()
+        self.db_host_allocation_partition.assert_called_once_with(
+            ['host1', 'host2'], datetime.datetime(2013, 12, 19, 20, 00),
+            datetime.datetime(2013, 12, 19, 21, 00))
+
+    def test_matching_hosts_refreshes_index(self):
+        host_get = self.patch(
+            self.db_api,
+            'host_get_all_by_queries')
+        host_get.return_value = [
+            {'id': 'host1'},
+            {'id': 'host2'},
+        ]
+        self._allocations_in_db([
+            {'compute_host_id': 'host1',
+             'reservation_id': 'other-reservation',
+             'start_date': datetime.datetime(2013, 12, 19, 20, 30),
+             'end_date': datetime.datetime(2013, 12, 19, 22, 00)}])
+        result = self.fake_phys_plugin._matching_hosts(
+            '[]', '[]', '1-1',
+            datetime.datetime(2013, 12, 19, 20, 00),
+            datetime.datetime(2013, 12, 19, 21, 00))
+        self.assertEqual(['host2'], result)
+        self.assertFalse(self.index.is_free(
+            'host1', datetime.datetime(2013, 12, 19, 20, 00),
+            datetime.datetime(2013, 12, 19, 21, 00)))
+        self.db_host_allocation_get_all_with_dates.assert_called_once_with(
+            host_ids=set(['host1']))
+        self.db_host_allocation_partition.assert_called_once_with(
+            ['host1', 'host2'], datetime.datetime(2013, 12, 19, 20, 00),
+            datetime.datetime(2013, 12, 19, 21, 00))
+
+    def test_matching_hosts_allocated_hosts_from_db(self):
         host_get = self.patch(
-            self.db_utils,
-            'get_free_periods')
+            self.db_api,
+            'host_get_all_by_queries')
         host_get.return_value = [
-            (datetime.datetime(2013, 12, 19, 20, 00),
-             datetime.datetime(2013, 12, 19, 21, 00)),
+            {'id': 'host1'},
+            {'id': 'host2'},
+            {'id': 'host3'},
         ]
+        self._allocations_in_db([
+            {'compute_host_id': 'host1',
+             'reservation_id': 'other-reservation',
+             'start_date': datetime.datetime(2013, 12, 19, 18, 00),
+             'end_date': datetime.datetime(2013, 12, 19, 20, 00)},
+            {'compute_host_id': 'host2',
+             'reservation_id': 'other-reservation',
+             'start_date': datetime.datetime(2013, 12, 19, 20, 30),
+             'end_date': datetime.datetime(2013, 12, 19, 22, 00)}])
         result = self.fake_phys_plugin._matching_hosts(
-            '[]', '[]', '3-3',
+            '[]', '[]', '2-3',
             datetime.datetime(2013, 12, 19, 20, 00),
             datetime.datetime(2013, 12, 19, 21, 00))
-        self.assertEqual(['host1', 'host2', 'host3'], result)
+        self.assertEqual(['host1', 'host3'], result)
 
     def test_matching_hosts_not_matching(self):
         host_get = self.patch(
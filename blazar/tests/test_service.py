@@ -12,6 +12,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from blazar import context
+from blazar.db import api as db_api
 from blazar import tests
 from blazar.utils import service
 
@@ -19,3 +21,23 @@ from blazar.utils import service
 class ServiceTestCase(tests.TestCase):
     def test_prepare_service(self):
         service.prepare_service()
+
+
+class ContextEndpointHandlerTestCase(tests.TestCase):
+    def test_run_method_in_unit_of_work(self):
+        unit_of_work = self.patch(db_api, 'unit_of_work').return_value
+        calls = []
+
+        class Endpoint(object):
+            def method(self, value):
+                calls.append((unit_of_work.__enter__.called,
+                              unit_of_work.__exit__.called))
+                return value, context.current().user_id
+
+        handler = service.ContextEndpointHandler(Endpoint(), None)
+
+        result = handler.method({'user_id': 'user'}, value=42)
+
+        self.assertEqual((42, 'user'), result)
+        self.assertEqual([(True, False)], calls)
+        unit_of_work.__exit__.assert_called_once_with(None, None, None)
@@ -0,0 +1,37 @@
+# Copyright (c) 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from blazar import exceptions
+from blazar import tests
+from blazar.utils import leases as leases_utils
+
+
+class LeaseFieldsTestCase(tests.TestCase):
+
+    def test_all_fields(self):
+        self.assertIsNone(leases_utils.lease_fields())
+        self.assertIsNone(leases_utils.lease_fields(detail='true'))
+
+    def test_fields(self):
+        self.assertEqual(['name', 'start_date'],
+                         leases_utils.lease_fields('name,start_date', 'true'))
+
+    def test_without_detail(self):
+        self.assertEqual(list(leases_utils.LEASE_FIELDS),
+                         leases_utils.lease_fields(detail='false'))
+
+    def test_invalid_detail(self):
+        self.assertRaises(exceptions.InvalidInput,
+                          leases_utils.lease_fields, detail='maybe')
@@ -0,0 +1,42 @@
+# Copyright (c) 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from oslo_utils import strutils
+
+from blazar import exceptions
+
+# Fields of a lease which can be loaded without its reservations and events
+LEASE_FIELDS = ('id', 'name', 'user_id', 'project_id', 'start_date',
+                'end_date', 'trust_id', 'action', 'status', 'status_reason',
+                'created_at', 'updated_at')
+
+
+def lease_fields(fields=None, detail=None):
+    """Return the fields of the leases to load, None meaning all of them.
+
+    :param fields: comma separated fields of the leases to return.
+    :param detail: whether to return the reservations and events, as a
+        boolean string. Ignored if fields are given.
+    """
+    if fields:
+        return fields.split(',')
+    if detail is not None:
+        try:
+            detail = strutils.bool_from_string(detail, strict=True)
+        except ValueError:
+            raise exceptions.InvalidInput(cls='boolean', value=detail)
+        if not detail:
+            return list(LEASE_FIELDS)
+    return None
@@ -23,6 +23,7 @@ import oslo_messaging as messaging
 from oslo_service import service
 
 from blazar import context
+from blazar.db import api as db_api
 from blazar.i18n import _
 
 LOG = logging.getLogger(__name__)
@@ -73,9 +74,13 @@ class ContextEndpointHandler(object):
         try:
             method = getattr(self.__endpoint, name)
 
+            # NOTE: the DB calls of an RPC call share a session and the
+            # connection it checked out, instead of getting a new session
+            # and connection for every call.
             def run_method(__ctx, **kwargs):
                 with context.BlazarContext(**__ctx):
-                    return method(**kwargs)
+                    with db_api.unit_of_work():
+                        return method(**kwargs)
 
             return run_method
         except AttributeError:
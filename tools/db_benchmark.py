@@ -0,0 +1,229 @@
+# Copyright (c) 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of the lookups of the Blazar DB, without and with its indexes.
+
+The Blazar tables are created in the given database, filled with synthetic
+leases, and the lookups Blazar does the most are run first without the
+secondary indexes of the tables, then with them. The query plan and the
+mean duration of every lookup are printed for both runs. The tables are
+dropped at the end, so use a scratch database:
+
+    python tools/db_benchmark.py --connection mysql+pymysql://u:p@host/bench
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import random
+import time
+import uuid
+
+import sqlalchemy as sa
+
+from blazar.db.sqlalchemy import models
+
+NOW = datetime.datetime(2030, 1, 1)
+
+# Lookups as (description, SQL, parameters)
+QUERIES = (
+    ('Events to run',
+     'SELECT * FROM events WHERE status = :status AND time <= :time '
+     'ORDER BY time',
+     {'status': 'UNDONE', 'time': NOW}),
+    ('Events of a lease by type',
+     'SELECT * FROM events WHERE lease_id = :lease_id '
+     'AND event_type = :event_type',
+     {'lease_id': 'lease-42', 'event_type': 'end_lease'}),
+    ('Reservations of a lease',
+     'SELECT * FROM reservations WHERE lease_id = :lease_id',
+     {'lease_id': 'lease-42'}),
+    ('Allocations of a host',
+     'SELECT * FROM computehost_allocations '
+     'WHERE compute_host_id = :host_id',
+     {'host_id': 'host-42'}),
+    ('Allocations of a reservation',
+     'SELECT * FROM computehost_allocations '
+     'WHERE reservation_id = :reservation_id',
+     {'reservation_id': 'reservation-42'}),
+    ('Host reservation of a reservation',
+     'SELECT * FROM computehost_reservations '
+     'WHERE reservation_id = :reservation_id',
+     {'reservation_id': 'reservation-42'}),
+    ('Instance reservation of a reservation',
+     'SELECT * FROM instance_reservations '
+     'WHERE reservation_id = :reservation_id',
+     {'reservation_id': 'reservation-42'}),
+    ('Leases of a project',
+     'SELECT * FROM leases WHERE project_id = :project_id',
+     {'project_id': 'project-42'}),
+    ('Leases overlapping a period',
+     'SELECT * FROM leases WHERE start_date < :end_date '
+     'AND end_date > :start_date',
+     {'start_date': NOW, 'end_date': NOW + datetime.timedelta(hours=1)}),
+    ('Extra capability of a host',
+     'SELECT * FROM computehost_extra_capabilities '
+     'WHERE computehost_id = :host_id AND capability_name = :name',
+     {'host_id': 'host-42', 'name': 'capability-3'}),
+    ('Hosts by range of a numeric extra capability',
+     'SELECT computehost_id FROM computehost_extra_capabilities '
+     'WHERE capability_name = :name AND numeric_value >= :value',
+     {'name': 'capability-3', 'value': 99}),
+)
+
+EXPLAIN = {'sqlite': 'EXPLAIN QUERY PLAN ', 'mysql': 'EXPLAIN ',
+           'postgresql': 'EXPLAIN '}
+
+
+def _insert(engine, table, rows, chunk_size=5000):
+    for i in range(0, len(rows), chunk_size):
+        engine.execute(table.insert(), rows[i:i + chunk_size])
+
+
+def populate(engine, hosts, leases, allocated_hosts=None):
+    """Fills the tables with hosts and leases of one host each.
+
+    The leases are spread over the first allocated_hosts hosts, all the
+    hosts by default.
+    """
+    tables = models.Lease.metadata.tables
+    _insert(engine, tables['computehosts'], [
+        {'id': 'host-%d' % i, 'hypervisor_hostname': 'host%d' % i,
+         'vcpus': 8, 'cpu_info': '', 'hypervisor_type': 'QEMU',
+         'hypervisor_version': 1, 'memory_mb': 8192, 'local_gb': 100,
+         'trust_id': 'trust'}
+        for i in range(hosts)])
+    _insert(engine, tables['computehost_extra_capabilities'], [
+        {'id': str(uuid.uuid4()), 'computehost_id': 'host-%d' % i,
+         'capability_name': 'capability-%d' % j,
+         'capability_value': str(i % 100), 'numeric_value': i % 100}
+        for i in range(hosts) for j in range(5)])
+
+    lease_rows, reservation_rows, event_rows = [], [], []
+    host_reservation_rows, allocation_rows = [], []
+    for i in range(leases):
+        # Two thirds of the leases are finished, the others are spread over
+        # the next months.
+        start = NOW + datetime.timedelta(
+            hours=random.randint(-24 * 365, 24 * 180))
+        end = start + datetime.timedelta(hours=random.randint(1, 24 * 7))
+        lease_id, reservation_id = 'lease-%d' % i, 'reservation-%d' % i
+        lease_rows.append({'id': lease_id, 'name': lease_id,
+                           'user_id': 'user', 'start_date': start,
+                           'end_date': end,
+                           'project_id': 'project-%d' % (i % 100),
+                           'status': 'ACTIVE'})
+        reservation_rows.append({'id': reservation_id, 'lease_id': lease_id,
+                                 'resource_id': reservation_id,
+                                 'resource_type': 'physical:host',
+                                 'status': 'active'})
+        host_reservation_rows.append({'id': str(uuid.uuid4()),
+                                      'reservation_id': reservation_id,
+                                      'count_range': '1-1'})
+        allocation_rows.append({'id': str(uuid.uuid4()),
+                                'compute_host_id': 'host-%d' % (
+                                    i % (allocated_hosts or hosts)),
+                                'reservation_id': reservation_id})
+        for event_type, event_time in (('start_lease', start),
+                                       ('before_end_lease', end),
+                                       ('end_lease', end)):
+            event_rows.append({'id': str(uuid.uuid4()), 'lease_id': lease_id,
+                               'event_type': event_type, 'time': event_time,
+                               'status': ('DONE' if event_time < NOW
+                                          else 'UNDONE')})
+    _insert(engine, tables['leases'], lease_rows)
+    _insert(engine, tables['reservations'], reservation_rows)
+    _insert(engine, tables['computehost_reservations'], host_reservation_rows)
+    _insert(engine, tables['computehost_allocations'], allocation_rows)
+    _insert(engine, tables['events'], event_rows)
+
+
+def _indexes(engine):
+    """Returns the secondary indexes missing before the indexes migration.
+
+    MySQL already indexed the foreign key columns before that migration.
+    """
+    indexes = []
+    for table in models.Lease.metadata.sorted_tables:
+        for index in table.indexes:
+            if engine.name == 'mysql' and list(index.columns)[0].foreign_keys:
+                continue
+            indexes.append(index)
+    return indexes
+
+
+def run_queries(engine, repeat):
+    """Returns the plan and mean duration in ms of every lookup."""
+    results = []
+    explain = EXPLAIN.get(engine.name)
+    for description, sql, params in QUERIES:
+        plan = None
+        if explain:
+            plan = [' '.join(str(value) for value in row)
+                    for row in engine.execute(sa.text(explain + sql),
+                                              params)]
+        start = time.time()
+        for _i in range(repeat):
+            engine.execute(sa.text(sql), params).fetchall()
+        results.append((description, plan,
+                        (time.time() - start) * 1000.0 / repeat))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--connection', default='sqlite://',
+                        help='SQLAlchemy URL of a scratch database')
+    parser.add_argument('--hosts', type=int, default=500)
+    parser.add_argument('--leases', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='Number of runs of every lookup')
+    args = parser.parse_args()
+
+    engine = sa.create_engine(args.connection)
+    metadata = models.Lease.metadata
+    metadata.create_all(engine)
+    try:
+        indexes = _indexes(engine)
+        for index in indexes:
+            index.drop(engine)
+        random.seed(0)
+        populate(engine, args.hosts, args.leases)
+
+        before = run_queries(engine, args.repeat)
+        for index in indexes:
+            index.create(engine)
+        if engine.name == 'mysql':
+            for table in metadata.sorted_tables:
+                engine.execute('ANALYZE TABLE %s' % table.name)
+        elif engine.name in ('sqlite', 'postgresql'):
+            engine.execute('ANALYZE')
+        after = run_queries(engine, args.repeat)
+
+        for (description, plan, ms), (_d, new_plan, new_ms) in zip(
+                before, after):
+            print('%s: %.2f ms without indexes, %.2f ms with indexes'
+                  % (description, ms, new_ms))
+            for line in plan or []:
+                print('    without: %s' % line)
+            for line in new_plan or []:
+                print('    with:    %s' % line)
+    finally:
+        metadata.drop_all(engine)
+
+
+if __name__ == '__main__':
+    main()
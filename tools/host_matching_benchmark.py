@@ -0,0 +1,130 @@
+# Copyright (c) 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of the partition of the matching hosts by their allocations.
+
+The Blazar tables are created in the given database and filled with
+synthetic hosts and leases, as by db_benchmark.py, half of the hosts never
+being allocated. All the hosts are then partitioned into the hosts never
+allocated and the allocated hosts free for a period, first with the queries
+of every host the host plugin used to run, then with the partition query.
+The tables are dropped at the end, so use a scratch database:
+
+    python tools/host_matching_benchmark.py --hosts 1000 5000 10000
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from oslo_config import cfg
+
+from blazar.db import api as db_api
+from blazar.db.sqlalchemy import facade_wrapper
+from blazar.db.sqlalchemy import models
+from blazar.db import utils as db_utils
+import db_benchmark
+
+START_DATE = db_benchmark.NOW
+END_DATE = START_DATE + datetime.timedelta(days=1)
+
+
+def per_host_path(host_ids):
+    not_allocated, allocated = [], []
+    for host_id in host_ids:
+        if not db_api.host_allocation_get_all_by_values(
+                compute_host_id=host_id):
+            not_allocated.append(host_id)
+        elif db_utils.get_free_periods(
+                host_id, START_DATE, END_DATE,
+                END_DATE - START_DATE) == [(START_DATE, END_DATE)]:
+            allocated.append(host_id)
+    return not_allocated, allocated
+
+
+def partition_path(host_ids):
+    not_allocated, allocations = db_api.host_allocation_partition(
+        host_ids, START_DATE, END_DATE)
+    return not_allocated, [host_id for host_id in host_ids
+                           if host_id in allocations and
+                           not allocations[host_id]]
+
+
+def _best_time(func, repeat, *args):
+    best = None
+    for _i in range(repeat):
+        start = time.time()
+        result = func(*args)
+        duration = time.time() - start
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--connection',
+                        help='SQLAlchemy URL of a scratch database, a '
+                             'temporary SQLite database by default')
+    parser.add_argument('--hosts', type=int, nargs='+',
+                        default=[1000, 5000, 10000])
+    parser.add_argument('--leases-per-host', type=int, default=10,
+                        help='Number of leases of every allocated host')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of every path, the best is '
+                             'kept')
+    args = parser.parse_args()
+
+    path = None
+    connection = args.connection
+    if connection is None:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///' + path
+    cfg.CONF([], project='blazar')
+    cfg.CONF.set_override('connection', connection, group='database')
+    engine = db_api.get_instance().get_engine()
+    metadata = models.Lease.metadata
+    try:
+        for hosts in args.hosts:
+            metadata.create_all(engine)
+            try:
+                db_benchmark.populate(engine, hosts,
+                                      hosts // 2 * args.leases_per_host,
+                                      allocated_hosts=hosts // 2)
+                host_ids = ['host-%d' % i for i in range(hosts)]
+                per_host, result = _best_time(per_host_path, args.repeat,
+                                              host_ids)
+                partition, new_result = _best_time(partition_path,
+                                                   args.repeat, host_ids)
+                assert result == new_result
+                print('%d hosts, %d never allocated, %d free: %.2f s with '
+                      'queries by host, %.3f s with the partition query, '
+                      '%.1fx faster' % (hosts, len(result[0]),
+                                        len(result[1]), per_host, partition,
+                                        per_host / partition))
+            finally:
+                facade_wrapper.get_session().close()
+                metadata.drop_all(engine)
+    finally:
+        if path:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# Copyright (c) 2018 OpenStack Foundation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark of the ORM and dict read paths of the leases.
+
+The Blazar tables are created in the given database and filled with
+synthetic leases, as by db_benchmark.py. All the leases are then listed as
+dicts, first by serializing the models loaded by the ORM, then by reading
+them straight into dicts. The tables are dropped at the end, so use a
+scratch database:
+
+    python tools/lease_read_benchmark.py --leases 10000 100000
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import tempfile
+import time
+
+from oslo_config import cfg
+
+from blazar.db import api as db_api
+from blazar.db.sqlalchemy import api as sqlalchemy_api
+from blazar.db.sqlalchemy import facade_wrapper
+from blazar.db.sqlalchemy import models
+import db_benchmark
+
+
+def orm_path():
+    return [lease.to_dict() for lease in sqlalchemy_api.lease_list()]
+
+
+def dict_path():
+    return sqlalchemy_api.lease_list_as_dicts()
+
+
+def _best_time(func, repeat):
+    best = None
+    for _i in range(repeat):
+        start = time.time()
+        result = func()
+        duration = time.time() - start
+        best = duration if best is None else min(best, duration)
+    return best, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--connection',
+                        help='SQLAlchemy URL of a scratch database, a '
+                             'temporary SQLite database by default')
+    parser.add_argument('--hosts', type=int, default=500)
+    parser.add_argument('--leases', type=int, nargs='+',
+                        default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of every path, the best is '
+                             'kept')
+    args = parser.parse_args()
+
+    path = None
+    connection = args.connection
+    if connection is None:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///' + path
+    cfg.CONF([], project='blazar')
+    cfg.CONF.set_override('connection', connection, group='database')
+    engine = db_api.get_instance().get_engine()
+    metadata = models.Lease.metadata
+    try:
+        for leases in args.leases:
+            metadata.create_all(engine)
+            try:
+                db_benchmark.populate(engine, args.hosts, leases)
+                orm, count = _best_time(orm_path, args.repeat)
+                core, _count = _best_time(dict_path, args.repeat)
+                print('%d leases: %.2f s with the ORM, %.2f s as dicts, '
+                      '%.1fx faster' % (count, orm, core, orm / core))
+            finally:
+                facade_wrapper.get_session().close()
+                metadata.drop_all(engine)
+    finally:
+        if path:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()